@@ -3,7 +3,6 @@ import os
 import requests
 import subprocess
 import pandas as pd
-import sqlite3
 import json
 import time
 import traceback
@@ -13,7 +12,6 @@ from dotenv import load_dotenv
 from typing import List
 import google.generativeai as genai
 from sqlalchemy import func
-from openai import OpenAI
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.triggers.cron import CronTrigger
@@ -24,20 +22,119 @@ import atexit
 import re
 import signal
 import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, urlencode, parse_qsl
+from bs4 import BeautifulSoup
+import hashlib
+import base64
+import binascii
+import db
+import llm_gateway
+import page_fetcher
+import script_cache
+import script_runner
+import script_validation
+import schedule_jobs
+from script_queue import ScriptRunQueue
+from single_flight import SingleFlight
+from event_bus import EventBus
+from run_output import RunOutputRegistry
+from data_utils import parse_data, dedupe_rows, normalize_and_dedupe
 
 app = Flask(__name__)
 load_dotenv()
 
+# 開發伺服器設定（python app.py、flask run --debug 會設定 FLASK_DEBUG）；reloader 預設隨 debug 啟用
+APP_DEBUG = os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true', 'yes')
+APP_USE_RELOADER = os.getenv('FLASK_USE_RELOADER', str(APP_DEBUG)).lower() in ('1', 'true', 'yes')
+
+def is_reloader_parent():
+    """使用 reloader 時的父行程只監看檔案並重新啟動子行程（WERKZEUG_RUN_MAIN=true），不處理請求"""
+    return APP_USE_RELOADER and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
 # 設置 Gemini API
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-pro')
+# 產生腳本的語言模型呼叫經由 llm_gateway
+atexit.register(llm_gateway.gateway.close)
+atexit.register(script_cache.script_cache.close)
+
+def script_digest(content):
+    """腳本內容的 SHA-256 與位元組數，用於列表摘要與 ETag"""
+    data = (content or '').encode('utf-8')
+    return hashlib.sha256(data).hexdigest(), len(data)
+
+def backfill_script_digests(c, table, content_column, batch_size=500):
+    """為舊資料補上 script_hash 與 script_size"""
+    last_id = 0
+    while True:
+        c.execute(f'''
+            SELECT id, {content_column} FROM {table}
+            WHERE script_hash IS NULL AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size))
+        rows = c.fetchall()
+        if not rows:
+            break
+        c.executemany(
+            f'UPDATE {table} SET script_hash = ?, script_size = ? WHERE id = ?',
+            [script_digest(content) + (row_id,) for row_id, content in rows]
+        )
+        last_id = rows[-1][0]
+
+WEEKDAY_NAMES = ['週日', '週一', '週二', '週三', '週四', '週五', '週六']
+
+def format_schedule_display(schedule_time, frequency, selected_days=None):
+    """
+    產生排程列表顯示的時間與頻率描述，例如 "2025-01-17 09:00:00 (單次執行)"、"09:00:00 (每週一,週三執行)"
+    在寫入排程時產生並存入 schedule_display；selected_days 可為列表或 JSON 字串
+    """
+    schedule_time = str(schedule_time or '')
+    try:
+        if isinstance(selected_days, str):
+            selected_days = json.loads(selected_days) if selected_days.strip() else []
+        selected_days = selected_days or []
+
+        # 先移除所有現有的描述文字
+        clean_time = re.sub(r'\([^)]*\)', '', schedule_time).strip()
+
+        # 統一時間格式處理；只有時間的排程（每日、每週、每月）不加日期
+        formatted_time = schedule_time
+        if ':' in clean_time:
+            date_match = re.search(r'(\d{4}[-/]\d{2}[-/]\d{2})', clean_time)
+            time_match = re.search(r'(\d{2}:\d{2}(?::\d{2})?)', clean_time)
+            if time_match:
+                time_str = time_match.group(1)
+                if time_str.count(':') == 1:
+                    time_str += ':00'
+                formatted_time = f"{date_match.group(1).replace('/', '-')} {time_str}" if date_match else time_str
+
+        # 根據頻率類型添加描述
+        if frequency == 'once':
+            return f"{formatted_time} (單次執行)"
+        if frequency == 'daily':
+            return f"{formatted_time} (每日執行)"
+        if frequency == 'weekly' and selected_days:
+            weekdays = [WEEKDAY_NAMES[int(day)] for day in selected_days]
+            return f"{formatted_time} (每{','.join(weekdays)}執行)"
+        if frequency == 'monthly' and selected_days:
+            return f"{formatted_time} (每月{','.join(str(day) for day in selected_days)}日執行)"
+        return formatted_time
+    except Exception as e:
+        print(f"Error formatting time: {e}, original time: {schedule_time}")
+        return schedule_time
+
+# 已刪除排程的紀錄保留天數，?since= 早於已清除的版本時客戶端需重新載入完整列表
+SCHEDULE_TOMBSTONE_RETENTION_DAYS = int(os.getenv('SCHEDULE_TOMBSTONE_RETENTION_DAYS', '7'))
+
+# 排程列表的排序鍵，created_at 為 NULL 的舊資料排在最後，keyset 分頁時不會被略過
+SCHEDULE_SORT_KEY = "COALESCE(created_at, '')"
 
 # 初始化資料庫
 def init_db():
-    conn = sqlite3.connect('scripts.db')
+    conn = db.connect('scripts.db')
     c = conn.cursor()
     
     # 修改 schedules 表格，添加新欄位
@@ -68,6 +165,152 @@ def init_db():
         c.execute('ALTER TABLE schedules ADD COLUMN selected_days TEXT')
     if 'next_run' not in columns:
         c.execute('ALTER TABLE schedules ADD COLUMN next_run DATETIME')
+    if 'priority' not in columns:
+        c.execute('ALTER TABLE schedules ADD COLUMN priority INTEGER DEFAULT 0')
+    if 'max_instances' not in columns:
+        c.execute('ALTER TABLE schedules ADD COLUMN max_instances INTEGER DEFAULT 1')
+    if 'schedule_display' not in columns:
+        c.execute('ALTER TABLE schedules ADD COLUMN schedule_display TEXT')
+    if 'version' not in columns:
+        c.execute('ALTER TABLE schedules ADD COLUMN version INTEGER DEFAULT 0')
+
+    # 排程列表的版本號：每次新增、修改、刪除排程都遞增，修改的排程記錄當時的版本號，
+    # 刪除的排程保留在 schedule_tombstones，供 GET /api/schedules?since=<版本> 回傳變更；
+    # 超過保留天數的紀錄會清除，pruned_version 為已清除的最大版本號
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS schedule_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL,
+            pruned_version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO schedule_version (id, value) VALUES (1, 0)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS schedule_tombstones (
+            schedule_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            deleted_at INTEGER
+        )
+    ''')
+    c.execute("PRAGMA table_info(schedule_version)")
+    if 'pruned_version' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE schedule_version ADD COLUMN pruned_version INTEGER NOT NULL DEFAULT 0')
+    c.execute("PRAGMA table_info(schedule_tombstones)")
+    if 'deleted_at' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE schedule_tombstones ADD COLUMN deleted_at INTEGER')
+    c.execute("UPDATE schedule_tombstones SET deleted_at = strftime('%s', 'now') WHERE deleted_at IS NULL")
+    # 以觸發器維護版本號，所有寫入 schedules 的地方都不需要個別處理
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS schedules_version_insert AFTER INSERT ON schedules
+        BEGIN
+            UPDATE schedule_version SET value = value + 1 WHERE id = 1;
+            UPDATE schedules SET version = (SELECT value FROM schedule_version WHERE id = 1) WHERE id = NEW.id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS schedules_version_update AFTER UPDATE ON schedules
+        WHEN NEW.version IS OLD.version
+        BEGIN
+            UPDATE schedule_version SET value = value + 1 WHERE id = 1;
+            UPDATE schedules SET version = (SELECT value FROM schedule_version WHERE id = 1) WHERE id = NEW.id;
+        END
+    ''')
+    # 刪除時一併清除過期的刪除紀錄（保留天數可能已變更，每次啟動重建觸發器）
+    expire_before = f"strftime('%s', 'now') - {SCHEDULE_TOMBSTONE_RETENTION_DAYS * 86400}"
+    c.execute('DROP TRIGGER IF EXISTS schedules_version_delete')
+    c.execute(f'''
+        CREATE TRIGGER schedules_version_delete AFTER DELETE ON schedules
+        BEGIN
+            UPDATE schedule_version SET value = value + 1 WHERE id = 1;
+            INSERT OR REPLACE INTO schedule_tombstones (schedule_id, version, deleted_at)
+            SELECT OLD.id, value, strftime('%s', 'now') FROM schedule_version WHERE id = 1;
+            UPDATE schedule_version SET pruned_version = MAX(pruned_version, COALESCE(
+                (SELECT MAX(version) FROM schedule_tombstones WHERE deleted_at < {expire_before}), 0
+            )) WHERE id = 1;
+            DELETE FROM schedule_tombstones WHERE deleted_at < {expire_before};
+        END
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_schedules_version ON schedules(version)')
+
+    # 補上舊資料的顯示用排程時間
+    c.execute('SELECT id, schedule_time, frequency, selected_days FROM schedules WHERE schedule_display IS NULL')
+    for schedule_id, schedule_time, frequency, selected_days in c.fetchall():
+        c.execute('UPDATE schedules SET schedule_display = ? WHERE id = ?',
+                  (format_schedule_display(schedule_time, frequency, selected_days), schedule_id))
+
+    # 智能爬取結果快取
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_cache (
+            cache_key TEXT PRIMARY KEY,
+            request_key TEXT NOT NULL,
+            url TEXT NOT NULL,
+            page_hash TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            hits INTEGER DEFAULT 0
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_scrape_cache_request_key ON scrape_cache(request_key)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_scrape_cache_last_access ON scrape_cache(last_access)')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS script_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            duration REAL NOT NULL,
+            script TEXT NOT NULL,
+            url TEXT NOT NULL,
+            prompt TEXT NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS schedule_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            schedule_id INTEGER NOT NULL,
+            execution_time DATETIME NOT NULL,
+            status TEXT NOT NULL,
+            content TEXT NOT NULL,
+            duration REAL,
+            error_message TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (schedule_id) REFERENCES schedules(id)
+        )
+    ''')
+
+    # 列表 API 只回傳腳本摘要，內容雜湊與大小預先存在資料表中
+    for table, content_column in (('script_records', 'script'), ('schedules', 'script_content')):
+        c.execute(f"PRAGMA table_info({table})")
+        columns = [column[1] for column in c.fetchall()]
+        if 'script_hash' not in columns:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN script_hash TEXT')
+        if 'script_size' not in columns:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN script_size INTEGER')
+        backfill_script_digests(c, table, content_column)
+
+    # 排程日誌保存腳本執行的輸出與資源用量
+    c.execute("PRAGMA table_info(schedule_logs)")
+    columns = [column[1] for column in c.fetchall()]
+    for column, column_type in (('output', 'TEXT'), ('cpu_time', 'REAL'), ('peak_rss_kb', 'INTEGER'),
+                                ('io_read_bytes', 'INTEGER'), ('io_write_bytes', 'INTEGER')):
+        if column not in columns:
+            c.execute(f'ALTER TABLE schedule_logs ADD COLUMN {column} {column_type}')
+
+    # 產生腳本的快取：模型、正規化後的 (網址, 需求, 模型) 鍵與網址鍵
+    c.execute("PRAGMA table_info(script_records)")
+    columns = [column[1] for column in c.fetchall()]
+    for column in ('model', 'cache_key', 'url_key'):
+        if column not in columns:
+            c.execute(f'ALTER TABLE script_records ADD COLUMN {column} TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_script_records_cache_key ON script_records(cache_key)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_script_records_url_key ON script_records(url_key, model)')
+
+    # 列表查詢的排序與 keyset 分頁索引
+    c.execute('CREATE INDEX IF NOT EXISTS idx_script_records_timestamp ON script_records(timestamp, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_schedule_logs_schedule_time ON schedule_logs(schedule_id, execution_time, id)')
+    # schedules.created_at 可為 NULL，排序與游標都以 SCHEDULE_SORT_KEY 比較，NULL 視為最舊
+    c.execute('DROP INDEX IF EXISTS idx_schedules_created_at')
+    c.execute(f'CREATE INDEX IF NOT EXISTS idx_schedules_sort_key ON schedules({SCHEDULE_SORT_KEY}, id)')
     
     conn.commit()
     conn.close()
@@ -79,7 +322,7 @@ with app.app_context():
 # 初始化提示詞資料表
 def init_prompt_db():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 檢查表是否存在
@@ -156,7 +399,7 @@ def get_gemini_models():
     """Get available Gemini models"""
     return ["gemini-pro"]
 
-def get_graph_config(graph_name, model_name, user_api_key):
+def get_graph_config(graph_name, model_name, user_api_key, ollama_base_url=None):
     try:
         base_config = {
             "library": "BeautifulSoup",
@@ -182,16 +425,18 @@ def get_graph_config(graph_name, model_name, user_api_key):
                 },
             })
         elif graph_name == "ollama":
+            # 背景任務會同時執行，優先使用呼叫端傳入的伺服器網址，避免共用環境變數
+            ollama_base_url = ollama_base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
             base_config.update({
                 "llm": {
                     "model": model_name,
                     "temperature": 0,
                     "format": "json",
-                    "base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+                    "base_url": ollama_base_url,
                 },
                 "embeddings": {
                     "model": "nomic-embed-text:latest",
-                    "base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+                    "base_url": ollama_base_url,
                 },
             })
         else:
@@ -202,132 +447,248 @@ def get_graph_config(graph_name, model_name, user_api_key):
         app.logger.error(f"Error in get_graph_config: {str(e)}")
         raise
 
-def run_scraper(graph_name, url, prompt, user_api_key, model_name):
-    """執行智能爬取"""
+# 執行的腳本是否讓 requests.get 經由 page_fetcher（連線重用、條件式請求與網頁快取）；
+# 預設關閉，啟用後腳本共用磁碟上的網頁快取
+SCRIPT_SHARED_FETCH = os.getenv('SCRIPT_SHARED_FETCH', 'false').lower() in ('1', 'true', 'yes')
+SCRIPT_FETCH_SETUP = """
+import page_fetcher
+page_fetcher.install()
+""" if SCRIPT_SHARED_FETCH else ''
+
+# 智能爬取結果快取設定（關閉 SCRAPE_SHARED_FETCH 時，未命中快取的爬取會由 graph 再下載一次網頁）
+SCRAPE_CACHE_ENABLED = os.getenv('SCRAPE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SCRAPE_CACHE_TTL = int(os.getenv('SCRAPE_CACHE_TTL', '86400'))  # 秒
+SCRAPE_CACHE_MAX_ENTRIES = int(os.getenv('SCRAPE_CACHE_MAX_ENTRIES', '1000'))
+# 經由 page_fetcher 下載的網頁直接交給 SmartScraperGraph，不再由 graph 重新下載；
+# 網頁可見文字少於 SCRAPE_MIN_PAGE_TEXT 字元時視為需要執行 JavaScript，仍以網址交給 graph 載入
+SCRAPE_SHARED_FETCH = os.getenv('SCRAPE_SHARED_FETCH', 'true').lower() in ('1', 'true', 'yes')
+SCRAPE_MIN_PAGE_TEXT = int(os.getenv('SCRAPE_MIN_PAGE_TEXT', '200'))
+
+def normalize_url(url):
+    """標準化網址：小寫主機名稱、移除預設埠號與錨點、排序查詢參數"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, parts.port) in (('http', 80), ('https', 443)):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+def scrape_request_key(url, prompt, graph_name, model_name):
+    """爬取請求的識別鍵（不含網頁內容）"""
+    raw = json.dumps([normalize_url(url), prompt.strip(), graph_name, model_name], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def fetch_page(url):
+    """經由共用的 page_fetcher 下載網頁（未變更時只需 304），失敗時回傳 None（略過快取，由 graph 自行下載）"""
     try:
-        app.logger.info(f"Starting scraper with model: {graph_name} - {model_name}")
-        graph_config = get_graph_config(graph_name, model_name, user_api_key)
-        
-        app.logger.debug(f"Graph config: {json.dumps(graph_config)}")
-        
-        smart_scraper_graph = SmartScraperGraph(
-            prompt=prompt,
-            source=url,
-            config=graph_config
-        )
-        
-        data = smart_scraper_graph.run()
-        app.logger.info(f"Scraper result: {json.dumps(data)}")
-        app.logger.debug(f"Data type: {type(data)}")
-
-        def parse_data(data):
-            """解析不同格式的数据"""
-            try:
-                # 处理字符串类型的数据
-                if isinstance(data, str):
-                    try:
-                        data = json.loads(data)
-                    except json.JSONDecodeError:
-                        return [{"content": data}]
-
-                # 处理字典类型的数据
-                if isinstance(data, dict):
-                    # 如果是单个项目的字典
-                    if any(key in data for key in ['content', 'title', 'link', 'description']):
-                        return [data]
-                    # 如果包含数据列表，直接返回列表内容
-                    for key in ['articles', 'items', 'results', 'data']:
-                        if key in data and isinstance(data[key], list):
-                            # 确保列表中的每个项目都是字典格式
-                            return [
-                                item if isinstance(item, dict) else {"content": str(item)}
-                                for item in data[key]
-                            ]
-                    # 其他情况，将整个字典作为一个项目
-                    return [data]
-
-                # 如果已经是列表
-                if isinstance(data, list):
-                    # 确保列表中的每个项目都是字典格式
-                    return [
-                        item if isinstance(item, dict) else {"content": str(item)}
-                        for item in data
-                    ]
-
-                # 其他类型转换为字符串
-                return [{"content": str(data)}]
-
-            except Exception as e:
-                app.logger.error(f"Error parsing data: {str(e)}")
-                return [{"error": str(e)}]
+        response = page_fetcher.get(url, timeout=15)
+        response.raise_for_status()
+        return response
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"Cannot fetch {url}, graph will load it: {str(e)}")
+        return None
 
-        def normalize_item(item):
-            """标准化单个数据项"""
-            try:
-                if isinstance(item, str):
-                    return [{"content": item.strip()}]
-
-                if isinstance(item, dict):
-                    # 检查是否有数组字段需要展开
-                    array_fields = []
-                    max_length = 1
-                    normalized_base = {}
-                    
-                    # 处理每个字段
-                    for key, value in item.items():
-                        if value is not None:
-                            if isinstance(value, list):
-                                array_fields.append((key, value))
-                                max_length = max(max_length, len(value))
-                            else:
-                                normalized_base[key] = str(value).strip()
-
-                    # 如果没有数组字段，直接返回单个对象
-                    if not array_fields:
-                        return [normalized_base] if normalized_base else [{"content": str(item)}]
-
-                    # 展开数组字段生成多行数据
-                    result = []
-                    for i in range(max_length):
-                        row = normalized_base.copy()
-                        for field, values in array_fields:
-                            row[field] = str(values[i]) if i < len(values) else ""
-                        result.append(row)
-                    
-                    return result
+def page_source(page):
+    """
+    將已下載的網頁轉為 SmartScraperGraph 的來源：連結與圖片網址改為絕對網址（graph 看不到原本的網址），
+    不是 HTML 或可見文字太少（需要執行 JavaScript 才能呈現）時回傳 None，由 graph 以網址載入
+    """
+    if 'html' not in page.headers.get('Content-Type', ''):
+        return None
+    soup = BeautifulSoup(page.text, 'html.parser')
+    if len(soup.get_text(strip=True)) < SCRAPE_MIN_PAGE_TEXT:
+        return None
+    for attribute in ('href', 'src'):
+        for tag in soup.find_all(attrs={attribute: True}):
+            tag[attribute] = urljoin(page.url, tag[attribute])
+    return str(soup)
 
-                return [{"content": str(item)}]
+def get_cached_scrape(request_key, page_hash):
+    """查詢快取，網頁內容已變更或過期的項目會一併移除"""
+    conn = None
+    try:
+        conn = db.connect('scripts.db')
+        c = conn.cursor()
+        now = time.time()
+        cache_key = f'{request_key}:{page_hash}'
+        # 同一請求但網頁內容不同的舊結果已失效
+        c.execute('DELETE FROM scrape_cache WHERE request_key = ? AND page_hash != ?',
+                  (request_key, page_hash))
+        c.execute('DELETE FROM scrape_cache WHERE created_at < ?', (now - SCRAPE_CACHE_TTL,))
+        c.execute('SELECT result FROM scrape_cache WHERE cache_key = ?', (cache_key,))
+        row = c.fetchone()
+        if row:
+            c.execute('''
+                UPDATE scrape_cache SET last_access = ?, hits = hits + 1
+                WHERE cache_key = ?
+            ''', (now, cache_key))
+        conn.commit()
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        app.logger.error(f"Error reading scrape cache: {str(e)}")
+        return None
+    finally:
+        if conn:
+            conn.close()
 
-            except Exception as e:
-                app.logger.error(f"Error normalizing item: {str(e)}")
-                return [{"error": str(e)}]
+def store_cached_scrape(request_key, page_hash, url, result):
+    """寫入快取，超過上限時依最近使用時間淘汰"""
+    conn = None
+    try:
+        conn = db.connect('scripts.db')
+        c = conn.cursor()
+        now = time.time()
+        c.execute('DELETE FROM scrape_cache WHERE request_key = ?', (request_key,))
+        c.execute('''
+            INSERT INTO scrape_cache
+            (cache_key, request_key, url, page_hash, result, created_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (f'{request_key}:{page_hash}', request_key, url, page_hash,
+              json.dumps(result, ensure_ascii=False), now, now))
+        c.execute('''
+            DELETE FROM scrape_cache WHERE cache_key IN (
+                SELECT cache_key FROM scrape_cache
+                ORDER BY last_access DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (SCRAPE_CACHE_MAX_ENTRIES,))
+        conn.commit()
+    except Exception as e:
+        app.logger.error(f"Error writing scrape cache: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
 
-        # 处理数据
-        processed_data = parse_data(data)
-        
-        # 标准化所有数据项并展平结果
-        normalized_data = []
-        for item in processed_data:
-            normalized_items = normalize_item(item)
-            normalized_data.extend(normalized_items)
+def api_key_fingerprint(api_key):
+    """API Key 的指紋，用於識別鍵而不保存 API Key 本身；未提供時回傳 None"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16] if api_key else None
 
-        # 去重
-        final_data = []
-        seen = set()
-        for item in normalized_data:
-            # 创建唯一标识
-            item_values = tuple(sorted([
-                (k, v) for k, v in item.items()
-                if v is not None and str(v).strip()
-            ]))
-            
-            if item_values not in seen:
-                seen.add(item_values)
-                final_data.append(item)
+# SmartScraperGraph 實例池設定
+GRAPH_POOL_IDLE_TTL = int(os.getenv('GRAPH_POOL_IDLE_TTL', '600'))  # 閒置超過秒數即淘汰
+GRAPH_POOL_MAX_IDLE_PER_KEY = int(os.getenv('GRAPH_POOL_MAX_IDLE_PER_KEY', '4'))
 
-        app.logger.debug(f"Final processed data: {json.dumps(final_data)}")
-        return final_data
+class GraphPool:
+    """
+    依 (graph_name, model_name, API Key 指紋, base_url) 重用已初始化的 SmartScraperGraph，
+    讓 LLM / 嵌入模型客戶端與其 HTTP 連線在請求之間保持暖機
+    """
 
+    def __init__(self, idle_ttl, max_idle_per_key):
+        self.idle_ttl = idle_ttl
+        self.max_idle_per_key = max_idle_per_key
+        self.idle = {}  # key -> [(graph, last_used)]
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(graph_name, model_name, api_key, base_url):
+        return (graph_name, model_name, api_key_fingerprint(api_key), base_url)
+
+    def evict_idle(self):
+        """移除閒置過久的實例（呼叫端需持有 lock）"""
+        expire_before = time.monotonic() - self.idle_ttl
+        for key in list(self.idle):
+            entries = [entry for entry in self.idle[key] if entry[1] >= expire_before]
+            if entries:
+                self.idle[key] = entries
+            else:
+                del self.idle[key]
+
+    def acquire(self, key, config, prompt, source):
+        """取出一個閒置實例並換上本次的提示詞與來源，沒有閒置實例時建立新的"""
+        with self.lock:
+            self.evict_idle()
+            entries = self.idle.get(key)
+            graph = entries.pop()[0] if entries else None
+
+        if graph is None:
+            return SmartScraperGraph(prompt=prompt, source=source, config=config)
+
+        graph.prompt = prompt
+        graph.source = source
+        graph.input_key = "url" if source.startswith("http") else "local_dir"
+        return graph
+
+    def release(self, key, graph):
+        """歸還實例供後續請求重用"""
+        graph.final_state = None
+        graph.execution_info = None
+        with self.lock:
+            entries = self.idle.setdefault(key, [])
+            if len(entries) < self.max_idle_per_key:
+                entries.append((graph, time.monotonic()))
+
+graph_pool = GraphPool(GRAPH_POOL_IDLE_TTL, GRAPH_POOL_MAX_IDLE_PER_KEY)
+
+# 同時到達的相同爬取請求只執行一次，其餘等待並共用結果
+scrape_flights = SingleFlight('scrape')
+
+def scrape_flight_key(graph_name, url, prompt, user_api_key, model_name, ollama_base_url=None):
+    """合併爬取請求的識別鍵：與快取相同的請求鍵，加上 API Key 指紋與 Ollama 伺服器"""
+    return (scrape_request_key(url, prompt, graph_name, model_name),
+            api_key_fingerprint(user_api_key), ollama_base_url)
+
+def iter_scrape_events(graph_name, url, prompt, user_api_key, model_name, ollama_base_url=None):
+    """
+    逐步執行智能爬取，依序產生事件：
+    ('progress', 訊息) 表示目前進度，('row', 資料列) 表示一筆標準化且去重後的資料
+    """
+    app.logger.info(f"Starting scraper with model: {graph_name} - {model_name}")
+    graph_config = get_graph_config(graph_name, model_name, user_api_key, ollama_base_url)
+
+    # 以網址、提示詞、模型與網頁內容雜湊查詢快取，命中時不需呼叫 LLM；
+    # 網頁只下載一次：未變更時 page_fetcher 以 ETag / Last-Modified 驗證只需 304，未命中時同一份內容交給 graph
+    yield 'progress', '正在讀取網頁'
+    page = fetch_page(url) if SCRAPE_CACHE_ENABLED or SCRAPE_SHARED_FETCH else None
+    page_hash = hashlib.sha256(page.content).hexdigest() if page is not None and SCRAPE_CACHE_ENABLED else None
+    if page_hash:
+        request_key = scrape_request_key(url, prompt, graph_name, model_name)
+        cached = get_cached_scrape(request_key, page_hash)
+        if cached is not None:
+            app.logger.info(f"Scrape cache hit: {url}")
+            yield 'progress', '已從快取取得結果'
+            for row in cached:
+                yield 'row', row
+            return
+
+    app.logger.debug(f"Graph config: {json.dumps(graph_config)}")
+
+    # 從實例池取得已暖機的 graph，執行失敗的實例不放回池中
+    yield 'progress', '正在進行智能分析'
+    pool_key = GraphPool.make_key(graph_name, model_name, user_api_key, graph_config.get("llm", {}).get("base_url"))
+    # 已下載的網頁直接交給 graph，不再下載第二次；無法使用時 graph 以網址自行載入
+    source = page_source(page) if SCRAPE_SHARED_FETCH and page is not None else None
+    smart_scraper_graph = graph_pool.acquire(pool_key, graph_config, prompt, source or url)
+    data = smart_scraper_graph.run()
+    graph_pool.release(pool_key, smart_scraper_graph)
+    app.logger.info(f"Scraper result: {json.dumps(data)}")
+    app.logger.debug(f"Data type: {type(data)}")
+
+    # 解析、标准化并去重
+    yield 'progress', '正在整理資料'
+    final_data = normalize_and_dedupe(parse_data(data))
+    for row in final_data:
+        yield 'row', row
+
+    app.logger.debug(f"Final processed data: {json.dumps(final_data)}")
+    if page_hash:
+        store_cached_scrape(request_key, page_hash, url, final_data)
+
+def run_scraper(graph_name, url, prompt, user_api_key, model_name, ollama_base_url=None):
+    """執行智能爬取，相同的請求正在執行時等待並共用其結果"""
+    try:
+        rows, shared = scrape_flights.do(
+            scrape_flight_key(graph_name, url, prompt, user_api_key, model_name, ollama_base_url),
+            lambda: [
+                payload for event, payload in iter_scrape_events(
+                    graph_name, url, prompt, user_api_key, model_name, ollama_base_url
+                )
+                if event == 'row'
+            ]
+        )
+        if shared:
+            app.logger.info(f"Scrape coalesced with in-flight request: {url}")
+        return list(rows)
     except Exception as e:
         app.logger.error(f"Error in run_scraper: {str(e)}")
         raise
@@ -408,14 +769,85 @@ def pricing():
 
 
 
-def get_all_script_records():
+# 列表 API 回傳的提示詞預覽長度
+PROMPT_PREVIEW_LENGTH = 200
+
+# 列表 API 的分頁設定，未帶 limit 或 cursor 參數時仍回傳全部資料
+PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', '50'))
+PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', '500'))
+
+def encode_cursor(values):
+    """將最後一筆資料的排序鍵編碼為分頁游標"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """解析分頁游標，格式錯誤時拋出 ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise ValueError('cursor 格式錯誤')
+    if not isinstance(values, list):
+        raise ValueError('cursor 格式錯誤')
+    return values
+
+def get_page_args():
+    """
+    讀取 limit 與 cursor 查詢參數，回傳 (每頁筆數, 游標)；
+    兩者皆未提供時回傳 None 表示不分頁
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return None
+    try:
+        limit = int(limit) if limit else PAGE_SIZE_DEFAULT
+    except ValueError:
+        raise ValueError('limit 必須是整數')
+    if limit < 1:
+        raise ValueError('limit 必須大於 0')
+    return min(limit, PAGE_SIZE_MAX), decode_cursor(cursor) if cursor else None
+
+def keyset_clause(columns, page):
+    """
+    產生依 columns 遞減排序的 keyset 分頁條件
+    回傳 (WHERE 條件或 None, 條件參數, LIMIT 子句)，多取一筆用來判斷是否還有下一頁
+    """
+    if page is None:
+        return None, [], ''
+    limit, cursor = page
+    if cursor is None:
+        return None, [], f' LIMIT {limit + 1}'
+    if len(cursor) != len(columns):
+        raise ValueError('cursor 格式錯誤')
+    condition = f"({', '.join(columns)}) < ({', '.join('?' * len(columns))})"
+    return condition, list(cursor), f' LIMIT {limit + 1}'
+
+def paginate_rows(rows, page, key):
+    """截斷多取的一筆並產生下一頁游標，key 取出資料列的排序鍵"""
+    if page is None or len(rows) <= page[0]:
+        return rows, None
+    rows = rows[:page[0]]
+    return rows, encode_cursor(key(rows[-1]))
+
+def with_next_cursor(response, next_cursor):
+    """在回應標頭加上下一頁游標"""
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def get_all_script_records(limit=None, cursor=None):
     """
     從資料庫獲取所有腳本記錄
+    指定 limit 時依 keyset 分頁，cursor 為上一頁最後一筆的 (timestamp, id)
     """
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
-        c.execute('SELECT * FROM script_records ORDER BY timestamp DESC')
+        page = (limit, cursor) if limit else None
+        condition, params, limit_sql = keyset_clause(['timestamp', 'id'], page)
+        where = f' WHERE {condition}' if condition else ''
+        c.execute(f'SELECT * FROM script_records{where} ORDER BY timestamp DESC, id DESC{limit_sql}', params)
         records = c.fetchall()
         
         # 將查詢結果轉換為字典格式
@@ -441,36 +873,50 @@ def get_all_script_records():
 @app.route('/api/script-records')
 def get_script_records():
     try:
-        conn = sqlite3.connect('scripts.db')
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        conn = db.connect('scripts.db')
         c = conn.cursor()
-        c.execute('SELECT * FROM script_records ORDER BY timestamp DESC')
-        records = c.fetchall()
+        condition, params, limit_sql = keyset_clause(['timestamp', 'id'], page)
+        where = f' WHERE {condition}' if condition else ''
+        # 列表只讀取摘要欄位，腳本內容由 /api/script-records/<id> 取得
+        c.execute(f'''
+            SELECT id, timestamp, duration, url, substr(prompt, 1, ?), length(prompt), script_hash, script_size
+            FROM script_records{where}
+            ORDER BY timestamp DESC, id DESC{limit_sql}
+        ''', [PROMPT_PREVIEW_LENGTH] + params)
+        records, next_cursor = paginate_rows(c.fetchall(), page, lambda record: (record[1], record[0]))
         
         formatted_records = []
         seen_urls = set()  # 用於追蹤已經看過的 URL
         
         for record in records:
             # 使用 URL 和時間戳作為唯一標識
-            url_timestamp = (record[4], record[1])  # url 和 timestamp
+            url_timestamp = (record[3], record[1])  # url 和 timestamp
             
             if url_timestamp not in seen_urls:
                 seen_urls.add(url_timestamp)
                 try:
-                    script_content = record[3]  # 直接使用原始腳本內容
-                    
                     formatted_records.append({
                         'id': record[0],
                         'timestamp': record[1],
                         'duration': float(record[2]),
-                        'script': script_content,
-                        'url': record[4],
-                        'prompt': record[5]
+                        'url': record[3],
+                        'prompt_preview': record[4],
+                        'prompt_truncated': record[5] > PROMPT_PREVIEW_LENGTH,
+                        'script_hash': record[6],
+                        'script_size': record[7]
                     })
                 except Exception as e:
                     print(f"Error formatting record: {e}")
                     continue
 
-        return jsonify({'records': formatted_records})
+        if page is None:
+            return jsonify({'records': formatted_records})
+        return with_next_cursor(jsonify({'records': formatted_records, 'next_cursor': next_cursor}), next_cursor)
     except Exception as e:
         print(f"Error getting script records: {e}")
         return jsonify({'error': str(e)}), 500
@@ -478,14 +924,57 @@ def get_script_records():
         if 'conn' in locals():
             conn.close()
 
+@app.route('/api/script-records/<int:record_id>')
+def get_script_record(record_id):
+    """取得單筆腳本記錄的完整內容，以腳本雜湊作為 ETag"""
+    conn = None
+    try:
+        conn = db.connect('scripts.db')
+        c = conn.cursor()
+        c.execute('SELECT script_hash FROM script_records WHERE id = ?', (record_id,))
+        row = c.fetchone()
+        if not row:
+            return jsonify({'error': '找不到記錄'}), 404
+
+        # 記錄建立後不會修改，ETag 相符時不需讀取腳本內容
+        etag = f'{record_id}-{row[0]}'
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            c.execute('''
+                SELECT id, timestamp, duration, script, url, prompt, script_hash, script_size
+                FROM script_records WHERE id = ?
+            ''', (record_id,))
+            record = c.fetchone()
+            response = jsonify({
+                'id': record[0],
+                'timestamp': record[1],
+                'duration': float(record[2]),
+                'script': record[3],
+                'url': record[4],
+                'prompt': record[5],
+                'script_hash': record[6],
+                'script_size': record[7]
+            })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        print(f"Error getting script record: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
 @app.route('/api/script-records', methods=['DELETE'])
 def clear_script_records():
     conn = None
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         c.execute('DELETE FROM script_records')
         conn.commit()
+        script_cache.script_cache.clear()
         app.logger.info("All script records cleared")
         return jsonify({'status': 'success', 'message': '所有記錄已清除'}), 200
     except Exception as e:
@@ -529,54 +1018,79 @@ def get_ollama_models_api():
         app.logger.error(f"Error in /api/ollama-models: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def parse_scrape_request(data):
+    """解析爬取請求參數，參數錯誤時拋出 ValueError"""
+    if not data:
+        raise ValueError('缺少必要參數')
+
+    # 每個請求寫入自己的 CSV（檔名加上隨機後綴），同時進行的爬取不會覆蓋彼此的檔案
+    stem = os.path.basename(str(data.get('file_name') or 'output.csv'))
+    if stem.lower().endswith('.csv'):
+        stem = stem[:-len('.csv')]
+    file_name = f"{stem or 'output'}_{uuid.uuid4().hex[:8]}.csv"
+
+    # 根據不同的模型類型處理參數
+    graph_name = data['graph_name']
+    api_key = None
+    ollama_base_url = None
+
+    if graph_name == 'ollama':
+        ollama_base_url = data.get('ollama_server', 'http://localhost:11434')
+    else:
+        # ChatGPT 和 Gemini 需要 API Key
+        api_key = data.get('api_key')
+        if not api_key:
+            raise ValueError('API Key is required for ChatGPT and Gemini')
+
+    return {
+        'graph_name': graph_name,
+        'url': data['url'],
+        'prompt': data['prompt'],
+        'api_key': api_key,
+        'model_name': data['model_name'],
+        'ollama_base_url': ollama_base_url,
+        'file_name': file_name
+    }
+
+def save_scrape_csv(rows, file_name):
+    """將爬取結果保存為 CSV 文件"""
+    # 確保 downloads 目錄存在
+    downloads_dir = os.path.join(app.static_folder, 'downloads')
+    os.makedirs(downloads_dir, exist_ok=True)
+
+    if rows:
+        csv_path = os.path.join(downloads_dir, file_name)
+        df = pd.DataFrame(rows)
+        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+
 @app.route('/api/scrape', methods=['POST'])
 def scrape():
     try:
         data = request.get_json()
-        
-        # 確保檔案名稱有 .csv 副檔名
-        file_name = data.get('file_name', 'output.csv')
-        if not file_name.lower().endswith('.csv'):
-            file_name += '.csv'
-        
-        # 根據不同的模型類型處理參數
-        graph_name = data['graph_name']
-        api_key = None
-        
-        if graph_name == 'ollama':
-            os.environ['OLLAMA_BASE_URL'] = data.get('ollama_server', 'http://localhost:11434')
-        else:
-            # ChatGPT 和 Gemini 需要 API Key
-            api_key = data.get('api_key')
-            if not api_key:
-                return jsonify({
-                    'success': False,
-                    'error': 'API Key is required for ChatGPT and Gemini'
-                }), 400
-        
+        try:
+            params = parse_scrape_request(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
         raw_result = run_scraper(
-            graph_name,
-            data['url'],
-            data['prompt'],
-            api_key,
-            data['model_name']
+            params['graph_name'],
+            params['url'],
+            params['prompt'],
+            params['api_key'],
+            params['model_name'],
+            params['ollama_base_url']
         )
 
-        # 確保 downloads 目錄存在
-        downloads_dir = os.path.join(app.static_folder, 'downloads')
-        os.makedirs(downloads_dir, exist_ok=True)
-        
-        # 保存為 CSV 文件
-        if raw_result:
-            csv_path = os.path.join(downloads_dir, file_name)
-            df = pd.DataFrame(raw_result)
-            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-        
+        save_scrape_csv(raw_result, params['file_name'])
+
         # 返回結構化的 JSON 給前端
         return jsonify({
             'success': True,
             'data': raw_result,
-            'file_name': file_name
+            'file_name': params['file_name']
         })
     except Exception as e:
         app.logger.error(f"Scrape error: {str(e)}\n{traceback.format_exc()}")
@@ -585,43 +1099,610 @@ def scrape():
             'error': str(e)
         }), 400
 
+def format_sse(payload, event=None, event_id=None):
+    """將資料編碼為 Server-Sent Events 訊息"""
+    message = f"id: {event_id}\n" if event_id is not None else ''
+    message += f"event: {event}\n" if event else ''
+    return message + f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def wait_flight_sse(future):
+    """SSE 串流中等待合併的請求完成，期間送出心跳；以 yield from 取得結果"""
+    while True:
+        try:
+            return future.result(timeout=SSE_HEARTBEAT_INTERVAL)
+        except FutureTimeoutError:
+            yield ': heartbeat\n\n'
+
+# 行程內事件匯流排，排程、排程日誌與爬取任務的變更透過 /api/sse 推送
+SSE_MAX_SUBSCRIBERS = int(os.getenv('SSE_MAX_SUBSCRIBERS', '100'))
+SSE_HEARTBEAT_INTERVAL = int(os.getenv('SSE_HEARTBEAT_INTERVAL', '15'))  # 秒
+event_bus = EventBus(max_subscribers=SSE_MAX_SUBSCRIBERS)
+
+def publish_schedule_change(schedule_id, action='updated', status=None):
+    """通知前端排程已新增、修改、刪除或狀態改變"""
+    event_bus.publish('schedule', {'id': schedule_id, 'action': action, 'status': status})
+
+def publish_schedule_log(schedule_id, log_id, status):
+    """通知前端排程日誌已新增或更新"""
+    event_bus.publish('schedule_log', {'schedule_id': schedule_id, 'log_id': log_id, 'status': status})
+
+# 腳本執行中的即時輸出，每次執行保留最近 SCRIPT_OUTPUT_RING_LINES 行，
+# 執行結束後再保留 SCRIPT_OUTPUT_RETENTION 秒供 /api/script-runs/<run_id>/output 讀取
+SCRIPT_OUTPUT_RING_LINES = int(os.getenv('SCRIPT_OUTPUT_RING_LINES', '1000'))
+SCRIPT_OUTPUT_RETENTION = int(os.getenv('SCRIPT_OUTPUT_RETENTION', '300'))  # 秒
+SCRIPT_OUTPUT_WAIT = 10  # 秒，客戶端可能比執行請求先連上
+RUN_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+run_outputs = RunOutputRegistry(max_lines=SCRIPT_OUTPUT_RING_LINES, retention=SCRIPT_OUTPUT_RETENTION)
+
+def format_run_output(result):
+    """合併 stdout 與 stderr，作為排程日誌保存的執行輸出"""
+    if result is None:
+        return None
+    output = result.stdout or ''
+    if result.stderr:
+        output += ('\n' if output and not output.endswith('\n') else '') + '[stderr]\n' + result.stderr
+    return output
+
+@app.route('/api/script-runs/<run_id>/output')
+def script_run_output(run_id):
+    """
+    以 SSE 推送腳本執行中的輸出：先送出緩衝中保留的行，之後即時送出新的行，執行結束時送出 end 事件
+    run_id 為 /api/execute-script 請求中的 run_id，排程執行為 log-<日誌 id>
+    斷線重連時依 Last-Event-ID 從中斷處繼續
+    """
+    output = run_outputs.get(run_id, wait=SCRIPT_OUTPUT_WAIT)
+    if output is None:
+        return jsonify({'error': '找不到這次執行的輸出'}), 404
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_seq = 0
+
+    def generate():
+        seq = last_seq
+        yield 'retry: 3000\n\n'
+        while True:
+            lines, skipped, done = output.read(seq, timeout=SSE_HEARTBEAT_INTERVAL)
+            if skipped:
+                # 輸出太快，超出環形緩衝的行已被丟棄
+                yield format_sse({'skipped': skipped}, 'gap')
+            for seq, stream, line in lines:
+                yield format_sse({'stream': stream, 'line': line}, 'output', seq)
+            if done:
+                yield format_sse({'status': output.status}, 'end')
+                return
+            if not lines and not skipped:
+                yield ': heartbeat\n\n'
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/script-runs', methods=['GET'])
+def list_script_runs():
+    """執行中的腳本：run_id、所屬排程（key）、PID 與開始時間"""
+    return jsonify(script_runner.active_runs())
+
+@app.route('/api/script-runs/<run_id>/stop', methods=['POST'])
+def stop_script_run(run_id):
+    """終止指定的腳本執行（含腳本產生的子行程）"""
+    if not script_runner.cancel_run(run_id):
+        return jsonify({'error': '找不到執行中的腳本'}), 404
+    return jsonify({'success': True, 'run_id': run_id})
+
+@app.route('/api/scrape/stream', methods=['POST'])
+def scrape_stream():
+    """以 SSE 串流回傳爬取進度與資料列，資料列一產生就送出"""
+    try:
+        params = parse_scrape_request(request.get_json())
+    except (ValueError, KeyError) as e:
+        return jsonify({'success': False, 'error': f'參數錯誤: {str(e)}'}), 400
+
+    scrape_args = (
+        params['graph_name'],
+        params['url'],
+        params['prompt'],
+        params['api_key'],
+        params['model_name'],
+        params['ollama_base_url']
+    )
+
+    def generate():
+        rows = []
+        try:
+            # 相同的請求正在執行時等待其結果，不重複呼叫 LLM
+            key = scrape_flight_key(*scrape_args)
+            future, leader = scrape_flights.acquire(key)
+            if leader:
+                try:
+                    for event, payload in iter_scrape_events(*scrape_args):
+                        if event == 'row':
+                            rows.append(payload)
+                            yield format_sse(payload, 'row')
+                        else:
+                            yield format_sse({'message': payload}, 'progress')
+                except Exception as e:
+                    scrape_flights.release(key, future, error=e)
+                    raise
+                except GeneratorExit:
+                    scrape_flights.release(key, future, error=Exception('相同的爬取請求已中斷'))
+                    raise
+                scrape_flights.release(key, future, list(rows))
+            else:
+                yield format_sse({'message': '等待相同的爬取請求完成'}, 'progress')
+                for row in (yield from wait_flight_sse(future)):
+                    rows.append(row)
+                    yield format_sse(row, 'row')
+
+            save_scrape_csv(rows, params['file_name'])
+            yield format_sse({'success': True, 'count': len(rows), 'file_name': params['file_name']}, 'done')
+        except Exception as e:
+            app.logger.error(f"Scrape stream error: {str(e)}\n{traceback.format_exc()}")
+            yield format_sse({'success': False, 'error': str(e)}, 'error')
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # 停用代理伺服器緩衝，讓事件即時送達
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# 非同步爬取任務佇列設定
+SCRAPE_MAX_WORKERS = int(os.getenv('SCRAPE_MAX_WORKERS', '4'))
+SCRAPE_MAX_PENDING_JOBS = int(os.getenv('SCRAPE_MAX_PENDING_JOBS', '500'))
+SCRAPE_JOB_RETENTION = int(os.getenv('SCRAPE_JOB_RETENTION', '3600'))  # 已完成任務保留秒數
+
+scrape_executor = ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS, thread_name_prefix='scrape-job')
+scrape_jobs = {}
+scrape_jobs_cond = threading.Condition()
+
+atexit.register(lambda: scrape_executor.shutdown(wait=False, cancel_futures=True))
+
+def prune_scrape_jobs():
+    """移除超過保留時間的已結束任務（呼叫端需持有 scrape_jobs_cond）"""
+    expire_before = time.time() - SCRAPE_JOB_RETENTION
+    expired = [
+        job_id for job_id, job in scrape_jobs.items()
+        if job['finished_at'] and job['finished_at'] < expire_before
+    ]
+    for job_id in expired:
+        del scrape_jobs[job_id]
+
+def update_scrape_job(job_id, **fields):
+    """更新任務狀態並通知等待中的客戶端"""
+    with scrape_jobs_cond:
+        job = scrape_jobs.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        job['version'] += 1
+        scrape_jobs_cond.notify_all()
+        status = scrape_job_status(job)
+    event_bus.publish('scrape_job', status)
+
+def scrape_job_status(job):
+    """任務狀態摘要（不含 API Key 與結果資料）"""
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'url': job['params'].get('url'),
+        'total': job['total'],
+        'done': job['done'],
+        'file_name': job['params']['file_name'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'row_count': len(job['data']) if job['data'] is not None else None,
+        'error': job['error'],
+        'errors': job['errors']
+    }
+
+def run_scrape_job(job_id):
+    """在背景執行緒中執行爬取任務"""
+    with scrape_jobs_cond:
+        params = scrape_jobs[job_id]['params']
+    update_scrape_job(job_id, status='running', progress='正在進行智能爬取', started_at=time.time())
+    try:
+        rows = run_scraper(
+            params['graph_name'],
+            params['url'],
+            params['prompt'],
+            params['api_key'],
+            params['model_name'],
+            params['ollama_base_url']
+        )
+        save_scrape_csv(rows, params['file_name'])
+        update_scrape_job(job_id, status='completed', progress='爬取完成', data=rows, done=1, finished_at=time.time())
+    except Exception as e:
+        app.logger.error(f"Scrape job {job_id} error: {str(e)}\n{traceback.format_exc()}")
+        update_scrape_job(job_id, status='failed', progress='爬取失敗', error=str(e), finished_at=time.time())
+
+def submit_scrape_job(params, runner=None):
+    """建立爬取任務並放入工作佇列，佇列已滿時回傳 None"""
+    with scrape_jobs_cond:
+        prune_scrape_jobs()
+        pending = sum(1 for job in scrape_jobs.values() if job['status'] in ('queued', 'running'))
+        if pending >= SCRAPE_MAX_PENDING_JOBS:
+            return None
+
+        job_id = uuid.uuid4().hex
+        scrape_jobs[job_id] = {
+            'id': job_id,
+            'status': 'queued',
+            'progress': '排隊中',
+            'params': params,
+            'data': None,
+            'error': None,
+            'errors': [],
+            'total': len(params.get('urls') or [params.get('url')]),
+            'done': 0,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'version': 0
+        }
+
+    scrape_executor.submit(runner or run_scrape_job, job_id)
+    return job_id
+
+# 批次爬取設定
+SCRAPE_BATCH_MAX_URLS = int(os.getenv('SCRAPE_BATCH_MAX_URLS', '1000'))
+SCRAPE_BATCH_MAX_CONCURRENCY = int(os.getenv('SCRAPE_BATCH_MAX_CONCURRENCY', '8'))
+
+class HostRateLimiter:
+    """依主機限制請求頻率，同一主機兩次請求至少間隔 min_interval 秒"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        if self.min_interval <= 0:
+            return
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+def expand_batch_urls(data):
+    """從 urls 列表或 url_template + 頁碼範圍產生網址列表"""
+    urls = data.get('urls')
+    if urls:
+        if not isinstance(urls, list):
+            raise ValueError('urls 必須為列表')
+        urls = [str(url).strip() for url in urls if str(url).strip()]
+    elif data.get('url_template'):
+        template = data['url_template']
+        if '{page}' not in template:
+            raise ValueError('url_template 必須包含 {page}')
+        page_start = int(data.get('page_start', 1))
+        page_end = int(data.get('page_end', page_start))
+        page_step = int(data.get('page_step', 1))
+        if page_step <= 0 or page_end < page_start:
+            raise ValueError('無效的頁碼範圍')
+        urls = [template.replace('{page}', str(page)) for page in range(page_start, page_end + 1, page_step)]
+    else:
+        raise ValueError('請提供 urls 或 url_template')
+
+    # 保留順序去除重複網址
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        raise ValueError('沒有可爬取的網址')
+    if len(urls) > SCRAPE_BATCH_MAX_URLS:
+        raise ValueError(f'網址數量超過上限 {SCRAPE_BATCH_MAX_URLS}')
+    return urls
+
+def run_scrape_batch_job(job_id):
+    """在背景執行批次爬取，合併並去重所有網址的結果"""
+    with scrape_jobs_cond:
+        params = scrape_jobs[job_id]['params']
+    urls = params['urls']
+    update_scrape_job(job_id, status='running', progress=f'已完成 0/{len(urls)}', started_at=time.time())
+
+    limiter = HostRateLimiter(params['min_interval'])
+    progress_lock = threading.Lock()
+    state = {'done': 0, 'errors': []}
+
+    def scrape_one(url):
+        limiter.wait(url)
+        try:
+            return run_scraper(
+                params['graph_name'],
+                url,
+                params['prompt'],
+                params['api_key'],
+                params['model_name'],
+                params['ollama_base_url']
+            )
+        except Exception as e:
+            app.logger.error(f"Batch job {job_id} failed on {url}: {str(e)}")
+            with progress_lock:
+                state['errors'].append({'url': url, 'error': str(e)})
+            return []
+        finally:
+            with progress_lock:
+                state['done'] += 1
+                done, errors = state['done'], list(state['errors'])
+            update_scrape_job(job_id, progress=f'已完成 {done}/{len(urls)}', done=done, errors=errors)
+
+    try:
+        with ThreadPoolExecutor(max_workers=params['concurrency'], thread_name_prefix='scrape-batch') as pool:
+            # map 保留網址順序，合併結果與單一網址爬取一致
+            results = list(pool.map(scrape_one, urls))
+
+        if len(state['errors']) == len(urls):
+            raise Exception('所有網址皆爬取失敗')
+
+        merged = dedupe_rows([row for rows in results for row in rows])
+        save_scrape_csv(merged, params['file_name'])
+        update_scrape_job(
+            job_id,
+            status='completed',
+            progress=f'爬取完成，共 {len(merged)} 筆資料',
+            data=merged,
+            errors=state['errors'],
+            finished_at=time.time()
+        )
+    except Exception as e:
+        app.logger.error(f"Batch job {job_id} error: {str(e)}\n{traceback.format_exc()}")
+        update_scrape_job(job_id, status='failed', progress='爬取失敗', error=str(e),
+                          errors=state['errors'], finished_at=time.time())
+
+@app.route('/api/scrape/batch', methods=['POST'])
+def create_scrape_batch():
+    """建立批次爬取任務，對多個網址套用相同提示詞"""
+    try:
+        data = request.get_json() or {}
+        urls = expand_batch_urls(data)
+        # 沿用單一網址的參數驗證
+        params = parse_scrape_request({**data, 'url': urls[0]})
+        params.pop('url')
+        params['urls'] = urls
+
+        concurrency = int(data.get('concurrency', 4))
+        params['concurrency'] = max(1, min(concurrency, SCRAPE_BATCH_MAX_CONCURRENCY))
+        # 每台主機每秒請求數，0 表示不限制
+        rate_limit = float(data.get('rate_limit', 1))
+        params['min_interval'] = 1.0 / rate_limit if rate_limit > 0 else 0
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'success': False, 'error': f'參數錯誤: {str(e)}'}), 400
+
+    job_id = submit_scrape_job(params, runner=run_scrape_batch_job)
+    if job_id is None:
+        return jsonify({'success': False, 'error': '爬取任務過多，請稍後再試'}), 429
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'total': len(urls),
+        'status_url': f'/api/scrape/jobs/{job_id}',
+        'result_url': f'/api/scrape/jobs/{job_id}/result'
+    }), 202
+
+@app.route('/api/scrape/jobs', methods=['POST'])
+def create_scrape_job():
+    """建立非同步爬取任務，立即回傳任務 ID"""
+    try:
+        params = parse_scrape_request(request.get_json())
+    except (ValueError, KeyError) as e:
+        return jsonify({'success': False, 'error': f'參數錯誤: {str(e)}'}), 400
+
+    job_id = submit_scrape_job(params)
+    if job_id is None:
+        return jsonify({'success': False, 'error': '爬取任務過多，請稍後再試'}), 429
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/api/scrape/jobs/{job_id}',
+        'result_url': f'/api/scrape/jobs/{job_id}/result'
+    }), 202
+
+@app.route('/api/scrape/jobs/<job_id>', methods=['GET'])
+def get_scrape_job(job_id):
+    """查詢爬取任務狀態"""
+    with scrape_jobs_cond:
+        job = scrape_jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': '找不到任務'}), 404
+        status = scrape_job_status(job)
+    return jsonify({'success': True, **status})
+
+@app.route('/api/scrape/jobs/<job_id>/result', methods=['GET'])
+def get_scrape_job_result(job_id):
+    """取得已完成任務的爬取結果"""
+    with scrape_jobs_cond:
+        job = scrape_jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': '找不到任務'}), 404
+        status, data, error = job['status'], job['data'], job['error']
+        file_name = job['params']['file_name']
+
+    if status == 'failed':
+        return jsonify({'success': False, 'status': status, 'error': error}), 400
+    if status != 'completed':
+        return jsonify({'success': False, 'status': status, 'error': '任務尚未完成'}), 409
+
+    return jsonify({
+        'success': True,
+        'status': status,
+        'data': data,
+        'file_name': file_name
+    })
+
+@app.route('/api/scrape/jobs/<job_id>/stream')
+def stream_scrape_job(job_id):
+    """以 SSE 推送任務狀態變化，直到任務結束"""
+    with scrape_jobs_cond:
+        if job_id not in scrape_jobs:
+            return jsonify({'success': False, 'error': '找不到任務'}), 404
+
+    def generate():
+        last_version = -1
+        while True:
+            with scrape_jobs_cond:
+                scrape_jobs_cond.wait_for(
+                    lambda: job_id not in scrape_jobs or scrape_jobs[job_id]['version'] != last_version,
+                    timeout=15
+                )
+                job = scrape_jobs.get(job_id)
+                if job is None:
+                    return
+                if job['version'] == last_version:
+                    # 心跳，避免代理伺服器關閉閒置連線
+                    status = None
+                else:
+                    last_version = job['version']
+                    status = scrape_job_status(job)
+
+            if status is None:
+                yield ': heartbeat\n\n'
+                continue
+            yield format_sse(status)
+            if status['status'] in ('completed', 'failed'):
+                return
+
+    return Response(generate(), mimetype='text/event-stream')
+
 @app.route('/api/generate-script', methods=['POST'])
 def generate_script():
+    """
+    產生爬蟲腳本；stream 為 true 時以 SSE 逐段送出模型產生的文字（token 事件），
+    完成後送出 done 事件（含完整腳本與耗時），失敗時送出 error 事件
+    use_cache 不為 false 時先查詢已產生過的腳本，命中時直接回傳（cached 為 exact 或 similar）
+    """
     data = request.get_json()
     model_type = data.get('model_type')
     url = data.get('url')
     prompt = data.get('prompt')
 
+    if model_type in ('ollama', 'chatgpt', 'gemini') and data.get('use_cache', True) is not False:
+        cached = script_cache.script_cache.lookup(url, prompt, script_model_key(model_type, data))
+        if cached:
+            result = {
+                'success': True,
+                'script': cached['script'],
+                'duration': 0,
+                'cached': cached['match'],
+                'similarity': cached['similarity'],
+                'cached_prompt': cached['prompt'],
+                'cached_at': cached['timestamp'],
+                'record_id': cached['record_id'],
+            }
+            if data.get('stream'):
+                return Response(format_sse(result, 'done'), mimetype='text/event-stream')
+            return jsonify(result)
+
+    if data.get('stream') and model_type in ('ollama', 'chatgpt', 'gemini'):
+        return stream_generated_script(model_type, data, url, prompt)
+
     if model_type == 'ollama':
         server_url = data.get('server_url')
         model = data.get('model')
-        try:
-            script = generate_script_with_ollama(server_url, model, url, prompt)
-            return jsonify({'success': True, 'script': script, 'duration': 0})
-        except Exception as e:
-            app.logger.error(f"Ollama script generation error: {str(e)}")
-            return jsonify({'success': False, 'message': '生成腳本失敗: ' + str(e)}), 500
-
+        run = lambda: generate_script_with_ollama(server_url, model, url, prompt)
     elif model_type == 'chatgpt':
         api_key = data.get('api_key')
-        try:
-            script = generate_script_with_chatgpt(url, prompt, api_key)
-            return jsonify({'success': True, 'script': script, 'duration': 0})
-        except Exception as e:
-            app.logger.error(f"ChatGPT script generation error: {str(e)}")
-            return jsonify({'success': False, 'message': '生成腳本失敗: ' + str(e)}), 500
-
+        run = lambda: generate_script_with_chatgpt(url, prompt, api_key)
     elif model_type == 'gemini':
-        try:
-            script = generate_script_with_gemini(url, prompt)
-            return jsonify({'success': True, 'script': script, 'duration': 0})
-        except Exception as e:
-            app.logger.error(f"Gemini script generation error: {str(e)}")
-            return jsonify({'success': False, 'message': '生成腳本失敗: ' + str(e)}), 500
+        run = lambda: generate_script_with_gemini(url, prompt)
+    else:
+        # 處理未知的模型類型
+        return jsonify({'success': False, 'message': f'不支持的模型類型: {model_type}'}), 400
+
+    try:
+        # 相同的請求正在產生時等待並共用其結果
+        script, shared = script_flights.do(script_flight_key(model_type, data, url, prompt), run)
+        return jsonify({'success': True, 'script': script, 'duration': 0, 'shared': shared})
+    except Exception as e:
+        app.logger.error(f"{model_type} script generation error: {str(e)}")
+        return jsonify({'success': False, 'message': '生成腳本失敗: ' + str(e)}), 500
+
+# 同時到達的相同腳本產生請求只呼叫一次語言模型
+script_flights = SingleFlight('generate-script')
+
+def script_flight_key(model_type, data, url, prompt):
+    """合併腳本產生請求的識別鍵：與快取相同的鍵，加上 API Key 指紋與 Ollama 伺服器"""
+    return (script_cache.cache_key(url, prompt, script_model_key(model_type, data)),
+            api_key_fingerprint(data.get('api_key')), data.get('server_url'))
+
+
+def stream_generated_script(model_type, data, url, prompt):
+    """以 SSE 串流回傳產生中的腳本，完整腳本產生後記錄到 script_records"""
+    system_prompt, user_prompt = script_generation_prompts(model_type, url, prompt)
+    if model_type == 'ollama':
+        provider, options = 'ollama', {'model': data.get('model'), 'base_url': data.get('server_url')}
+    elif model_type == 'chatgpt':
+        provider, options = 'openai', {'model': 'gpt-3.5-turbo', 'api_key': data.get('api_key'), 'temperature': 0.7}
+    else:
+        provider, options = 'gemini', {'model': 'gemini-pro'}
 
-    # 處理未知的模型類型
-    return jsonify({'success': False, 'message': f'不支持的模型類型: {model_type}'}), 400
+    def generate():
+        start_time = time.time()
+        parts = []
+        try:
+            # 相同的請求正在產生時等待其結果（不逐段送出），不重複呼叫語言模型
+            key = script_flight_key(model_type, data, url, prompt)
+            future, leader = script_flights.acquire(key)
+            if not leader:
+                script = yield from wait_flight_sse(future)
+                duration = round(time.time() - start_time, 2)
+                yield format_sse({'success': True, 'script': script, 'duration': duration, 'shared': True}, 'done')
+                return
 
+            try:
+                for text in llm_gateway.stream(provider, user_prompt, system_prompt=system_prompt, **options):
+                    parts.append(text)
+                    yield format_sse({'text': text}, 'token')
+
+                script = ''.join(parts).strip()
+                if not script:
+                    raise Exception("生成的腳本為空")
+                duration = round(time.time() - start_time, 2)
+                save_script_record(script, duration, url, prompt, script_model_key(model_type, data))
+            except Exception as e:
+                script_flights.release(key, future, error=e)
+                raise
+            except GeneratorExit:
+                script_flights.release(key, future, error=Exception('相同的腳本產生請求已中斷'))
+                raise
+            script_flights.release(key, future, script)
+            yield format_sse({'success': True, 'script': script, 'duration': duration}, 'done')
+        except Exception as e:
+            app.logger.error(f"{model_type} script generation error: {str(e)}")
+            yield format_sse({'success': False, 'message': '生成腳本失敗: ' + str(e)}, 'error')
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/llm/stats', methods=['GET'])
+def get_llm_stats():
+    """語言模型呼叫的次數、錯誤、重試與耗時統計"""
+    return jsonify(llm_gateway.gateway.stats())
+
+@app.route('/api/page-cache/stats', methods=['GET'])
+def get_page_cache_stats():
+    """本行程經由 page_fetcher 下載網頁的次數、304 驗證次數與快取寫入次數"""
+    return jsonify(page_fetcher.fetcher.snapshot())
+
+@app.route('/api/single-flight/stats', methods=['GET'])
+def get_single_flight_stats():
+    """相同請求合併執行的次數與執行中的數量"""
+    return jsonify([scrape_flights.snapshot(), script_flights.snapshot()])
+
+@app.route('/api/script-cache/stats', methods=['GET'])
+def get_script_cache_stats():
+    """腳本快取的命中次數與向量索引狀態"""
+    return jsonify(script_cache.script_cache.snapshot())
 
 @app.route('/download/<path:filename>')
 def download_file(filename):
@@ -635,7 +1716,7 @@ def download_file(filename):
 @app.route('/api/quick-questions-list', methods=['GET'])
 def get_quick_questions_list():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 修改 SQL 查詢，確保包含 created_at 欄位
@@ -668,7 +1749,7 @@ def get_quick_questions_list():
 @app.route('/api/prompts', methods=['GET'])
 def get_prompts():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         c.execute('''
@@ -708,7 +1789,7 @@ def create_prompt():
         sort_order = data.get('sort_order', 1)
         status = data.get('status', True)  # 預設為啟用
         
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         try:
             c.execute('''
@@ -734,7 +1815,7 @@ def create_prompt():
 @app.route('/api/prompts/<int:prompt_id>', methods=['GET'])
 def get_prompt(prompt_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         c.execute('''
@@ -766,7 +1847,7 @@ def get_prompt(prompt_id):
 def update_prompt(prompt_id):
     try:
         data = request.get_json()
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 檢查排序值是否重複（排除當前記錄）
@@ -799,7 +1880,7 @@ def update_prompt(prompt_id):
 @app.route('/api/prompts/<int:prompt_id>', methods=['DELETE'])
 def delete_prompt(prompt_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 檢查記錄是否存在
@@ -834,7 +1915,7 @@ def toggle_prompt(prompt_id):
         data = request.get_json()
         is_active = data.get('is_active', False)
         
-        conn = sqlite3.connect('prompts.db')
+        conn = db.connect('prompts.db')
         c = conn.cursor()
         
         if is_active:
@@ -876,7 +1957,7 @@ def save_prompt():
 
 def migrate_prompts_db():
     try:
-        conn = sqlite3.connect('prompts.db')
+        conn = db.connect('prompts.db')
         c = conn.cursor()
         
         # 檢查表是否存在
@@ -913,7 +1994,7 @@ with app.app_context():
 @app.route('/api/quick-questions', methods=['GET'])
 def get_quick_questions():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         c.execute('''
@@ -948,7 +2029,7 @@ def get_quick_questions():
 def create_quick_question():
     try:
         data = request.get_json()
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 添加當前時間作為 created_at
@@ -976,7 +2057,7 @@ def create_quick_question():
 @app.route('/api/quick-questions/<int:id>', methods=['DELETE'])
 def delete_quick_question(id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 確認記錄是否存在
@@ -1016,7 +2097,7 @@ def batch_delete_quick_questions():
                 'message': '未提供要刪除的ID列表'
             }), 400
             
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 將 ID 列表轉換為 SQL 安全的格式
@@ -1049,7 +2130,7 @@ def batch_delete_quick_questions():
 # 快速提問管理路由
 @app.route('/api/questions', methods=['GET'])
 def get_questions():
-    conn = sqlite3.connect('database.db')
+    conn = db.connect('database.db')
     c = conn.cursor()
     c.execute('SELECT id, display_text, sort_order FROM quick_questions ORDER BY sort_order')
     questions = [{'id': row[0], 'display_text': row[1], 'sort_order': row[2]} for row in c.fetchall()]
@@ -1058,7 +2139,7 @@ def get_questions():
 
 @app.route('/api/questions/<int:id>', methods=['GET'])
 def get_question(id):
-    conn = sqlite3.connect('database.db')
+    conn = db.connect('database.db')
     c = conn.cursor()
     c.execute('SELECT id, display_text, sort_order FROM quick_questions WHERE id = ?', (id,))
     row = c.fetchone()
@@ -1070,7 +2151,7 @@ def get_question(id):
 @app.route('/api/questions', methods=['POST'])
 def add_question():
     data = request.json
-    conn = sqlite3.connect('database.db')
+    conn = db.connect('database.db')
     c = conn.cursor()
     try:
         c.execute('INSERT INTO quick_questions (display_text, sort_order) VALUES (?, ?)',
@@ -1085,7 +2166,7 @@ def add_question():
 @app.route('/api/questions/<int:id>', methods=['PUT'])
 def update_question(id):
     data = request.json
-    conn = sqlite3.connect('database.db')
+    conn = db.connect('database.db')
     c = conn.cursor()
     try:
         c.execute('UPDATE quick_questions SET display_text = ?, sort_order = ? WHERE id = ?',
@@ -1099,7 +2180,7 @@ def update_question(id):
 
 @app.route('/api/questions/<int:id>', methods=['DELETE'])
 def delete_question(id):
-    conn = sqlite3.connect('database.db')
+    conn = db.connect('database.db')
     c = conn.cursor()
     try:
         c.execute('DELETE FROM quick_questions WHERE id = ?', (id,))
@@ -1116,7 +2197,7 @@ def batch_delete_questions():
     if not data or 'ids' not in data:
         return jsonify({'success': False, 'message': 'No ids provided'})
     
-    conn = sqlite3.connect('database.db')
+    conn = db.connect('database.db')
     c = conn.cursor()
     try:
         ids = ','.join('?' * len(data['ids']))
@@ -1134,7 +2215,7 @@ def check_sort_order():
         order = request.args.get('order', type=int)
         exclude_id = request.args.get('exclude_id', type=int)
         
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 首先檢查總記錄數
@@ -1166,7 +2247,7 @@ def check_sort_order():
 
 def migrate_quick_questions_db():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 檢查表是否存在
@@ -1233,7 +2314,7 @@ with app.app_context():
 @app.route('/api/quick-questions/<int:id>', methods=['GET'])
 def get_quick_question(id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         c.execute('''
@@ -1265,7 +2346,7 @@ def update_quick_question(id):
     try:
         data = request.get_json()
         
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         c.execute('''
@@ -1302,7 +2383,7 @@ def batch_delete_prompts():
                 'message': '未提供要刪除的ID列表'
             }), 400
             
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 將 ID 列表轉換為 SQL 安全的格式
@@ -1335,7 +2416,7 @@ def batch_delete_prompts():
 @app.route('/api/active-quick-questions', methods=['GET'])
 def get_active_quick_questions():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 只獲取狀態為啟用的快速提問
@@ -1367,7 +2448,7 @@ def get_active_quick_questions():
 @app.route('/api/prompts/max-sort-order', methods=['GET'])
 def get_max_sort_order():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 使用 SQLite 直接查詢最大排序值
@@ -1393,7 +2474,7 @@ def check_prompt_sort_order():
         order = request.args.get('order', type=int)
         exclude_id = request.args.get('exclude_id', type=int)
         
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         query = 'SELECT 1 FROM prompts WHERE sort_order = ?'
@@ -1427,7 +2508,7 @@ def update_prompt_status(id):
         status = data.get('status', False)
         
          
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         cursor = conn.cursor()
         try:
             # 直接更新指定提示詞的狀態
@@ -1452,115 +2533,10 @@ def update_prompt_status(id):
             'message': str(e)
         }), 500
 
-# 添加 ChatGPT 腳本生成函數
-def generate_script_with_chatgpt(url, prompt, api_key):
-    """使用 ChatGPT 生成爬蟲腳本"""
-    start_time = time.time()  # 開始計時
-    try:
-        # 設置 OpenAI API key
-        client = OpenAI(api_key=api_key)
-        
-        # 構建提示詞
-        system_prompt = """你是一個專業的 Python 爬蟲工程師。請根據用戶提供的網址和需求，生成一個使用 Python 的爬蟲腳本。
+SCRIPT_SYSTEM_PROMPT = """你是一個專業的 Python 爬蟲工程師。請根據用戶提供的網址和需求，生成一個使用 Python 的爬蟲腳本。
         腳本需要包含必要的錯誤處理，並使用 requests 和 BeautifulSoup 函式庫。請只返回 Python 代碼，不需要其他解釋。"""
-        
-        user_prompt = f"網址：{url}\n需求：{prompt}\n請生成爬蟲腳本。"
-        
-        # 調用 ChatGPT API
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7
-        )
-        
-        # 獲取生成的腳本
-        script = response.choices[0].message.content.strip()
-        
-        # 檢查腳本是否為空
-        if not script:
-            raise Exception("生成的腳本為空")
-            
-        # 計算執行時間（轉換為秒）
-        duration = round(time.time() - start_time, 2)
-            
-        # 記錄到資料庫
-        try:
-            conn = sqlite3.connect('scripts.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO script_records (timestamp, duration, script, url, prompt)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), duration, script, url, prompt))
-            conn.commit()
-        except Exception as e:
-            app.logger.error(f"Database error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
-        
-        return script
-        
-    except Exception as e:
-        app.logger.error(f"ChatGPT script generation error: {str(e)}")
-        raise Exception(f"生成腳本時發生錯誤: {str(e)}")
-
-# 添加 Gemini 腳本生成函數
-def generate_script_with_gemini(url, prompt):
-    """使用 Gemini 生成爬蟲腳本"""
-    start_time = time.time()  # 開始計時
-    try:
-        # 構建提示詞
-        system_prompt = """你是一個專業的 Python 爬蟲工程師。請根據用戶提供的網址和需求，生成一個使用 Python 的爬蟲腳本。
-        腳本需要包含必要的錯誤處理，並使用 requests 和 BeautifulSoup 函式庫。請只返回 Python 代碼，不需要其他解釋。"""
-        
-        user_prompt = f"網址：{url}\n需求：{prompt}\n請生成爬蟲腳本。"
-        
-        # 組合完整提示詞
-        full_prompt = f"{system_prompt}\n\n{user_prompt}"
-        
-        # 調用 Gemini API
-        response = model.generate_content(full_prompt)
-        
-        # 獲取生成的腳本
-        script = response.text.strip()
-        
-        # 檢查腳本是否為空
-        if not script:
-            raise Exception("生成的腳本為空")
-            
-        # 計算執行時間（轉換為秒）
-        duration = round(time.time() - start_time, 2)
-            
-        # 記錄到資料庫
-        try:
-            conn = sqlite3.connect('scripts.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO script_records (timestamp, duration, script, url, prompt)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), duration, script, url, prompt))
-            conn.commit()
-        except Exception as e:
-            app.logger.error(f"Database error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
-        
-        return script
-        
-    except Exception as e:
-        app.logger.error(f"Gemini script generation error: {str(e)}")
-        raise Exception(f"生成腳本時發生錯誤: {str(e)}")
 
-def generate_script_with_ollama(server_url, model, url, prompt):
-    """使用 Ollama 生成爬蟲腳本"""
-    start_time = time.time()  # 開始計時
-    try:
-        # 構建提示詞
-        system_prompt = """你是一位專業的 Python 爬蟲工程師，請根據以下需求生成一個完整的爬蟲腳本：
+OLLAMA_SCRIPT_SYSTEM_PROMPT = """你是一位專業的 Python 爬蟲工程師，請根據以下需求生成一個完整的爬蟲腳本：
 
 ## 任務目標
 生成一個針對 Google 搜尋結果頁面的爬蟲腳本，使用 Selenium 模擬真實瀏覽器行為
@@ -1643,51 +2619,117 @@ for result in search_results:
 - 確保程式可以持續運行而不會中斷
 
 """
+
+def script_generation_prompts(model_type, url, prompt):
+    """產生腳本的 (system_prompt, user_prompt)，Ollama 使用較詳細的系統提示詞"""
+    system_prompt = OLLAMA_SCRIPT_SYSTEM_PROMPT if model_type == 'ollama' else SCRIPT_SYSTEM_PROMPT
+    return system_prompt, f"網址：{url}\n需求：{prompt}\n請生成爬蟲腳本。"
+
+def script_model_key(model_type, data):
+    """快取使用的模型識別，例如 chatgpt:gpt-3.5-turbo、ollama:llama3"""
+    if model_type == 'ollama':
+        return f"ollama:{data.get('model')}"
+    if model_type == 'chatgpt':
+        return 'chatgpt:gpt-3.5-turbo'
+    return 'gemini:gemini-pro'
+
+def save_script_record(script, duration, url, prompt, model=None):
+    """記錄產生的腳本到 script_records，並在背景加入快取的向量索引，回傳紀錄 id"""
+    conn = None
+    try:
+        conn = db.connect('scripts.db')
+        c = conn.cursor()
+        script_hash, script_size = script_digest(script)
+        c.execute('''
+            INSERT INTO script_records (timestamp, duration, script, url, prompt, script_hash, script_size,
+                                        model, cache_key, url_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), duration, script, url, prompt, script_hash, script_size,
+              model, script_cache.cache_key(url, prompt, model) if model else None, script_cache.normalize_url(url)))
+        conn.commit()
+        record_id = c.lastrowid
+    except Exception as e:
+        app.logger.error(f"Database error: {str(e)}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+    script_cache.script_cache.add(record_id, prompt)
+    return record_id
+
+# 添加 ChatGPT 腳本生成函數
+def generate_script_with_chatgpt(url, prompt, api_key):
+    """使用 ChatGPT 生成爬蟲腳本"""
+    start_time = time.time()  # 開始計時
+    try:
+        # 構建提示詞
+        system_prompt, user_prompt = script_generation_prompts('chatgpt', url, prompt)
         
-        user_prompt = f"網址：{url}\n需求：{prompt}\n請生成爬蟲腳本。"
+        # 調用 ChatGPT API
+        script = llm_gateway.generate(
+            'openai', user_prompt,
+            system_prompt=system_prompt,
+            model="gpt-3.5-turbo",
+            api_key=api_key,
+            temperature=0.7
+        ).strip()
         
-        # 組合完整提示詞
-        full_prompt = f"{system_prompt}\n\n{user_prompt}"
+        # 檢查腳本是否為空
+        if not script:
+            raise Exception("生成的腳本為空")
+            
+        # 計算執行時間（轉換為秒）並記錄到資料庫
+        save_script_record(script, round(time.time() - start_time, 2), url, prompt, 'chatgpt:gpt-3.5-turbo')
+        return script
         
-        # 調用 Ollama API
-        response = requests.post(f"{server_url}/api/generate", json={
-            "model": model,
-            "prompt": full_prompt,
-            "stream": False
-        })
-
-        if response.status_code != 200:
-            raise Exception(f"Ollama 伺服器回應錯誤: {response.status_code} - {response.text}")
+    except Exception as e:
+        app.logger.error(f"ChatGPT script generation error: {str(e)}")
+        raise Exception(f"生成腳本時發生錯誤: {str(e)}")
 
-        # 獲取生成的腳本
-        result = response.json()
-        if 'response' not in result:
-            raise Exception("Ollama 回應格式錯誤")
-            
-        script = result['response'].strip()
+# 添加 Gemini 腳本生成函數
+def generate_script_with_gemini(url, prompt):
+    """使用 Gemini 生成爬蟲腳本"""
+    start_time = time.time()  # 開始計時
+    try:
+        # 構建提示詞
+        system_prompt, user_prompt = script_generation_prompts('gemini', url, prompt)
+        
+        # 調用 Gemini API
+        script = llm_gateway.generate('gemini', user_prompt, system_prompt=system_prompt, model='gemini-pro').strip()
         
         # 檢查腳本是否為空
         if not script:
             raise Exception("生成的腳本為空")
             
-        # 計算執行時間（轉換為秒）
-        duration = round(time.time() - start_time, 2)
-            
-        # 記錄到資料庫
-        try:
-            conn = sqlite3.connect('scripts.db')
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO script_records (timestamp, duration, script, url, prompt)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), duration, script, url, prompt))
-            conn.commit()
-        except Exception as e:
-            app.logger.error(f"Database error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
+        # 計算執行時間（轉換為秒）並記錄到資料庫
+        save_script_record(script, round(time.time() - start_time, 2), url, prompt, 'gemini:gemini-pro')
+        return script
         
+    except Exception as e:
+        app.logger.error(f"Gemini script generation error: {str(e)}")
+        raise Exception(f"生成腳本時發生錯誤: {str(e)}")
+
+def generate_script_with_ollama(server_url, model, url, prompt):
+    """使用 Ollama 生成爬蟲腳本"""
+    start_time = time.time()  # 開始計時
+    try:
+        # 構建提示詞
+        system_prompt, user_prompt = script_generation_prompts('ollama', url, prompt)
+        
+        # 調用 Ollama API
+        script = llm_gateway.generate(
+            'ollama', user_prompt,
+            system_prompt=system_prompt,
+            model=model,
+            base_url=server_url
+        ).strip()
+        
+        # 檢查腳本是否為空
+        if not script:
+            raise Exception("生成的腳本為空")
+            
+        # 計算執行時間（轉換為秒）並記錄到資料庫
+        save_script_record(script, round(time.time() - start_time, 2), url, prompt, f'ollama:{model}')
         return script
         
     except Exception as e:
@@ -1778,92 +2820,35 @@ def execute_script():
             }), 400
             
         script = data['script']
-        csv_name = data['csv_name']
-        
-        # 驗證腳本
-        def is_valid_python_script(script):
-            """
-            驗證腳本是否為有效的 Python 代碼，並進行語法和安全性檢查
-            """
-            import ast
-            import tokenize
-            from io import StringIO
-            
-            # 檢查是否為空
-            if not script or not script.strip():
-                return False, "腳本內容不能為空"
-                
-            # 基本語法檢查
-            try:
-                # 檢查是否有語法錯誤
-                compile(script, '<string>', 'exec')
-            except SyntaxError as e:
-                line_no = e.lineno if hasattr(e, 'lineno') else '未知'
-                col_no = e.offset if hasattr(e, 'offset') else '未知'
-                error_msg = str(e).split('\n')[0] if str(e) else '語法錯誤'
-                return False, f"Python 語法錯誤 (第 {line_no} 行，第 {col_no} 列): {error_msg}"
-            except Exception as e:
-                return False, f"Python 代碼錯誤: {str(e)}"
-                
-            # 詳細的語法分析
-            try:
-                ast.parse(script)
-            except Exception as e:
-                return False, f"Python 語法分析錯誤: {str(e)}"
-                
-            # 檢查是否包含危險的內容
-            dangerous_keywords = [
-                'exec', 'eval', 'os.system', 'subprocess.call', 
-                'subprocess.run', 'subprocess.Popen', '__import__',
-                'open', 'file', 'execfile', 'compile', 'input',
-                'os.remove', 'os.unlink', 'shutil.rmtree', 'sys.exit',
-                'os.chmod', 'os.chown', 'os.rename', 'os.renames',
-                'socket', 'urllib'
-            ]
-            
-            # 檢查每個關鍵字
-            for keyword in dangerous_keywords:
-                if keyword in script:
-                    return False, f"腳本包含不允許的關鍵字: {keyword}"
-                    
-            # 檢查是否只包含基本的 Python 語法
-            try:
-                tree = ast.parse(script)
-                for node in ast.walk(tree):
-                    # 檢查是否使用了不允許的語句類型
-                    if isinstance(node, (ast.Import, ast.ImportFrom)):
-                        module = node.names[0].name
-                        allowed_modules = {'requests','pandas', 'numpy', 'bs4','BeautifulSoup','csv','time', 'datetime', 'json', 're','webdriver','os','selenium','By','WebDriverWait','EC','ChromeDriverManager','TimeoutException','WebDriverException','Options','random','expected_conditions'}
-                        if module.split('.')[0] not in allowed_modules:
-                            return False, f"不允許導入模組: {module}"
-                            
-                    # 檢查是否使用了危險的函數調用
-                    elif isinstance(node, ast.Call):
-                        if isinstance(node.func, ast.Name):
-                            func_name = node.func.id
-                            if func_name in ['eval', 'exec', 'compile']:
-                                return False, f"不允許使用函數: {func_name}"
-                                
-            except Exception as e:
-                return False, f"腳本分析錯誤: {str(e)}"
-                
-            return True, ""
 
-        is_valid, error_message = is_valid_python_script(script)
+        # 客戶端可帶入 run_id，先連上 /api/script-runs/<run_id>/output 接收即時輸出
+        run_id = data.get('run_id') or uuid.uuid4().hex
+        # log-<日誌 id> 保留給排程執行
+        if not isinstance(run_id, str) or not RUN_ID_PATTERN.match(run_id) or run_id.startswith('log-'):
+            return jsonify({
+                'success': False,
+                'error': 'run_id 格式錯誤'
+            }), 400
+        if run_id in script_runner.registry:
+            return jsonify({
+                'success': False,
+                'run_id': run_id,
+                'error': 'run_id 已在執行中'
+            }), 409
+
+        # 驗證腳本（結果依腳本內容快取）
+        is_valid, error_message = script_validation.validate_script(script)
         if not is_valid:
             return jsonify({
                 'success': False,
                 'error': error_message
             }), 400
             
-        # 確保 CSV 檔名不包含副檔名
-        csv_name = csv_name.replace('.csv', '')
-        
         # 獲取當前腳本的目錄
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        # 建立臨時腳本文件
-        script_filename = os.path.join(current_dir, f'temp_script_{int(time.time())}.py')
+
+        # 腳本直接在記憶體中執行，不寫入檔案；名稱只用來識別這次執行，不會與同時執行的其他請求衝突
+        script_filename = os.path.join(current_dir, f'script_{uuid.uuid4().hex}.py')
         
         # 在腳本中添加必要的 import
         script_with_imports = """# -*- coding: utf-8 -*-
@@ -1875,7 +2860,7 @@ import time
 import os
 import sys
 import json
-
+""" + SCRIPT_FETCH_SETUP + """
 # 設置默認編碼
 if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
@@ -1884,107 +2869,88 @@ if sys.stderr.encoding != 'utf-8':
 
 """ + script + """
 
-# 保存數據到 CSV
+# 經由結果管道回傳數據，不寫入暫存檔
 if 'articles' in locals():
     try:
         if not articles:
             print('未找到任何文章數據')
             sys.exit(1)
-            
+
         if not isinstance(articles, list):
             print('articles 不是有效的列表格式')
             sys.exit(1)
-            
+
         # 將列表轉換為 DataFrame
         df = pd.DataFrame(articles)
-        
+
         if df.empty:
-            print('DataFrame 為空，無法保存')
-            sys.exit(1)
-            
-        # 清理數據
-        cleaned_data = []
-        for _, row in df.iterrows():
-            cleaned_row = {}
-            for col in df.columns:
-                value = row[col]
-                if pd.isna(value):
-                    cleaned_row[col] = None
-                elif isinstance(value, (np.int64, np.int32)):
-                    cleaned_row[col] = int(value)
-                elif isinstance(value, (np.float64, np.float32)):
-                    cleaned_row[col] = float(value)
-                else:
-                    cleaned_row[col] = str(value)
-            cleaned_data.append(cleaned_row)
-            
-        # 獲取腳本所在目錄
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-            
-        # 保存 CSV
-        csv_filename = '""" + csv_name + """.csv'
-        csv_path = os.path.join(current_dir, csv_filename)
-        
-        # 將清理後的數據轉換回 DataFrame
-        cleaned_df = pd.DataFrame(cleaned_data)
-        cleaned_df.to_csv(csv_path, index=False, encoding='utf-8')
-        
-        print(f'成功保存 CSV 到：{csv_path}')
-        print(f'CSV 欄位：{", ".join(cleaned_df.columns)}')
-        print(f'數據條數：{len(cleaned_df)}')
-        
-        # 驗證文件是否存在
-        if not os.path.exists(csv_path):
-            print(f'CSV 文件未成功創建：{csv_path}')
+            print('DataFrame 為空，無法回傳')
             sys.exit(1)
-            
-        # 嘗試讀取文件以驗證
-        try:
-            test_df = pd.read_csv(csv_path, encoding='utf-8')
-            print(f'CSV 文件驗證成功，包含 {len(test_df)} 條數據')
-        except Exception as e:
-            print(f'CSV 文件驗證失敗：{str(e)}')
-            sys.exit(1)
-            
+
+        # 清理數據（以欄位為單位轉換，不逐列 iterrows）並回傳
+        from data_utils import dataframe_to_rows
+        from script_runner import write_results
+        columns, cleaned_rows = dataframe_to_rows(df)
+        write_results(columns, cleaned_rows)
+
+        print(f'欄位：{", ".join(columns)}')
+        print(f'數據條數：{len(cleaned_rows)}')
+
     except Exception as e:
-        print(f'保存 CSV 時發生錯誤: {str(e)}')
+        print(f'回傳數據時發生錯誤: {str(e)}')
         sys.exit(1)
 else:
     print('未找到 articles 變量')
     sys.exit(1)
 """
 
-        print(f"Executing script with filename: {script_filename}")
-        
-        # 使用 utf-8 編碼寫入腳本
-        with open(script_filename, 'w', encoding='utf-8') as f:
-            f.write(script_with_imports)
+        print(f"Executing script: {script_filename}")
 
+        # 同一 run_id 的輸出仍在進行中時不覆蓋，避免正在讀取的客戶端遺失輸出
+        try:
+            run_output = run_outputs.start(run_id)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'run_id': run_id,
+                'error': 'run_id 已在執行中'
+            }), 409
+        run_status = 'failed'
         try:
             # 設置環境變量
-            env = os.environ.copy()
-            env.update({
+            env = {
                 "PYTHONIOENCODING": "utf-8",
                 "PYTHONLEGACYWINDOWSSTDIO": "utf-8",
                 "PYTHONPATH": current_dir
-            })
+            }
             
-            # 設定執行超時時間為 60 秒
-            result = subprocess.run(
-                ['python', '-X', 'utf8', script_filename],
-                capture_output=True,
-                text=True,
+            # 設定執行超時時間為 60 秒，由預先啟動的 worker 執行
+            result = script_runner.run_script(
+                script_filename,
+                cwd=current_dir,  # 設置工作目錄
                 timeout=60,
-                encoding='utf-8',
                 env=env,
-                cwd=current_dir  # 設置工作目錄
+                source=script_with_imports,
+                collect_results=True,
+                on_output=run_output.append,
+                run_id=run_id,
+                acquire_timeout=SCRIPT_INTERACTIVE_WAIT
             )
+            if result.timed_out:
+                raise subprocess.TimeoutExpired(script_filename, 60)
+            if result.cancelled:
+                run_status = 'cancelled'
+                return jsonify({
+                    'success': False,
+                    'run_id': run_id,
+                    'error': '腳本執行已被停止'
+                }), 409
 
             print(f"Script output: {result.stdout}")
             print(f"Script errors: {result.stderr}")
 
             if result.returncode != 0:
-                error_msg = result.stderr if result.stderr else result.stdout
+                error_msg = result.limit_error() or result.stderr or result.stdout
                 if "未找到任何文章數據" in error_msg:
                     error_msg = "未找到任何文章數據，請確認網頁結構是否正確"
                 elif "articles 不是有效的列表格式" in error_msg:
@@ -1999,62 +2965,53 @@ else:
                     error_msg = "連接到網站時發生錯誤，請檢查:\n1. 網路連接是否正常\n2. 網站是否可以正常訪問\n3. 是否需要使用代理伺服器"
                 raise Exception(f"腳本執行錯誤: {error_msg}")
             
-            # 檢查 CSV 文件是否生成
-            csv_filename = f"{csv_name}.csv"
-            csv_path = os.path.join(current_dir, csv_filename)
-            print(f"Checking for CSV file: {csv_path}")
-            
-            if not os.path.exists(csv_path):
-                print(f"CSV file not found at: {csv_path}")
+            # 讀取腳本經由結果管道回傳的數據
+            columns, rows = result.result_table()
+            if not columns:
                 raise Exception("未找到有效的文章數據，請確保爬取到的數據格式正確")
-
-            # 讀取 CSV 文件
-            print(f"Reading CSV file: {csv_path}")
-            df = pd.read_csv(csv_path, encoding='utf-8')
-            
-            if df.empty:
+            if not rows:
                 raise Exception("未找到有效的文章數據")
-            
-            # 轉換數據為 JSON 格式，處理特殊值
-            records = []
-            for _, row in df.iterrows():
-                record = {}
-                for col in df.columns:
-                    value = row[col]
-                    if pd.isna(value):
-                        record[col] = None
-                    else:
-                        record[col] = str(value)
-                records.append(record)
-
-            # 清理臨時文件
-            if os.path.exists(script_filename):
-                os.remove(script_filename)
-            if os.path.exists(csv_path):
-                os.remove(csv_path)
 
+            # 轉換數據為 JSON 格式，空值與空字串回傳 None，其餘轉為字串
+            records = [
+                {col: None if value is None or value == '' else str(value) for col, value in zip(columns, row)}
+                for row in rows
+            ]
+
+            run_status = 'success'
             return jsonify({
                 'success': True,
+                'run_id': run_id,
                 'data': records,
-                'columns': df.columns.tolist()
+                'columns': columns
             })
 
         except subprocess.TimeoutExpired:
-            if os.path.exists(script_filename):
-                os.remove(script_filename)
+            run_status = 'timeout'
             return jsonify({
                 'success': False,
+                'run_id': run_id,
                 'error': '腳本執行超時'
             }), 408
 
+        except script_runner.WorkerPoolBusy as e:
+            run_status = 'busy'
+            return jsonify({
+                'success': False,
+                'run_id': run_id,
+                'error': str(e)
+            }), 503
+
         except Exception as e:
-            if os.path.exists(script_filename):
-                os.remove(script_filename)
             return jsonify({
                 'success': False,
+                'run_id': run_id,
                 'error': str(e)
             }), 500
 
+        finally:
+            run_output.finish(run_status)
+
     except Exception as e:
         return jsonify({
             'success': False,
@@ -2099,7 +3056,7 @@ def delete_knowledge_base():
 @app.route('/api/prompts/system', methods=['GET'])
 def get_system_prompt():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = db.connect('database.db')
         c = conn.cursor()
         
         # 獲取聊天智能客服分類中最新的啟用提示詞
@@ -2149,99 +3106,152 @@ def get_chat_config():
         }), 500
 
 # 初始化排程器
-scheduler = BackgroundScheduler(timezone=pytz.timezone('Asia/Taipei'))
-scheduler.start()
+# 排程任務保存在 jobs.db，啟動時由 reconcile_schedule_jobs() 與 schedules 資料表同步
+# 任務觸發時只負責把執行請求放入 script_queue
+SCHEDULER_JOBSTORE_URL = os.getenv('SCHEDULER_JOBSTORE_URL', 'sqlite:///jobs.db')
+SCRIPT_MISFIRE_GRACE_TIME = int(os.getenv('SCRIPT_MISFIRE_GRACE_TIME', '300'))  # 秒
+# 錯過觸發時間（例如服務停機期間）的處理方式：
+#   run_once 在寬限時間內補執行一次（多次錯過也只執行一次），skip 不補執行
+SCHEDULE_MISFIRE_POLICY = os.getenv('SCHEDULE_MISFIRE_POLICY', 'run_once')
+
+def scheduler_job_defaults(policy):
+    """依錯過觸發的處理方式產生 APScheduler 的 job_defaults"""
+    if policy == 'skip':
+        return {'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 1}
+    if policy != 'run_once':
+        print(f"Unknown SCHEDULE_MISFIRE_POLICY '{policy}', using run_once")
+    return {'coalesce': True, 'max_instances': 1, 'misfire_grace_time': SCRIPT_MISFIRE_GRACE_TIME}
+
+def should_run_scheduler():
+    """
+    是否在此行程啟動排程器
+    debug 模式下 reloader 的父行程不處理請求，若也啟動排程器會與子行程重複觸發同一批持久化任務
+    """
+    if os.getenv('SCHEDULER_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return False
+    return not is_reloader_parent()
+
+scheduler = BackgroundScheduler(
+    jobstores={'default': SQLAlchemyJobStore(url=SCHEDULER_JOBSTORE_URL)},
+    timezone=pytz.timezone('Asia/Taipei'),
+    job_defaults=scheduler_job_defaults(SCHEDULE_MISFIRE_POLICY)
+)
+# 先以暫停狀態啟動，模組載入完成並同步任務後才開始觸發
+scheduler_enabled = should_run_scheduler()
+if scheduler_enabled:
+    scheduler.start(paused=True)
 
 # 在應用關閉時關閉排程器
-atexit.register(lambda: scheduler.shutdown())
+atexit.register(lambda: scheduler.shutdown() if scheduler.running else None)
+atexit.register(db.close_all)
 
 # API 路由
+SCHEDULE_COLUMNS = '''
+    id, name, type, script_size, COALESCE(schedule_display, schedule_time), frequency,
+    status, selected_days, next_run, last_run, result, error_message,
+    created_at, file_name, script_hash, priority, max_instances
+'''
+
+def schedule_row_to_dict(row):
+    """將 SCHEDULE_COLUMNS 查詢的資料列轉為列表 API 的格式"""
+    return {
+        'id': row[0],
+        'name': row[1],
+        'type': row[2],
+        'script_size': row[3],
+        'script_hash': row[14],
+        'schedule_time': row[4],
+        'frequency': row[5],
+        'status': row[6],
+        'selected_days': json.loads(row[7]) if row[7] and row[7].strip() else [],
+        'next_run': row[8],
+        'last_run': row[9],
+        'result': row[10],
+        'error_message': row[11],
+        'created_at': row[12],
+        'file_name': row[13],
+        'priority': row[15] or 0,
+        'max_instances': row[16] or 1
+    }
+
+def get_schedule_version(c):
+    c.execute('SELECT value FROM schedule_version WHERE id = 1')
+    row = c.fetchone()
+    return row[0] if row else 0
+
+def get_schedule_pruned_version(c):
+    """已清除刪除紀錄的最大版本號，since 早於此版本時無法得知期間刪除的排程"""
+    c.execute('SELECT pruned_version FROM schedule_version WHERE id = 1')
+    row = c.fetchone()
+    return row[0] if row else 0
+
 @app.route('/api/schedules', methods=['GET'])
 def get_schedules():
+    """
+    排程列表，回應標頭 X-Schedule-Version 為目前的版本號，ETag 依版本號產生，未變更時回傳 304
+    since=<版本號> 時只回傳該版本之後新增或修改的排程，以及已刪除的排程 ID：
+    {"version": 目前版本, "schedules": [...], "deleted": [...]}
+    since 早於已清除的刪除紀錄（超過 SCHEDULE_TOMBSTONE_RETENTION_DAYS）時回傳 "reset": true，客戶端需重新載入完整列表
+    """
+    conn = None
     try:
-        conn = sqlite3.connect('scripts.db')
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        since = int(request.args['since']) if 'since' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'since 必須是整數'}), 400
+
+    try:
+        conn = db.connect('scripts.db')
         c = conn.cursor()
-        c.execute('''
-            SELECT id, name, type, script_content, schedule_time, frequency, 
-                   status, selected_days, next_run, last_run, result, error_message,
-                   created_at, file_name
-            FROM schedules
-            ORDER BY created_at DESC
-        ''')
-        rows = c.fetchall()
-        
-        schedules = []
-        for row in rows:
-            schedule_time = row[4]
-            try:
-                # 先移除所有現有的描述文字
-                clean_time = re.sub(r'\([^)]*\)', '', schedule_time).strip()
-                
-                # 統一時間格式處理
-                if ':' in clean_time:
-                    # 如果包含完整日期
-                    if re.search(r'\d{4}[-/]\d{2}[-/]\d{2}', clean_time):
-                        date_match = re.search(r'(\d{4}[-/]\d{2}[-/]\d{2})', clean_time)
-                        time_match = re.search(r'(\d{2}:\d{2}(?::\d{2})?)', clean_time)
-                        
-                        if date_match and time_match:
-                            date_str = date_match.group(1).replace('/', '-')
-                            time_str = time_match.group(1)
-                            if time_str.count(':') == 1:
-                                time_str += ':00'
-                            formatted_time = f"{date_str} {time_str}"
-                        else:
-                            formatted_time = schedule_time
-                    else:
-                        time_str = re.search(r'(\d{2}:\d{2})', clean_time).group(1)
-                        today = datetime.now().strftime('%Y-%m-%d')
-                        formatted_time = f"{today} {time_str}:00"
-                else:
-                    formatted_time = schedule_time
-
-                # 根據頻率類型添加描述
-                if row[5] == 'once':
-                    formatted_time = f"{formatted_time} (單次執行)"
-                elif row[5] == 'daily':
-                    formatted_time = f"{formatted_time} (每日執行)"
-                elif row[5] == 'weekly' and row[7]:
-                    weekday_names = ['週日', '週一', '週二', '週三', '週四', '週五', '週六']
-                    selected_days = json.loads(row[7]) if row[7] else []
-                    weekdays = [weekday_names[day] for day in selected_days]
-                    formatted_time = f"{formatted_time} (每{','.join(weekdays)}執行)"
-                elif row[5] == 'monthly' and row[7]:
-                    selected_days = json.loads(row[7]) if row[7] else []
-                    days = [str(day) for day in selected_days]
-                    formatted_time = f"{formatted_time} (每月{','.join(days)}日執行)"
 
-            except Exception as e:
-                print(f"Error formatting time: {e}, original time: {schedule_time}")
-                formatted_time = schedule_time
+        # 只讀取版本號即可判斷內容是否變更，輪詢時大多直接回傳 304
+        version = get_schedule_version(c)
+        etag = f'schedules-{version}'
+        if request.query_string:
+            etag += '-' + hashlib.sha1(request.query_string).hexdigest()[:12]
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            response.headers['X-Schedule-Version'] = str(version)
+            return response
+
+        if since is not None:
+            if since > version or since < get_schedule_pruned_version(c):
+                # 版本號比目前還新（例如資料庫重建），或期間的刪除紀錄已清除，客戶端需要重新載入完整列表
+                response = jsonify({'version': version, 'reset': True, 'schedules': [], 'deleted': []})
+            else:
+                c.execute(f'''
+                    SELECT {SCHEDULE_COLUMNS}
+                    FROM schedules
+                    WHERE version > ?
+                    ORDER BY version
+                ''', (since,))
+                schedules = [schedule_row_to_dict(row) for row in c.fetchall()]
+                c.execute('SELECT schedule_id FROM schedule_tombstones WHERE version > ?', (since,))
+                deleted = [row[0] for row in c.fetchall()]
+                response = jsonify({'version': version, 'schedules': schedules, 'deleted': deleted})
+        else:
+            condition, params, limit_sql = keyset_clause([SCHEDULE_SORT_KEY, 'id'], page)
+            where = f'WHERE {condition}' if condition else ''
+            # 列表不含腳本內容，只回傳大小與雜湊，完整內容由 /api/schedules/<id> 取得
+            # 顯示用的排程時間在寫入時已產生
+            c.execute(f'''
+                SELECT {SCHEDULE_COLUMNS}
+                FROM schedules
+                {where}
+                ORDER BY {SCHEDULE_SORT_KEY} DESC, id DESC{limit_sql}
+            ''', params)
+            rows, next_cursor = paginate_rows(c.fetchall(), page, lambda row: (row[12] or '', row[0]))
+            response = with_next_cursor(jsonify([schedule_row_to_dict(row) for row in rows]), next_cursor)
+
+        response.set_etag(etag)
+        response.headers['X-Schedule-Version'] = str(version)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
 
-            try:
-                schedule = {
-                    'id': row[0],
-                    'name': row[1],
-                    'type': row[2],
-                    'script_content': row[3],
-                    'schedule_time': formatted_time,
-                    'frequency': row[5],
-                    'status': row[6],
-                    'selected_days': json.loads(row[7]) if row[7] and row[7].strip() else [],
-                    'next_run': row[8],
-                    'last_run': row[9],
-                    'result': row[10],
-                    'error_message': row[11],
-                    'created_at': row[12],
-                    'file_name': row[13] if len(row) > 13 else None
-                }
-                schedules.append(schedule)
-            except Exception as e:
-                print(f"Error processing row: {e}, row data: {row}")
-                continue
-            
-        return jsonify(schedules)
-        
     except Exception as e:
         print(f"Error fetching schedules: {e}")
         return jsonify({'error': str(e)}), 500
@@ -2253,7 +3263,7 @@ def get_schedules():
 def create_schedule():
     try:
         data = request.get_json()
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         try:
@@ -2291,26 +3301,35 @@ def create_schedule():
             next_run = calculate_next_run(frequency, data['schedule_time'], selected_days)
             selected_days_json = json.dumps(selected_days)
 
+            script_hash, script_size = script_digest(script_content)
+            priority, max_instances = parse_run_limits(data)
             c.execute('''
-                INSERT INTO schedules 
-                (name, type, script_content, schedule_time, frequency, status, 
-                 selected_days, next_run, created_at, file_name)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO schedules
+                (name, type, script_content, schedule_time, schedule_display, frequency, status,
+                 selected_days, next_run, created_at, file_name, script_hash, script_size,
+                 priority, max_instances)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 data['name'],
                 data['type'],
                 script_content,
                 data['schedule_time'],
+                format_schedule_display(data['schedule_time'], frequency, selected_days),
                 frequency,
                 'pending',
                 selected_days_json,
                 next_run,
                 datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                file_name
+                file_name,
+                script_hash,
+                script_size,
+                priority or 0,
+                max_instances or 1
             ))
             
             schedule_id = c.lastrowid
             conn.commit()
+            publish_schedule_change(schedule_id, 'created', 'pending')
 
             add_schedule_job(schedule_id, frequency, data['schedule_time'], selected_days)
             return jsonify({'message': '排程創建成功', 'id': schedule_id}), 201
@@ -2325,6 +3344,16 @@ def create_schedule():
         if conn:
             conn.close()
 
+def parse_run_limits(data):
+    """讀取排程的 priority 與 max_instances，未提供的欄位回傳 None"""
+    priority = data.get('priority')
+    max_instances = data.get('max_instances')
+    priority = int(priority) if priority not in (None, '') else None
+    max_instances = int(max_instances) if max_instances not in (None, '') else None
+    if max_instances is not None and max_instances < 1:
+        raise ValueError('max_instances 必須大於 0')
+    return priority, max_instances
+
 def calculate_next_run(frequency, schedule_time, selected_days=None):
     """計算下次執行時間"""
     try:
@@ -2415,7 +3444,7 @@ def calculate_next_run(frequency, schedule_time, selected_days=None):
 def save_schedule(schedule_id=None):
     try:
         data = request.get_json()
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         try:
@@ -2431,6 +3460,9 @@ def save_schedule(schedule_id=None):
 
             # 將 selected_days 轉換為 JSON 字符串
             selected_days_json = json.dumps(selected_days)
+            schedule_display = format_schedule_display(data['schedule_time'], data['frequency'], selected_days)
+            script_hash, script_size = script_digest(data['script_content'])
+            priority, max_instances = parse_run_limits(data)
 
             if schedule_id:  # 更新現有排程
                 # 如果沒有特別指定狀態，則設為 pending
@@ -2439,29 +3471,37 @@ def save_schedule(schedule_id=None):
                 c.execute('''
                     UPDATE schedules 
                     SET name = ?, type = ?, script_content = ?, 
-                        schedule_time = ?, frequency = ?, status = ?,
-                        selected_days = ?, next_run = ?
+                        schedule_time = ?, schedule_display = ?, frequency = ?, status = ?,
+                        selected_days = ?, next_run = ?,
+                        script_hash = ?, script_size = ?,
+                        priority = COALESCE(?, priority),
+                        max_instances = COALESCE(?, max_instances)
                     WHERE id = ?
                 ''', (
                     data['name'], data['type'], data['script_content'],
-                    data['schedule_time'], data['frequency'], 
+                    data['schedule_time'], schedule_display, data['frequency'],
                     status,
                     selected_days_json, next_run,
+                    script_hash, script_size,
+                    priority, max_instances,
                     schedule_id
                 ))
             else:  # 新增排程
                 c.execute('''
                     INSERT INTO schedules 
-                    (name, type, script_content, schedule_time, frequency, 
-                     status, selected_days, next_run)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    (name, type, script_content, schedule_time, schedule_display, frequency,
+                     status, selected_days, next_run, script_hash, script_size,
+                     priority, max_instances)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
                     data['name'], data['type'], data['script_content'],
-                    data['schedule_time'], data['frequency'], 'pending',
-                    selected_days_json, next_run
+                    data['schedule_time'], schedule_display, data['frequency'], 'pending',
+                    selected_days_json, next_run, script_hash, script_size,
+                    priority or 0, max_instances or 1
                 ))
 
             conn.commit()
+            publish_schedule_change(schedule_id or c.lastrowid, 'updated' if schedule_id else 'created')
             return jsonify({'message': '保存成功'}), 200
 
         except Exception as e:
@@ -2476,13 +3516,13 @@ def save_schedule(schedule_id=None):
 @app.route('/api/schedules/<int:schedule_id>', methods=['GET'])
 def get_schedule(schedule_id):
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         c.execute('''
-            SELECT id, name, type, script_content, schedule_time, frequency, 
+            SELECT id, name, type, script_content, schedule_time, frequency,
                    status, created_at, last_run, result, error_message, selected_days,
-                   file_name
-            FROM schedules 
+                   file_name, priority, max_instances
+            FROM schedules
             WHERE id = ?
         ''', (schedule_id,))
         row = c.fetchone()
@@ -2501,9 +3541,15 @@ def get_schedule(schedule_id):
                 'result': row[9],
                 'error_message': row[10],
                 'selected_days': json.loads(row[11]) if row[11] else [],  # 解析 JSON 字符串
-                'file_name': row[12]  # 添加 file_name 字段
+                'file_name': row[12],  # 添加 file_name 字段
+                'priority': row[13] or 0,
+                'max_instances': row[14] or 1
             }
-            return jsonify(schedule)
+            # 排程狀態會變動，以回應內容計算 ETag，內容未變時回傳 304
+            response = jsonify(schedule)
+            response.add_etag()
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
         else:
             return jsonify({'error': 'Schedule not found'}), 404
             
@@ -2529,15 +3575,23 @@ def update_schedule(id):
         tw = pytz.timezone('Asia/Taipei')
         schedule_time = schedule_time.astimezone(tw)
         
-        conn = sqlite3.connect('scripts.db')
+        script_hash, script_size = script_digest(script_content)
+        
+        conn = db.connect('scripts.db')
         c = conn.cursor()
+        c.execute('SELECT selected_days FROM schedules WHERE id = ?', (id,))
+        row = c.fetchone()
+        schedule_display = format_schedule_display(str(schedule_time), frequency, row[0] if row else None)
         c.execute('''
             UPDATE schedules 
             SET name = ?, type = ?, script_content = ?, 
-                schedule_time = ?, frequency = ?, file_name = ?
+                schedule_time = ?, schedule_display = ?, frequency = ?, file_name = ?,
+                script_hash = ?, script_size = ?
             WHERE id = ?
-        ''', (name, type, script_content, schedule_time, frequency, file_name, id))
+        ''', (name, type, script_content, schedule_time, schedule_display, frequency, file_name,
+              script_hash, script_size, id))
         conn.commit()
+        publish_schedule_change(id)
         
         # 更新排程器
         job_id = f'schedule_{id}'
@@ -2546,10 +3600,10 @@ def update_schedule(id):
             
         if frequency == 'once':
             scheduler.add_job(
-                execute_script,
+                schedule_jobs.run_schedule,
                 'date',
                 run_date=schedule_time,
-                args=[id, type, script_content],
+                args=[id],
                 id=job_id
             )
         else:
@@ -2560,9 +3614,9 @@ def update_schedule(id):
             }[frequency]
             
             scheduler.add_job(
-                execute_script,
+                schedule_jobs.run_schedule,
                 **trigger,
-                args=[id, type, script_content],
+                args=[id],
                 id=job_id
             )
         
@@ -2573,7 +3627,7 @@ def update_schedule(id):
 @app.route('/api/schedules/<int:id>', methods=['DELETE'])
 def delete_schedule(id):
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         # 先檢查排程是否存在
@@ -2585,6 +3639,7 @@ def delete_schedule(id):
         # 刪除資料庫中的排程
         c.execute('DELETE FROM schedules WHERE id = ?', (id,))
         conn.commit()
+        publish_schedule_change(id, 'deleted')
         
         # 嘗試從排程器中移除任務
         try:
@@ -2611,10 +3666,9 @@ tw_tz = pytz.timezone('Asia/Taipei')
 def execute_script(schedule_id, script_type, script_content):
     """執行排程腳本"""
     db_conn = None
-    process = None
     try:
         execution_start = time.time()
-        db_conn = sqlite3.connect('scripts.db')
+        db_conn = db.connect('scripts.db')
         cursor = db_conn.cursor()
         
         # 取得台灣時間
@@ -2631,13 +3685,18 @@ def execute_script(schedule_id, script_type, script_content):
             
             log_id = cursor.lastrowid
             db_conn.commit()
+            publish_schedule_log(schedule_id, log_id, 'active')
+
+            # 即時輸出可由 /api/script-runs/log-<log_id>/output 讀取
+            run_output = run_outputs.start(f'log-{log_id}')
+            result = None
+            final_status = 'failed'
             
-            # 創建臨時腳本文件
-            script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
-            if not os.path.exists(script_dir):
-                os.makedirs(script_dir)
-            
-            temp_script = os.path.join(script_dir, f'temp_script_{schedule_id}.py')
+            # 每次執行使用獨立的工作目錄，同一排程同時執行時不會互相覆蓋檔案
+            # 腳本內容直接交給 script_runner 執行，不寫入暫存檔
+            workspace = os.path.join(SCRIPT_RUNS_DIR, f'log-{log_id}')
+            os.makedirs(workspace, exist_ok=True)
+            script_path = os.path.join(workspace, 'script.py')
             
             # 分離 import 語句和主要代碼
             script_lines = script_content.splitlines()
@@ -2657,7 +3716,7 @@ import sys
 import threading
 import traceback
 sys.stdout.reconfigure(encoding='utf-8')
-
+{SCRIPT_FETCH_SETUP}
 # 用戶的 import 語句
 {chr(10).join(imports)}
 
@@ -2690,60 +3749,67 @@ if __name__ == '__main__':
         sys.exit(1)
 """
             
-            with open(temp_script, 'w', encoding='utf-8-sig') as f:
-                f.write(modified_script)
-            
             try:
                 # 執行腳本，設定環境變數確保使用 UTF-8 編碼
-                my_env = os.environ.copy()
-                my_env['PYTHONIOENCODING'] = 'utf-8'
-                
-                process = subprocess.Popen(
-                    ['python', temp_script],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding='utf-8',
-                    env=my_env,
-                    cwd=script_dir
+                # 以排程 ID 登記，停止或重新執行排程時可直接終止這次執行
+                result = script_runner.run_script(
+                    script_path,
+                    cwd=workspace,
+                    timeout=70,  # 給予額外的緩衝時間
+                    env={'PYTHONIOENCODING': 'utf-8', 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__))},
+                    source=modified_script,
+                    on_output=run_output.append,
+                    run_id=f'log-{log_id}',
+                    key=schedule_id
                 )
-                
-                try:
-                    stdout, stderr = process.communicate(timeout=70)  # 給予額外的緩衝時間
-                    
-                    if process.returncode == 0:
-                        # 執行成功
-                        duration = time.time() - execution_start
-                        end_time = datetime.now(tw_tz)
-                        end_time_str = end_time.strftime('%Y-%m-%d %H:%M:%S')
-                        
-                        cursor.execute('''
-                            UPDATE schedule_logs 
-                            SET status = 'success', duration = ?, error_message = NULL,
-                                execution_time = ?, content = ?
-                            WHERE id = ?
-                        ''', (duration, end_time_str, "排程任務執行成功", log_id))
-                        
-                        cursor.execute('''
-                            UPDATE schedules 
-                            SET status = 'completed', result = ?, error_message = NULL
-                            WHERE id = ?
-                        ''', (stdout.strip(), schedule_id))
-                    else:
-                        error_msg = stderr.strip() if stderr else stdout.strip() or "未知錯誤"
-                        raise Exception(error_msg)
-                        
-                except subprocess.TimeoutExpired:
-                    if process:
-                        process.kill()
+                stdout, stderr = result.stdout, result.stderr
+
+                if result.cancelled:
+                    raise script_runner.RunCancelled()
+                if result.timed_out:
                     raise TimeoutError("腳本執行超時（超過60秒）")
+
+                if result.returncode == 0:
+                    # 執行成功
+                    duration = time.time() - execution_start
+                    end_time = datetime.now(tw_tz)
+                    end_time_str = end_time.strftime('%Y-%m-%d %H:%M:%S')
+                    
+                    cursor.execute('''
+                        UPDATE schedule_logs 
+                        SET status = 'success', duration = ?, error_message = NULL,
+                            execution_time = ?, content = ?
+                        WHERE id = ?
+                    ''', (duration, end_time_str, "排程任務執行成功", log_id))
                     
+                    cursor.execute('''
+                        UPDATE schedules
+                        SET status = 'completed', result = ?, error_message = NULL
+                        WHERE id = ?
+                    ''', (stdout.strip(), schedule_id))
+                    final_status = 'completed'
+                else:
+                    error_msg = result.limit_error() or stderr.strip() or stdout.strip() or "未知錯誤"
+                    raise Exception(error_msg)
+
+            except script_runner.RunCancelled:
+                # 由停止或重新執行排程終止，排程狀態已由該操作更新，這裡只完成日誌
+                duration = time.time() - execution_start
+                end_time_str = datetime.now(tw_tz).strftime('%Y-%m-%d %H:%M:%S')
+                cursor.execute('''
+                    UPDATE schedule_logs
+                    SET status = 'failed', duration = ?, execution_time = ?,
+                        error_message = COALESCE(error_message, ?), content = ?
+                    WHERE id = ?
+                ''', (duration, end_time_str, "執行已被手動停止", "排程任務已停止", log_id))
+                final_status = 'cancelled'
+
             except Exception as e:
                 error = str(e)
                 duration = time.time() - execution_start
                 end_time = datetime.now(tw_tz)
                 end_time_str = end_time.strftime('%Y-%m-%d %H:%M:%S')
-                
+
                 error_message = f"執行失敗: {error}"
                 cursor.execute('''
                     UPDATE schedule_logs 
@@ -2753,24 +3819,36 @@ if __name__ == '__main__':
                 ''', (duration, error_message, end_time_str, "排程任務執行失敗", log_id))
                 
                 cursor.execute('''
-                    UPDATE schedules 
+                    UPDATE schedules
                     SET status = 'failed', error_message = ?
                     WHERE id = ?
                 ''', (error_message, schedule_id))
-                
+                final_status = 'failed'
+
             finally:
-                if os.path.exists(temp_script):
-                    try:
-                        os.remove(temp_script)
-                    except:
-                        pass
-                if process and process.poll() is None:
-                    try:
-                        process.kill()
-                    except:
-                        pass
-                    
+                # 腳本沒有留下檔案時移除工作目錄，有輸出檔案時保留
+                try:
+                    os.rmdir(workspace)
+                except OSError:
+                    pass
+                run_output.finish(final_status)
+
+            # 保存執行輸出（過長時只保留最後的部分）與資源用量
+            if result is not None:
+                usage = result.usage or {}
+                cursor.execute('''
+                    UPDATE schedule_logs
+                    SET output = ?, cpu_time = ?, peak_rss_kb = ?, io_read_bytes = ?, io_write_bytes = ?
+                    WHERE id = ?
+                ''', (
+                    format_run_output(result), usage.get('cpu_time'), usage.get('peak_rss_kb'),
+                    usage.get('io_read_bytes'), usage.get('io_write_bytes'), log_id
+                ))
+
             db_conn.commit()
+            publish_schedule_log(schedule_id, log_id, 'success' if final_status == 'completed' else 'failed')
+            if final_status != 'cancelled':
+                publish_schedule_change(schedule_id, status=final_status)
             
         except Exception as e:
             print(f"Database error: {e}")
@@ -2788,50 +3866,122 @@ if __name__ == '__main__':
                     WHERE id = ?
                 ''', (str(e), error_time, schedule_id))
                 db_conn.commit()
+                publish_schedule_change(schedule_id, status='failed')
             except Exception as inner_e:
                 print(f"Error updating error status: {inner_e}")
         raise
     finally:
-        if process and process.poll() is None:
-            try:
-                process.kill()
-            except:
-                pass
         if db_conn:
             db_conn.close()
 
+# 排程腳本執行佇列：限制同時執行的腳本數量，依優先順序執行
+SCRIPT_MAX_CONCURRENCY = int(os.getenv('SCRIPT_MAX_CONCURRENCY', '4'))
+SCRIPT_MAX_PENDING = int(os.getenv('SCRIPT_MAX_PENDING', '500'))
+SCRIPT_MANUAL_PRIORITY = int(os.getenv('SCRIPT_MANUAL_PRIORITY', '100'))
+# 腳本 worker 數量為佇列的並行上限再加上保留給 /api/execute-script 的 worker，排程執行不會佔滿所有 worker
+SCRIPT_INTERACTIVE_WORKERS = int(os.getenv('SCRIPT_INTERACTIVE_WORKERS', '1'))
+SCRIPT_INTERACTIVE_WAIT = int(os.getenv('SCRIPT_INTERACTIVE_WAIT', '30'))  # 秒，互動執行等待空閒 worker 的上限
+# 每次排程執行的工作目錄 temp/runs/log-<日誌 id>
+SCRIPT_RUNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'runs')
+
+script_queue = ScriptRunQueue(execute_script, max_workers=SCRIPT_MAX_CONCURRENCY, max_pending=SCRIPT_MAX_PENDING)
+atexit.register(script_queue.shutdown)
+script_runner.pool.resize(SCRIPT_MAX_CONCURRENCY + SCRIPT_INTERACTIVE_WORKERS)
+
+# 預先啟動執行腳本的 worker，並在背景為舊的腳本紀錄建立快取索引（reloader 的父行程不處理請求，不需要啟動）
+if not is_reloader_parent():
+    script_runner.prewarm()
+    script_cache.script_cache.backfill()
+atexit.register(script_runner.pool.close)
+
+def enqueue_schedule_run(schedule_id, priority=None):
+    """
+    讀取排程最新的腳本內容並放入執行佇列，回傳 Future；排程不存在時回傳 None
+    同一排程尚未開始的執行會合併，priority 未指定時使用排程設定
+    """
+    conn = None
+    try:
+        conn = db.connect('scripts.db')
+        c = conn.cursor()
+        c.execute('''
+            SELECT type, script_content, priority, max_instances
+            FROM schedules
+            WHERE id = ?
+        ''', (schedule_id,))
+        row = c.fetchone()
+    finally:
+        if conn:
+            conn.close()
+
+    if not row:
+        print(f"無法獲取排程 {schedule_id} 的資訊")
+        return None
+    script_type, script_content, schedule_priority, max_instances = row
+    return script_queue.submit(
+        schedule_id,
+        (schedule_id, script_type, script_content),
+        priority=(schedule_priority or 0) if priority is None else priority,
+        max_instances=max_instances or 1
+    )
+
+schedule_jobs.set_handler(enqueue_schedule_run)
+
+@app.route('/api/schedules/queue', methods=['GET'])
+def get_schedule_queue():
+    """排程執行佇列的深度、等待中與執行中的排程"""
+    return jsonify(script_queue.snapshot())
+
 @app.route('/api/validate_python', methods=['POST'])
 def validate_python():
     try:
         data = request.get_json()
         script = data.get('script', '')
-        
-        # 使用 ast.parse 進行語法檢查
-        import ast
-        ast.parse(script)
-        
+        if not isinstance(script, str):
+            return jsonify({'error': 'script 必須是字串'}), 400
+
+        # 語法檢查，與 /api/execute-script 共用驗證快取
+        error = script_validation.syntax_error(script)
+        if error:
+            return jsonify({'error': error}), 400
+
         return jsonify({'success': True})
-    except SyntaxError as e:
-        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 # 添加 SSE 端點
 @app.route('/api/sse')
 def sse():
+    """
+    推送排程（schedule）、排程日誌（schedule_log）與爬取任務（scrape_job）的變更事件
+    topics 參數以逗號分隔可只訂閱部分主題；沒有事件時阻塞等待，定期送出心跳
+    """
+    topics = [topic.strip() for topic in request.args.get('topics', '').split(',') if topic.strip()]
+    subscription = event_bus.subscribe(topics)
+    if subscription is None:
+        return jsonify({'error': 'SSE 連線數已達上限'}), 503
+
     def generate():
-        while True:
-            # 檢查是否有需要重新整理的信號
-            yield 'data: {"reload": false}\n\n'
-            time.sleep(1)
-    
-    return Response(generate(), mimetype='text/event-stream')
+        with subscription:
+            yield 'retry: 3000\n' + format_sse({'reload': False})
+            while True:
+                event = subscription.get(timeout=SSE_HEARTBEAT_INTERVAL)
+                if event is None:
+                    # 心跳，避免代理伺服器關閉閒置連線，也用來偵測客戶端斷線
+                    yield ': heartbeat\n\n'
+                    continue
+                topic, payload = event
+                yield format_sse(payload, topic)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # 添加停止排程的端點
 @app.route('/api/schedules/<int:schedule_id>/stop', methods=['POST'])
 def stop_schedule(schedule_id):
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         # 檢查排程是否存在
@@ -2849,8 +3999,9 @@ def stop_schedule(schedule_id):
                 result = '手動停止'
             WHERE id = ?
         ''', (now, schedule_id))
-        
+
         conn.commit()
+        publish_schedule_change(schedule_id, status='stopped')
 
         # 嘗試從排程器中移除任務
         try:
@@ -2860,7 +4011,16 @@ def stop_schedule(schedule_id):
         except Exception as e:
             print(f"Warning: Could not remove job from scheduler: {e}")
 
-        return jsonify({'success': True, 'message': '排程已停止', 'status': 'stopped'})
+        # 取消佇列中尚未開始的執行，並終止執行中的腳本
+        script_queue.cancel_pending(schedule_id)
+        cancelled_runs = script_runner.cancel_runs(schedule_id)
+
+        return jsonify({
+            'success': True,
+            'message': '排程已停止',
+            'status': 'stopped',
+            'cancelled_runs': cancelled_runs
+        })
 
     except Exception as e:
         print(f"Error stopping schedule: {e}")
@@ -2872,11 +4032,11 @@ def stop_schedule(schedule_id):
 @app.route('/api/schedules/<int:schedule_id>/restart', methods=['POST'])
 def restart_schedule(schedule_id):
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         # 檢查排程是否存在
-        c.execute('SELECT type, script_content FROM schedules WHERE id = ?', (schedule_id,))
+        c.execute('SELECT frequency, schedule_time, selected_days FROM schedules WHERE id = ?', (schedule_id,))
         schedule = c.fetchone()
         if not schedule:
             return jsonify({'error': '找不到排程'}), 404
@@ -2891,8 +4051,13 @@ def restart_schedule(schedule_id):
                 error_message = NULL
             WHERE id = ?
         ''', (now, schedule_id))
-        
+
         conn.commit()
+        publish_schedule_change(schedule_id, status='active')
+
+        # 停止排程時已移除排程任務，重新加入排程器
+        frequency, schedule_time, selected_days = schedule
+        add_schedule_job(schedule_id, frequency, schedule_time, parse_selected_days(selected_days))
 
         # 返回成功訊息
         return jsonify({
@@ -2912,7 +4077,7 @@ def restart_schedule(schedule_id):
 def run_schedule_now(schedule_id):
     conn = None
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         # 檢查排程狀態
@@ -2930,21 +4095,10 @@ def run_schedule_now(schedule_id):
         
         # 如果排程正在執行中，先清理現有執行
         if status == 'active':
-            # 先嘗試終止可能存在的進程
-            try:
-                script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
-                temp_script = os.path.join(script_dir, f'temp_script_{schedule_id}.py')
-                if os.path.exists(temp_script):
-                    if os.name == 'nt':
-                        os.system(f'taskkill /F /IM python.exe /FI "WINDOWTITLE eq {temp_script}"')
-                    else:
-                        os.system(f'pkill -f {temp_script}')
-                    try:
-                        os.remove(temp_script)
-                    except:
-                        pass
-            except Exception as e:
-                print(f"Error killing process: {e}")
+            # 終止這個排程執行中的腳本
+            cancelled_runs = script_runner.cancel_runs(schedule_id)
+            if cancelled_runs:
+                print(f"Cancelled {cancelled_runs} running script(s) of schedule {schedule_id}")
 
             # 更新之前未完成的執行狀態
             c.execute('''
@@ -2960,11 +4114,12 @@ def run_schedule_now(schedule_id):
                 SET status = 'failed',
                     error_message = '執行被新的任務中斷',
                     content = '任務被中斷'
-                WHERE schedule_id = ? 
+                WHERE schedule_id = ?
                 AND status = 'active'
             ''', (schedule_id,))
-            
+
             conn.commit()
+            publish_schedule_change(schedule_id, status='failed')
         
         # 檢查執行間隔
         if last_run:
@@ -2989,12 +4144,16 @@ def run_schedule_now(schedule_id):
                 last_run = datetime('now', 'localtime')
             WHERE id = ?
         ''', (schedule_id,))
-        
+
         conn.commit()
+        publish_schedule_change(schedule_id, status='active')
 
         try:
-            # 執行腳本
-            execute_script(schedule_id, script_type, script_content)
+            # 執行腳本（經由執行佇列，手動執行優先於排程觸發）
+            future = enqueue_schedule_run(schedule_id, priority=SCRIPT_MANUAL_PRIORITY)
+            if future is None:
+                raise Exception('找不到排程')
+            future.result()
             return jsonify({'success': True, 'message': '排程執行成功'})
             
         except Exception as e:
@@ -3006,6 +4165,7 @@ def run_schedule_now(schedule_id):
                 WHERE id = ?
             ''', (error_message, schedule_id))
             conn.commit()
+            publish_schedule_change(schedule_id, status='failed')
             return jsonify({'error': error_message}), 500
             
     except Exception as e:
@@ -3019,6 +4179,7 @@ def run_schedule_now(schedule_id):
                     WHERE id = ?
                 ''', (str(e), schedule_id))
                 conn.commit()
+                publish_schedule_change(schedule_id, status='failed')
             except:
                 pass
         return jsonify({'error': str(e)}), 500
@@ -3034,7 +4195,7 @@ def run_schedule_now(schedule_id):
 def check_schedule_status(schedule_id):
     conn = None
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         # 檢查排程狀態
@@ -3071,8 +4232,9 @@ def check_schedule_status(schedule_id):
                 error_message = '之前的執行已被重置'
             WHERE id = ? AND status IN ('active', 'pending')
         ''', (schedule_id,))
-        
+
         conn.commit()
+        publish_schedule_change(schedule_id)
         return jsonify({'success': True})
         
     except Exception as e:
@@ -3084,21 +4246,32 @@ def check_schedule_status(schedule_id):
 
 @app.route('/api/schedules/<int:schedule_id>/logs', methods=['GET'])
 def get_schedule_logs(schedule_id):
+    conn = None
+    try:
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
-        # 獲取排程的所有日誌
-        c.execute('''
-            SELECT l.*, s.name as schedule_name 
+        # 獲取排程的日誌，帶 limit/cursor 時依 (execution_time, id) 分頁
+        condition, params, limit_sql = keyset_clause(['l.execution_time', 'l.id'], page)
+        where = f'AND {condition}' if condition else ''
+        c.execute(f'''
+            SELECT l.id, l.schedule_id, l.execution_time, l.status, l.content, l.duration,
+                   l.error_message, l.created_at, s.name as schedule_name, l.output IS NOT NULL,
+                   l.cpu_time, l.peak_rss_kb, l.io_read_bytes, l.io_write_bytes
             FROM schedule_logs l
             JOIN schedules s ON l.schedule_id = s.id
-            WHERE l.schedule_id = ?
-            ORDER BY l.execution_time DESC
-        ''', (schedule_id,))
+            WHERE l.schedule_id = ? {where}
+            ORDER BY l.execution_time DESC, l.id DESC{limit_sql}
+        ''', [schedule_id] + params)
+        rows, next_cursor = paginate_rows(c.fetchall(), page, lambda row: (row[2], row[0]))
         
         logs = []
-        for row in c.fetchall():
+        for row in rows:
             logs.append({
                 'id': row[0],
                 'schedule_id': row[1],
@@ -3108,10 +4281,16 @@ def get_schedule_logs(schedule_id):
                 'duration': row[5],
                 'error_message': row[6],
                 'created_at': row[7],
-                'schedule_name': row[8]
+                'schedule_name': row[8],
+                'has_output': bool(row[9]),
+                'cpu_time': row[10],
+                'peak_rss_kb': row[11],
+                'io_read_bytes': row[12],
+                'io_write_bytes': row[13],
+                'run_id': f'log-{row[0]}'
             })
-        
-        return jsonify(logs)
+
+        return with_next_cursor(jsonify(logs), next_cursor)
         
     except Exception as e:
         print(f"Error fetching logs: {e}")
@@ -3120,6 +4299,95 @@ def get_schedule_logs(schedule_id):
         if conn:
             conn.close()
 
+@app.route('/api/schedules/usage', methods=['GET'])
+def get_schedule_usage():
+    """
+    最近 days 天（預設 7 天）各排程的執行次數與資源用量，依 CPU 時間總和排序，
+    用來找出最耗資源的排程與規劃容量
+    """
+    conn = None
+    try:
+        days = int(request.args.get('days', 7))
+        if days < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'days 必須是正整數'}), 400
+
+    try:
+        since = (datetime.now(pytz.timezone('Asia/Taipei')) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        conn = db.connect('scripts.db')
+        c = conn.cursor()
+        c.execute('''
+            SELECT l.schedule_id, s.name, COUNT(*),
+                   SUM(l.duration), SUM(l.cpu_time), AVG(l.cpu_time), MAX(l.cpu_time),
+                   MAX(l.peak_rss_kb), SUM(l.io_read_bytes), SUM(l.io_write_bytes)
+            FROM schedule_logs l
+            JOIN schedules s ON l.schedule_id = s.id
+            WHERE l.execution_time >= ? AND l.status != 'active'
+            GROUP BY l.schedule_id
+            ORDER BY SUM(l.cpu_time) DESC
+        ''', (since,))
+        usage = [{
+            'schedule_id': row[0],
+            'schedule_name': row[1],
+            'runs': row[2],
+            'total_duration': row[3],
+            'total_cpu_time': row[4],
+            'avg_cpu_time': row[5],
+            'max_cpu_time': row[6],
+            'max_peak_rss_kb': row[7],
+            'total_io_read_bytes': row[8],
+            'total_io_write_bytes': row[9]
+        } for row in c.fetchall()]
+        return jsonify({'days': days, 'schedules': usage})
+    except Exception as e:
+        print(f"Error fetching schedule usage: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/api/schedules/<int:schedule_id>/logs/<int:log_id>', methods=['GET'])
+def get_schedule_log(schedule_id, log_id):
+    """單筆排程日誌，包含腳本執行的輸出"""
+    conn = None
+    try:
+        conn = db.connect('scripts.db')
+        c = conn.cursor()
+        c.execute('''
+            SELECT id, schedule_id, execution_time, status, content, duration,
+                   error_message, created_at, output,
+                   cpu_time, peak_rss_kb, io_read_bytes, io_write_bytes
+            FROM schedule_logs
+            WHERE id = ? AND schedule_id = ?
+        ''', (log_id, schedule_id))
+        row = c.fetchone()
+        if not row:
+            return jsonify({'error': '找不到日誌'}), 404
+
+        return jsonify({
+            'id': row[0],
+            'schedule_id': row[1],
+            'execution_time': row[2],
+            'status': row[3],
+            'content': row[4],
+            'duration': row[5],
+            'error_message': row[6],
+            'created_at': row[7],
+            'output': row[8],
+            'cpu_time': row[9],
+            'peak_rss_kb': row[10],
+            'io_read_bytes': row[11],
+            'io_write_bytes': row[12],
+            'run_id': f'log-{row[0]}'
+        })
+    except Exception as e:
+        print(f"Error fetching log: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
 def add_schedule_job(schedule_id, frequency, schedule_time, selected_days=None):
     """添加排程任務到 APScheduler"""
     try:
@@ -3178,36 +4446,13 @@ def add_schedule_job(schedule_id, frequency, schedule_time, selected_days=None):
         else:
             raise ValueError(f'不支援的頻率類型: {frequency}')
 
-        # 修改執行函數，確保數據庫連接在函數內部處理
-        def job_function(schedule_id=schedule_id):
-            conn = None
-            try:
-                conn = sqlite3.connect('scripts.db')
-                c = conn.cursor()
-                c.execute('''
-                    SELECT type, script_content
-                    FROM schedules
-                    WHERE id = ?
-                ''', (schedule_id,))
-                row = c.fetchone()
-                if row:
-                    script_type, script_content = row
-                    execute_script(schedule_id, script_type, script_content)
-                else:
-                    print(f"無法獲取排程 {schedule_id} 的資訊")
-            except Exception as e:
-                print(f"Error in job execution: {e}")
-            finally:
-                if conn:
-                    conn.close()
-
-        # 添加任務到排程器
+        # 添加任務到排程器，觸發時由 enqueue_schedule_run 讀取最新的腳本內容並放入執行佇列
         scheduler.add_job(
-            job_function,
+            schedule_jobs.run_schedule,
             trigger=trigger,
             id=job_id,
             replace_existing=True,
-            args=[]  # 不需要傳遞參數，因為已經在閉包中捕獲
+            args=[schedule_id]
         )
 
         print(f"Successfully added schedule job: {job_id}")
@@ -3217,6 +4462,53 @@ def add_schedule_job(schedule_id, frequency, schedule_time, selected_days=None):
         print(f"Error adding schedule job: {e}")
         return False
 
+def parse_selected_days(selected_days):
+    """解析資料表中以 JSON 儲存的執行日期"""
+    return json.loads(selected_days) if selected_days and selected_days.strip() else []
+
+def reconcile_schedule_jobs():
+    """
+    啟動時依 schedules 資料表同步 jobs.db 中的排程任務：
+    補上遺失或格式過舊的任務，移除已停止、已執行完畢的單次排程或已刪除排程的任務。
+    已存在的任務保留原本的下次觸發時間，停機期間錯過的觸發依 SCHEDULE_MISFIRE_POLICY 處理
+    """
+    conn = None
+    try:
+        conn = db.connect('scripts.db')
+        c = conn.cursor()
+        c.execute('SELECT id, frequency, schedule_time, selected_days, status FROM schedules')
+        rows = c.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+    job_ref = f'{schedule_jobs.run_schedule.__module__}:{schedule_jobs.run_schedule.__qualname__}'
+    jobs = {job.id: job for job in scheduler.get_jobs()}
+    wanted = set()
+    added = 0
+    for schedule_id, frequency, schedule_time, selected_days, status in rows:
+        if status == 'stopped' or (frequency == 'once' and status in ('completed', 'failed')):
+            continue
+        job_id = f'schedule_{schedule_id}'
+        wanted.add(job_id)
+        job = jobs.get(job_id)
+        if job is not None and job.func_ref == job_ref:
+            continue
+        try:
+            days = parse_selected_days(selected_days)
+        except ValueError:
+            days = []
+        if add_schedule_job(schedule_id, frequency, schedule_time, days):
+            added += 1
+
+    removed = 0
+    for job_id in jobs:
+        if job_id.startswith('schedule_') and job_id not in wanted:
+            scheduler.remove_job(job_id)
+            removed += 1
+
+    print(f"Schedule jobs reconciled: {len(wanted)} active, {added} added, {removed} removed")
+
 # 添加批量刪除路由
 @app.route('/api/schedules/batch', methods=['DELETE'])
 def batch_delete_schedules():
@@ -3225,7 +4517,7 @@ def batch_delete_schedules():
         if not data or 'ids' not in data or not data['ids']:
             return jsonify({'error': '未提供要刪除的ID列表'}), 400
             
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         # 將 ID 列表轉換為 SQL 安全的格式
@@ -3234,6 +4526,8 @@ def batch_delete_schedules():
         # 執行批量刪除
         c.execute(f'DELETE FROM schedules WHERE id IN ({id_list})', data['ids'])
         conn.commit()
+        for schedule_id in data['ids']:
+            publish_schedule_change(schedule_id, 'deleted')
         
         # 從排程器中移除任務
         for schedule_id in data['ids']:
@@ -3261,7 +4555,7 @@ def batch_delete_schedules():
 @app.route('/api/schedules/<int:schedule_id>', methods=['GET'])
 def get_schedule_status(schedule_id):
     try:
-        conn = sqlite3.connect('scripts.db')
+        conn = db.connect('scripts.db')
         c = conn.cursor()
         
         c.execute('''
@@ -3288,5 +4582,10 @@ def get_schedule_status(schedule_id):
         if conn:
             conn.close()
 
+# 同步排程任務後才開始觸發
+if scheduler_enabled:
+    reconcile_schedule_jobs()
+    scheduler.resume()
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=APP_DEBUG, use_reloader=APP_USE_RELOADER)
\ No newline at end of file
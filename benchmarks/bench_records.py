@@ -0,0 +1,83 @@
+"""
+/api/execute-script 回傳資料轉換的效能測試
+
+比較原本腳本包裝中逐列 iterrows() 清理資料的方式與 data_utils.dataframe_to_rows 的欄位式轉換，
+並確認 API 最終回傳的資料（缺失值為 None，其餘轉為字串）完全相同
+
+執行方式：python benchmarks/bench_records.py [列數 ...]
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_utils import dataframe_to_rows  # noqa: E402
+
+
+def iterrows_rows(df):
+    """原本腳本包裝中的清理方式"""
+    cleaned_data = []
+    for _, row in df.iterrows():
+        cleaned_row = {}
+        for col in df.columns:
+            value = row[col]
+            if pd.isna(value):
+                cleaned_row[col] = None
+            elif isinstance(value, (np.int64, np.int32)):
+                cleaned_row[col] = int(value)
+            elif isinstance(value, (np.float64, np.float32)):
+                cleaned_row[col] = float(value)
+            else:
+                cleaned_row[col] = str(value)
+        cleaned_data.append(cleaned_row)
+    return [str(col) for col in df.columns], [list(row.values()) for row in cleaned_data]
+
+
+def make_articles(rows):
+    """爬蟲腳本常見的 articles：文字、網址、日期、整數與含缺失值的浮點數"""
+    rng = random.Random(rows)
+    return pd.DataFrame([{
+        "title": f"Article {i}",
+        "link": f"https://example.com/articles/{i}",
+        "date": "2025-01-17" if i % 3 else None,
+        "views": rng.randrange(100000),
+        "score": rng.random() if i % 4 else float('nan'),
+    } for i in range(rows)])
+
+
+def api_view(rows):
+    """API 回傳前的處理：缺失值為 None，其餘轉為字串"""
+    return [[None if value is None else str(value) for value in row] for row in rows]
+
+
+def timed(func, df, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    print(f"{'rows':>8}{'iterrows':>14}{'columnar':>12}{'speedup':>10}")
+    for rows in sizes:
+        df = make_articles(rows)
+        legacy_time, (legacy_columns, expected) = timed(iterrows_rows, df, repeat=1)
+        columnar_time, (columns, actual) = timed(dataframe_to_rows, df)
+        assert columns == legacy_columns
+        assert api_view(actual) == api_view(expected), f"{rows}: output mismatch"
+        print(f"{rows:>8}{legacy_time * 1000:>12.1f}ms{columnar_time * 1000:>10.1f}ms"
+              f"{legacy_time / columnar_time:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+爬取結果的資料整理工具：解析、標準化與去重
+
+app.py 的智能爬取流程與 execute-script 的結果轉換共用這些函數
+"""
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def parse_data(data):
+    """解析不同格式的数据"""
+    try:
+        # 处理字符串类型的数据
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except json.JSONDecodeError:
+                return [{"content": data}]
+
+        # 处理字典类型的数据
+        if isinstance(data, dict):
+            # 如果是单个项目的字典
+            if any(key in data for key in ['content', 'title', 'link', 'description']):
+                return [data]
+            # 如果包含数据列表，直接返回列表内容
+            for key in ['articles', 'items', 'results', 'data']:
+                if key in data and isinstance(data[key], list):
+                    # 确保列表中的每个项目都是字典格式
+                    return [
+                        item if isinstance(item, dict) else {"content": str(item)}
+                        for item in data[key]
+                    ]
+            # 其他情况，将整个字典作为一个项目
+            return [data]
+
+        # 如果已经是列表
+        if isinstance(data, list):
+            # 确保列表中的每个项目都是字典格式
+            return [
+                item if isinstance(item, dict) else {"content": str(item)}
+                for item in data
+            ]
+
+        # 其他类型转换为字符串
+        return [{"content": str(data)}]
+
+    except Exception as e:
+        logger.error(f"Error parsing data: {str(e)}")
+        return [{"error": str(e)}]
+
+
+def normalize_item(item):
+    """标准化单个数据项"""
+    try:
+        if isinstance(item, str):
+            return [{"content": item.strip()}]
+
+        if isinstance(item, dict):
+            # 检查是否有数组字段需要展开
+            array_fields = []
+            max_length = 1
+            normalized_base = {}
+
+            # 处理每个字段
+            for key, value in item.items():
+                if value is not None:
+                    if isinstance(value, list):
+                        array_fields.append((key, value))
+                        max_length = max(max_length, len(value))
+                    else:
+                        normalized_base[key] = str(value).strip()
+
+            # 如果没有数组字段，直接返回单个对象
+            if not array_fields:
+                return [normalized_base] if normalized_base else [{"content": str(item)}]
+
+            # 展开数组字段生成多行数据
+            result = []
+            for i in range(max_length):
+                row = normalized_base.copy()
+                for field, values in array_fields:
+                    row[field] = str(values[i]) if i < len(values) else ""
+                result.append(row)
+
+            return result
+
+        return [{"content": str(item)}]
+
+    except Exception as e:
+        logger.error(f"Error normalizing item: {str(e)}")
+        return [{"error": str(e)}]
+
+
+def row_identity(item):
+    """資料列的唯一標識，忽略空值欄位"""
+    return tuple(sorted([
+        (k, v) for k, v in item.items()
+        if v is not None and str(v).strip()
+    ]))
+
+
+def dedupe_rows(rows):
+    """依欄位內容去除重複的資料列，保留第一次出現的順序"""
+    final_data = []
+    seen = set()
+    for item in rows:
+        # 创建唯一标识
+        item_values = row_identity(item)
+
+        if item_values not in seen:
+            seen.add(item_values)
+            final_data.append(item)
+    return final_data
+
+
+def normalize_and_dedupe(items):
+    """標準化並去重 parse_data 的結果"""
+    normalized = []
+    for item in items:
+        normalized.extend(normalize_item(item))
+    return dedupe_rows(normalized)
+
+
+def _json_safe_column(series):
+    """
+    將一個欄位轉為 JSON 可序列化的 Python 值列表：
+    缺失值（None、NaN、NaT、pd.NA）為 None，整數與浮點數欄位為 int / float，其餘欄位為 str
+    """
+    values = series.to_numpy(dtype=object)
+    if series.dtype.kind not in 'iuf':
+        values = np.fromiter(map(str, values), dtype=object, count=len(values))
+    mask = series.isna().to_numpy()
+    if mask.any():
+        values[mask] = None
+    return values.tolist()
+
+
+def dataframe_to_rows(df):
+    """
+    以欄位為單位轉換 DataFrame，回傳 (欄位名稱列表, 資料列列表)，每列為依欄位順序的值列表
+
+    與逐列 iterrows() 清理的規則相同（缺失值為 None、numpy 整數與浮點數轉為 int / float、其餘轉為字串），
+    但型別依欄位 dtype 判斷，不受 iterrows 將整列提升為同一型別的影響
+    """
+    columns = [str(col) for col in df.columns]
+    converted = [_json_safe_column(df.iloc[:, i]) for i in range(df.shape[1])]
+    return columns, [list(row) for row in zip(*converted)]
+
+
+def dataframe_to_records(df):
+    """同 dataframe_to_rows，回傳 {欄位: 值} 字典列表"""
+    columns, rows = dataframe_to_rows(df)
+    return [dict(zip(columns, row)) for row in rows]
@@ -0,0 +1,150 @@
+"""
+SQLite 連線管理
+
+所有資料庫（scripts.db、database.db、prompts.db）都透過 connect() 取得連線。
+連線以資料庫路徑分池重用，close() 會把連線歸還連線池而不是真正關閉，
+因此每次請求不需重新開檔、讀取 schema，已編譯的 SQL 語句也能在同一連線上重用。
+
+新建連線時統一設定 WAL 日誌模式與相關 PRAGMA，可用環境變數調整：
+  SQLITE_POOL_SIZE       每個資料庫保留的閒置連線數（預設 8）
+  SQLITE_SYNCHRONOUS     synchronous 設定（預設 NORMAL，WAL 模式下安全）
+  SQLITE_CACHE_SIZE_KB   每個連線的頁面快取大小（預設 8192 KB）
+  SQLITE_BUSY_TIMEOUT_MS 資料庫被鎖定時的等待時間（預設 5000 ms）
+  SQLITE_STATEMENT_CACHE 每個連線快取的已編譯語句數（預設 256）
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '8'))
+SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '8192'))
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PooledConnection(sqlite3.Connection):
+    """close() 時歸還連線池的 sqlite3 連線，其餘行為與 sqlite3.Connection 相同"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.checked_out = False
+
+    def close(self):
+        if self.pool is None or not self.checked_out:
+            # 未由連線池管理，或已經歸還過
+            if self.pool is None:
+                super().close()
+            return
+        self.checked_out = False
+        self.pool.release(self)
+
+    def discard(self):
+        """真正關閉連線，不放回連線池"""
+        self.checked_out = False
+        super().close()
+
+
+class ConnectionPool:
+    """單一資料庫檔案的連線池，閒置連線以後進先出的方式重用"""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE,
+            factory=PooledConnection,
+        )
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={SYNCHRONOUS}')
+            conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+            conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            conn.execute('PRAGMA temp_store=MEMORY')
+        except sqlite3.Error as e:
+            # PRAGMA 設定失敗（例如唯讀檔案系統）時仍可使用預設設定
+            logger.warning(f"Failed to apply pragmas on {self.path}: {str(e)}")
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            conn = self._open()
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        try:
+            # 歸還前撤銷未提交的交易並還原連線層級的設定
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            conn.text_factory = str
+        except sqlite3.Error:
+            conn.discard()
+            return
+
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        conn.discard()
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.discard()
+
+
+def get_pool(path):
+    """取得資料庫檔案對應的連線池"""
+    key = os.path.abspath(path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(path))
+    return pool
+
+
+def connect(path):
+    """
+    取得資料庫連線，用法與 sqlite3.connect(path) 相同，
+    使用完畢呼叫 close() 即歸還連線池
+    """
+    return get_pool(path).acquire()
+
+
+def close_all():
+    """關閉所有連線池中的閒置連線"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+def _reset_after_fork():
+    # 子行程不可沿用父行程的 SQLite 連線，直接丟棄連線池（不關閉，避免影響父行程）
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,99 @@
+"""
+行程內事件匯流排
+
+排程狀態變更、排程日誌寫入與爬取任務進度透過 publish() 發布，
+/api/sse 的每個連線以 subscribe() 取得訂閱並阻塞等待事件，不再每秒輪詢。
+
+每個訂閱有固定長度的佇列，消費太慢導致佇列滿時會丟棄舊事件，
+並在下一次讀取時回傳 reload 事件，讓前端重新載入完整資料。
+"""
+import queue
+import threading
+import time
+
+# 訂閱端落後時送出的事件，前端收到後重新載入資料
+RELOAD_TOPIC = 'reload'
+
+
+class Subscription:
+    """單一 SSE 連線的訂閱，topics 為 None 時接收所有事件"""
+
+    def __init__(self, bus, topics, queue_size):
+        self.bus = bus
+        self.topics = frozenset(topics) if topics else None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lagged = False
+        self.closed = False
+
+    def wants(self, topic):
+        return self.topics is None or topic in self.topics
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.lagged = True
+
+    def get(self, timeout=None):
+        """
+        等待下一個事件，回傳 (topic, payload)；逾時回傳 None
+        佇列曾經滿出時先清空佇列並回傳 reload 事件
+        """
+        if self.lagged:
+            self.lagged = False
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            return RELOAD_TOPIC, {'reload': True}
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EventBus:
+    """執行緒安全的發布/訂閱，訂閱數量有上限"""
+
+    def __init__(self, max_subscribers=100, queue_size=256):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, topics=None):
+        """建立訂閱，已達上限時回傳 None"""
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self, topics, self.queue_size)
+            self.subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, topic, payload=None):
+        """發布事件給所有訂閱此主題的連線，不會阻塞"""
+        event = (topic, dict(payload or {}, timestamp=time.time()))
+        with self.lock:
+            subscribers = [s for s in self.subscribers if s.wants(topic)]
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
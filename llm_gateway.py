@@ -0,0 +1,448 @@
+"""
+語言模型呼叫閘道
+
+ChatGPT、Gemini、Ollama 的呼叫都經過這裡，在背景執行緒的 asyncio 事件迴圈中以非同步客戶端執行：
+  - 客戶端依 API key / 伺服器位址重複使用，不再每次呼叫都建立新的連線
+  - 每個供應商有各自的並行上限，超過時在事件迴圈中排隊，不佔用額外的 Flask 執行緒或連線
+  - 每次嘗試有逾時，逾時、連線錯誤、429 與 5xx 以指數退避重試
+  - 所有呼叫的次數、錯誤、重試與耗時集中在 _record() 記錄，stats() 取得統計
+Flask 的請求執行緒只呼叫 generate() 等待結果，或以 stream() 逐段取得產生中的文字。
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+import google.generativeai as genai
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', '1.0'))  # 秒，第 n 次重試等待 backoff * 2^(n-1)
+LLM_RETRY_BACKOFF_MAX = 30.0
+
+# 各供應商的預設並行上限與單次嘗試逾時（秒），可用環境變數覆寫，例如 LLM_OLLAMA_CONCURRENCY
+PROVIDER_DEFAULTS = {
+    'openai': {'concurrency': 8, 'timeout': 120},
+    'gemini': {'concurrency': 4, 'timeout': 120},
+    'ollama': {'concurrency': 2, 'timeout': 300},
+    # 本機嵌入模型（Ollama /api/embed），與產生文字分開限制，避免排在長時間的產生請求後面
+    'ollama_embed': {'concurrency': 4, 'timeout': 10},
+}
+# 可用於 generate() / stream() 的供應商
+CHAT_PROVIDERS = ('openai', 'gemini', 'ollama')
+
+# 可重試的 HTTP 狀態碼
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """呼叫語言模型失敗（已用完重試次數或不可重試的錯誤）"""
+
+
+def provider_setting(provider, name):
+    default = PROVIDER_DEFAULTS[provider][name]
+    return type(default)(os.getenv(f'LLM_{provider.upper()}_{name.upper()}', default))
+
+
+def is_retryable(error):
+    """逾時、連線錯誤、429 與 5xx 可以重試"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, httpx.TransportError, openai.APIConnectionError)):
+        return True
+    # openai 的 status_code、httpx 的 response.status_code、google api_core 的 code
+    status = getattr(error, 'status_code', None)
+    if status is None and isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    if status is None and isinstance(getattr(error, 'code', None), int):
+        status = error.code
+    return status in RETRYABLE_STATUS
+
+
+class LLMGateway:
+    """在背景事件迴圈中執行語言模型呼叫，generate() 可從任何執行緒呼叫"""
+
+    def __init__(self, max_retries=LLM_MAX_RETRIES, backoff=LLM_RETRY_BACKOFF):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.openai_clients = {}  # api_key -> AsyncOpenAI
+        self.http_client = None   # Ollama 共用的 httpx.AsyncClient
+        self.gemini_models = {}   # 模型名稱 -> GenerativeModel
+        self.stats_by_provider = {}
+
+    # 事件迴圈
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='llm-gateway', daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def run(self, coro):
+        """在閘道的事件迴圈中執行協程並等待結果"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def close(self):
+        """關閉客戶端與事件迴圈，應用結束時呼叫"""
+        with self.lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_clients(), loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"Error closing LLM clients: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self.thread.join(timeout=5)
+
+    async def _close_clients(self):
+        clients, self.openai_clients = list(self.openai_clients.values()), {}
+        for client in clients:
+            await client.close()
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    # 呼叫、重試與統計
+
+    def _semaphore(self, provider, limit_key):
+        semaphore = self.semaphores.get(limit_key)
+        if semaphore is None:
+            semaphore = self.semaphores[limit_key] = asyncio.Semaphore(provider_setting(provider, 'concurrency'))
+        return semaphore
+
+    async def _retry_delay(self, provider, attempt, error):
+        delay = min(self.backoff * 2 ** (attempt - 1), LLM_RETRY_BACKOFF_MAX)
+        delay *= random.uniform(0.5, 1.0)
+        logger.warning(f"{provider} call failed ({type(error).__name__}: {error}), retry {attempt} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    def _final_error(self, provider, error, timeout):
+        return LLMError(f'{provider} 回應逾時（{timeout} 秒）') if isinstance(error, asyncio.TimeoutError) else error
+
+    async def _call(self, provider, limit_key, make_request, timeout, max_retries=None):
+        """依 limit_key 限制並行數量，逾時或可重試的錯誤以指數退避重試"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        semaphore = self._semaphore(provider, limit_key)
+        start = time.monotonic()
+        attempt = 0
+        queued = 0.0
+        while True:
+            attempt += 1
+            try:
+                wait_start = time.monotonic()
+                async with semaphore:
+                    queued += time.monotonic() - wait_start
+                    result = await asyncio.wait_for(make_request(), timeout)
+                self._record(provider, attempt, time.monotonic() - start, queued)
+                return result
+            except Exception as e:
+                if attempt > max_retries or not is_retryable(e):
+                    error = self._final_error(provider, e, timeout)
+                    self._record(provider, attempt, time.monotonic() - start, queued, error)
+                    if error is not e:
+                        raise error from e
+                    raise
+                await self._retry_delay(provider, attempt, e)
+
+    async def _stream_call(self, provider, limit_key, open_stream, timeout):
+        """
+        串流版本的 _call：open_stream() 回傳逐段產生文字的非同步迭代器
+        timeout 為兩段文字之間的最長等待時間；已送出文字後發生錯誤不再重試，避免重複的內容
+        """
+        semaphore = self._semaphore(provider, limit_key)
+        start = time.monotonic()
+        attempt = 0
+        queued = 0.0
+        emitted = False
+        while True:
+            attempt += 1
+            try:
+                wait_start = time.monotonic()
+                async with semaphore:
+                    queued += time.monotonic() - wait_start
+                    chunks = open_stream().__aiter__()
+                    try:
+                        while True:
+                            try:
+                                text = await asyncio.wait_for(chunks.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                break
+                            if text:
+                                emitted = True
+                                yield text
+                    finally:
+                        if hasattr(chunks, 'aclose'):
+                            await chunks.aclose()
+                self._record(provider, attempt, time.monotonic() - start, queued)
+                return
+            except Exception as e:
+                if emitted or attempt > self.max_retries or not is_retryable(e):
+                    error = self._final_error(provider, e, timeout)
+                    self._record(provider, attempt, time.monotonic() - start, queued, error)
+                    if error is not e:
+                        raise error from e
+                    raise
+                await self._retry_delay(provider, attempt, e)
+
+    def _record(self, provider, attempts, duration, queued, error=None):
+        """所有呼叫的統計與記錄"""
+        with self.lock:
+            stats = self.stats_by_provider.setdefault(provider, {
+                'calls': 0, 'errors': 0, 'retries': 0,
+                'total_duration': 0.0, 'max_duration': 0.0, 'total_queued': 0.0, 'last_error': None
+            })
+            stats['calls'] += 1
+            stats['retries'] += attempts - 1
+            stats['total_duration'] += duration
+            stats['max_duration'] = max(stats['max_duration'], duration)
+            stats['total_queued'] += queued
+            if error is not None:
+                stats['errors'] += 1
+                stats['last_error'] = f'{type(error).__name__}: {error}'
+        if error is not None:
+            logger.error(f"{provider} call failed after {attempts} attempt(s) in {duration:.2f}s: {error}")
+        else:
+            logger.info(f"{provider} call succeeded after {attempts} attempt(s) in {duration:.2f}s "
+                        f"(queued {queued:.2f}s)")
+
+    def stats(self):
+        """各供應商的呼叫次數、錯誤、重試、平均與最長耗時"""
+        with self.lock:
+            result = {}
+            for provider, stats in self.stats_by_provider.items():
+                result[provider] = dict(stats, avg_duration=stats['total_duration'] / stats['calls'])
+            return result
+
+    # 各供應商
+
+    def generate(self, provider, prompt, system_prompt=None, model=None, api_key=None, base_url=None,
+                 temperature=None, timeout=None):
+        """
+        呼叫語言模型並回傳產生的文字，provider 為 'openai'、'gemini' 或 'ollama'
+        api_key 只用於 openai，base_url 只用於 ollama
+        """
+        if provider not in CHAT_PROVIDERS:
+            raise ValueError(f'不支援的供應商: {provider}')
+        timeout = timeout or provider_setting(provider, 'timeout')
+        coro = getattr(self, f'_{provider}')(prompt, system_prompt, model, api_key, base_url, temperature, timeout)
+        return self.run(coro)
+
+    def stream(self, provider, prompt, system_prompt=None, model=None, api_key=None, base_url=None,
+               temperature=None, timeout=None):
+        """
+        以串流方式呼叫語言模型，逐段產生模型輸出的文字（同步 generator，參數同 generate）
+        呼叫端提前結束迭代（例如瀏覽器中斷連線）時取消對供應商的請求
+        """
+        if provider not in CHAT_PROVIDERS:
+            raise ValueError(f'不支援的供應商: {provider}')
+        timeout = timeout or provider_setting(provider, 'timeout')
+        chunks = getattr(self, f'_{provider}_stream')(prompt, system_prompt, model, api_key, base_url,
+                                                      temperature, timeout)
+        items = queue.Queue()
+        done = object()
+
+        async def produce():
+            try:
+                async for text in chunks:
+                    items.put(text)
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self._ensure_loop())
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def embed(self, texts, model, base_url=None, timeout=None, max_retries=None):
+        """
+        以 Ollama 的本機嵌入模型計算文字向量，回傳與 texts 順序相同的向量列表
+        max_retries 未指定時使用閘道的重試次數
+        """
+        timeout = timeout or provider_setting('ollama_embed', 'timeout')
+        return self.run(self._ollama_embed(list(texts), model, base_url, timeout, max_retries))
+
+    def _openai_client(self, api_key):
+        client = self.openai_clients.get(api_key)
+        if client is None:
+            # 重試由閘道處理
+            client = self.openai_clients[api_key] = openai.AsyncOpenAI(api_key=api_key, max_retries=0)
+        return client
+
+    def _gemini_model(self, model):
+        model = model or 'gemini-pro'
+        generative_model = self.gemini_models.get(model)
+        if generative_model is None:
+            generative_model = self.gemini_models[model] = genai.GenerativeModel(model)
+        return generative_model
+
+    def _http(self):
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(timeout=None)
+        return self.http_client
+
+    @staticmethod
+    def _ollama_request(prompt, system_prompt, model, base_url, temperature, stream):
+        """回傳 (Ollama 伺服器位址, /api/generate 的請求內容)"""
+        base_url = (base_url or os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')).rstrip('/')
+        payload = {
+            'model': model,
+            'prompt': f"{system_prompt}\n\n{prompt}" if system_prompt else prompt,
+            'stream': stream
+        }
+        if temperature is not None:
+            payload['options'] = {'temperature': temperature}
+        return base_url, payload
+
+    @staticmethod
+    def _openai_messages(prompt, system_prompt):
+        messages = [{'role': 'system', 'content': system_prompt}] if system_prompt else []
+        messages.append({'role': 'user', 'content': prompt})
+        return messages
+
+    async def _openai(self, prompt, system_prompt, model, api_key, base_url, temperature, timeout):
+        client = self._openai_client(api_key)
+        options = {} if temperature is None else {'temperature': temperature}
+
+        async def request():
+            response = await client.chat.completions.create(
+                model=model or 'gpt-3.5-turbo', messages=self._openai_messages(prompt, system_prompt),
+                timeout=timeout, **options)
+            return response.choices[0].message.content or ''
+
+        return await self._call('openai', 'openai', request, timeout)
+
+    def _openai_stream(self, prompt, system_prompt, model, api_key, base_url, temperature, timeout):
+        options = {} if temperature is None else {'temperature': temperature}
+
+        async def open_stream():
+            client = self._openai_client(api_key)
+            response = await client.chat.completions.create(
+                model=model or 'gpt-3.5-turbo', messages=self._openai_messages(prompt, system_prompt),
+                stream=True, timeout=timeout, **options)
+            async with response:
+                async for chunk in response:
+                    if chunk.choices:
+                        yield chunk.choices[0].delta.content or ''
+
+        return self._stream_call('openai', 'openai', open_stream, timeout)
+
+    async def _gemini(self, prompt, system_prompt, model, api_key, base_url, temperature, timeout):
+        generative_model = self._gemini_model(model)
+        full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+        options = {} if temperature is None else {'generation_config': {'temperature': temperature}}
+
+        async def request():
+            response = await generative_model.generate_content_async(full_prompt, **options)
+            return response.text
+
+        return await self._call('gemini', 'gemini', request, timeout)
+
+    def _gemini_stream(self, prompt, system_prompt, model, api_key, base_url, temperature, timeout):
+        full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+        options = {} if temperature is None else {'generation_config': {'temperature': temperature}}
+
+        async def open_stream():
+            response = await self._gemini_model(model).generate_content_async(full_prompt, stream=True, **options)
+            async for chunk in response:
+                try:
+                    yield chunk.text
+                except ValueError:
+                    # 沒有文字內容的片段（例如只有安全性評分）
+                    continue
+
+        return self._stream_call('gemini', 'gemini', open_stream, timeout)
+
+    async def _ollama(self, prompt, system_prompt, model, api_key, base_url, temperature, timeout):
+        base_url, payload = self._ollama_request(prompt, system_prompt, model, base_url, temperature, False)
+
+        async def request():
+            response = await self._http().post(f'{base_url}/api/generate', json=payload)
+            if response.status_code != 200:
+                if response.status_code in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                raise LLMError(f"Ollama 伺服器回應錯誤: {response.status_code} - {response.text}")
+            result = response.json()
+            if 'response' not in result:
+                raise LLMError("Ollama 回應格式錯誤")
+            return result['response']
+
+        # 每個 Ollama 伺服器各自限制並行數量
+        return await self._call('ollama', f'ollama:{base_url}', request, timeout)
+
+    async def _ollama_embed(self, texts, model, base_url, timeout, max_retries):
+        base_url, _ = self._ollama_request('', None, model, base_url, None, False)
+
+        async def request():
+            response = await self._http().post(f'{base_url}/api/embed', json={'model': model, 'input': texts})
+            if response.status_code != 200:
+                if response.status_code in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                raise LLMError(f"Ollama 伺服器回應錯誤: {response.status_code} - {response.text}")
+            embeddings = response.json().get('embeddings')
+            if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+                raise LLMError("Ollama 嵌入回應格式錯誤")
+            return embeddings
+
+        return await self._call('ollama_embed', f'ollama_embed:{base_url}', request, timeout, max_retries)
+
+    def _ollama_stream(self, prompt, system_prompt, model, api_key, base_url, temperature, timeout):
+        base_url, payload = self._ollama_request(prompt, system_prompt, model, base_url, temperature, True)
+
+        async def open_stream():
+            # 串流模式下 Ollama 每行回傳一個 JSON 物件（NDJSON），最後一行 done 為 true
+            async with self._http().stream('POST', f'{base_url}/api/generate', json=payload) as response:
+                if response.status_code != 200:
+                    if response.status_code in RETRYABLE_STATUS:
+                        response.raise_for_status()
+                    body = (await response.aread()).decode('utf-8', errors='replace')
+                    raise LLMError(f"Ollama 伺服器回應錯誤: {response.status_code} - {body}")
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    result = json.loads(line)
+                    if 'error' in result:
+                        raise LLMError(f"Ollama 錯誤: {result['error']}")
+                    yield result.get('response', '')
+                    if result.get('done'):
+                        return
+
+        return self._stream_call('ollama', f'ollama:{base_url}', open_stream, timeout)
+
+
+gateway = LLMGateway()
+
+
+def generate(provider, prompt, **kwargs):
+    """使用共用的閘道呼叫語言模型，參數見 LLMGateway.generate"""
+    return gateway.generate(provider, prompt, **kwargs)
+
+
+def stream(provider, prompt, **kwargs):
+    """使用共用的閘道以串流方式呼叫語言模型，參數見 LLMGateway.stream"""
+    return gateway.stream(provider, prompt, **kwargs)
+
+
+def embed(texts, model, **kwargs):
+    """使用共用的閘道計算文字向量，參數見 LLMGateway.embed"""
+    return gateway.embed(texts, model, **kwargs)
@@ -1,4 +1,5 @@
 import requests
+import page_fetcher
 from bs4 import BeautifulSoup
 import csv
 import pandas as pd
@@ -11,7 +12,7 @@ def crawl_articles(url):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = page_fetcher.get(url, headers=headers, timeout=10)
         print(f"HTTP 狀態碼: {response.status_code}")
 
         # Check if the response status code is 200 (OK)
@@ -0,0 +1,320 @@
+"""
+共用的網頁下載層
+
+智能爬取與執行的爬蟲腳本都經由這裡下載網頁：
+  - 每個主機一個 requests.Session，保持 keep-alive 連線並重用
+  - 要求 gzip / deflate 壓縮傳輸，安裝 brotli 時一併要求 br
+  - 有 ETag 或 Last-Modified 的網頁存入磁碟快取，再次下載時以 If-None-Match / If-Modified-Since 驗證，
+    網頁未變更時伺服器只回傳 304，內容由快取提供
+  - 磁碟快取有總大小上限，超過時依最近使用時間淘汰
+
+get() 的參數與回傳值與 requests.get 相同（快取提供的回應 from_cache 為 True），
+未指定 timeout 時使用 PAGE_FETCH_TIMEOUT 秒（requests.get 預設不逾時）。
+帶有 Authorization、Cookie、Accept-Language 標頭的請求內容可能因使用者而異，不經過快取；
+Session 不保存伺服器設定的 cookie，不同使用者的爬取不會共用 cookie。
+
+install() 讓 requests.get 改由這裡下載（保留 requests.get 預設不逾時的行為），
+只在執行的腳本明確啟用時呼叫（見 app.py 的 SCRIPT_SHARED_FETCH）。
+"""
+import hashlib
+import http.cookiejar
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util import make_headers
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PAGE_CACHE_DIR = os.getenv(
+    'PAGE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'page_cache')
+)
+PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_MB', '256')) * 1024 * 1024
+PAGE_CACHE_MAX_ENTRY_BYTES = int(os.getenv('PAGE_CACHE_MAX_ENTRY_MB', '10')) * 1024 * 1024
+PAGE_FETCH_POOL_SIZE = int(os.getenv('PAGE_FETCH_POOL_SIZE', '10'))  # 每個主機保留的連線數
+PAGE_FETCH_TIMEOUT = 15  # 秒，呼叫端未指定 timeout 時使用
+
+# urllib3 能解壓縮的編碼（安裝 brotli / brotlicffi 時包含 br）
+ACCEPT_ENCODING = make_headers(accept_encoding=True)['accept-encoding']
+
+# 回應內容可能因這些請求標頭而不同，帶有時不使用快取
+_PRIVATE_HEADERS = ('authorization', 'cookie', 'accept-language')
+
+# 快取的內容已解壓縮，這些標頭不再適用
+_DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive')
+
+
+class PageCache:
+    """
+    磁碟上的網頁快取，每個網址兩個檔案：<sha256>.body（解壓縮後的內容）與 <sha256>.json（網址、標頭與驗證資訊）
+    檔案以 os.replace 寫入，多個行程（例如同時執行的腳本）共用同一個目錄
+    """
+
+    def __init__(self, directory, max_bytes, max_entry_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = None  # 第一次寫入時掃描目錄取得
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def load(self, url):
+        """讀取快取項目，回傳 (meta, body)，沒有或已損毀時回傳 None"""
+        path = self._path(url)
+        try:
+            with open(f'{path}.json', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(f'{path}.body', 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url or len(body) != meta.get('size'):
+            return None
+        return meta, body
+
+    def touch(self, url):
+        """記錄最近使用時間，淘汰時依此排序"""
+        try:
+            os.utime(f'{self._path(url)}.json')
+        except OSError:
+            pass
+
+    def store(self, url, response):
+        body = response.content
+        if len(body) > self.max_entry_bytes:
+            return False
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in _DROPPED_HEADERS}
+        meta = {
+            'url': url,
+            'final_url': response.url,
+            'headers': headers,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'size': len(body),
+            'stored_at': time.time(),
+        }
+        path = self._path(url)
+        temp_suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            previous = self._entry_size(path)
+            # 先寫內容再寫 meta，讀取時以 meta 的 size 檢查兩者是否一致
+            with open(f'{path}.body{temp_suffix}', 'wb') as f:
+                f.write(body)
+            os.replace(f'{path}.body{temp_suffix}', f'{path}.body')
+            with open(f'{path}.json{temp_suffix}', 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(f'{path}.json{temp_suffix}', f'{path}.json')
+        except OSError as e:
+            logger.warning(f"Cannot write page cache for {url}: {e}")
+            return False
+
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, _, size in self._entries())
+            else:
+                self.total_bytes += self._entry_size(path) - previous
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self.prune()
+        return True
+
+    @staticmethod
+    def _entry_size(path):
+        size = 0
+        for suffix in ('.json', '.body'):
+            try:
+                size += os.path.getsize(f'{path}{suffix}')
+            except OSError:
+                pass
+        return size
+
+    def _entries(self):
+        """列出所有快取項目 (最近使用時間, 路徑, 大小)"""
+        entries = []
+        try:
+            subdirs = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for subdir in subdirs:
+            try:
+                names = os.listdir(os.path.join(self.directory, subdir))
+            except OSError:
+                continue
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.directory, subdir, name[:-len('.json')])
+                try:
+                    used_at = os.path.getmtime(f'{path}.json')
+                except OSError:
+                    continue
+                entries.append((used_at, path, self._entry_size(path)))
+        return entries
+
+    def prune(self):
+        """依最近使用時間淘汰，直到總大小降到上限的 90%"""
+        with self.lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, _, size in entries)
+            target = self.max_bytes * 0.9
+            removed = 0
+            for _, path, size in entries:
+                if total <= target:
+                    break
+                for suffix in ('.json', '.body'):
+                    try:
+                        os.remove(f'{path}{suffix}')
+                    except OSError:
+                        pass
+                total -= size
+                removed += 1
+            self.total_bytes = total
+        if removed:
+            logger.info(f"Pruned {removed} page cache entries")
+
+    def clear(self):
+        with self.lock:
+            for _, path, _ in self._entries():
+                for suffix in ('.json', '.body'):
+                    try:
+                        os.remove(f'{path}{suffix}')
+                    except OSError:
+                        pass
+            self.total_bytes = 0
+
+
+class _NoCookies(http.cookiejar.DefaultCookiePolicy):
+    """不接受伺服器設定的 cookie，主機共用的 Session 不會把一個請求的 cookie 帶到另一個請求"""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+class PageFetcher:
+
+    def __init__(self, cache=None, pool_size=PAGE_FETCH_POOL_SIZE):
+        self.cache = cache
+        self.pool_size = pool_size
+        self.sessions = {}  # (scheme, host) -> requests.Session
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.stats = {'requests': 0, 'revalidated': 0, 'stored': 0, 'uncached': 0}
+
+    def session(self, url):
+        """取得主機對應的 Session，連線在同一主機的請求之間重用"""
+        parts = urlsplit(url)
+        key = (parts.scheme.lower(), parts.netloc.lower())
+        with self.lock:
+            if self.pid != os.getpid():
+                # fork 後的子行程不能共用父行程的連線
+                self.sessions = {}
+                self.pid = os.getpid()
+            session = self.sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+                session.cookies.set_policy(_NoCookies())
+                self.sessions[key] = session
+            return session
+
+    def get(self, url, params=None, headers=None, timeout=PAGE_FETCH_TIMEOUT, **kwargs):
+        """與 requests.get 相同；其他參數（stream、auth、proxies 等）直接下載，不經過快取"""
+        if params:
+            url = requests.Request('GET', url, params=params).prepare().url
+        session = self.session(url)
+        self.stats['requests'] += 1
+        request_headers = CaseInsensitiveDict(headers or {})
+        if kwargs or self.cache is None or any(name in request_headers for name in _PRIVATE_HEADERS):
+            self.stats['uncached'] += 1
+            return session.get(url, headers=headers, timeout=timeout, **kwargs)
+
+        cached = None
+        if 'If-None-Match' not in request_headers and 'If-Modified-Since' not in request_headers:
+            cached = self.cache.load(url)
+        if cached:
+            meta = cached[0]
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        response = session.get(url, headers=request_headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            self.stats['revalidated'] += 1
+            self.cache.touch(url)
+            return self._cached_response(response, *cached)
+        if self._cacheable(response) and self.cache.store(url, response):
+            self.stats['stored'] += 1
+        else:
+            self.stats['uncached'] += 1
+        return response
+
+    @staticmethod
+    def _cacheable(response):
+        if response.status_code != 200 or response.request.method != 'GET':
+            return False
+        if not (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            return False
+        if 'no-store' in response.headers.get('Cache-Control', '').lower():
+            return False
+        return response.headers.get('Vary', '').strip() != '*'
+
+    @staticmethod
+    def _cached_response(not_modified, meta, body):
+        """以快取內容組成 200 回應，304 回應中較新的標頭（Date、ETag 等）覆蓋快取的標頭"""
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response._content = body
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response.headers.update({name: value for name, value in not_modified.headers.items()
+                                 if name.lower() not in _DROPPED_HEADERS})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = meta.get('final_url') or meta['url']
+        response.request = not_modified.request
+        response.elapsed = not_modified.elapsed
+        response.history = not_modified.history
+        response.from_cache = True
+        return response
+
+    def snapshot(self):
+        with self.lock:
+            hosts = len(self.sessions)
+        return dict(self.stats, hosts=hosts, cache_enabled=self.cache is not None, accept_encoding=ACCEPT_ENCODING)
+
+
+fetcher = PageFetcher(
+    PageCache(PAGE_CACHE_DIR, PAGE_CACHE_MAX_BYTES, PAGE_CACHE_MAX_ENTRY_BYTES) if PAGE_CACHE_ENABLED else None
+)
+
+
+def get(url, **kwargs):
+    return fetcher.get(url, **kwargs)
+
+
+def _requests_get(url, params=None, **kwargs):
+    # 與 requests.get 相同，未指定 timeout 時不逾時
+    kwargs.setdefault('timeout', None)
+    return fetcher.get(url, params=params, **kwargs)
+
+
+def install():
+    """讓 requests.get 經由共用的下載層，供明確啟用的爬蟲腳本使用"""
+    requests.get = _requests_get
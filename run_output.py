@@ -0,0 +1,109 @@
+"""
+執行中腳本的即時輸出
+
+腳本的 stdout / stderr 以行為單位寫入每次執行各自的 RunOutput，只保留最近的若干行（環形緩衝），
+SSE 端點先重送緩衝中的行，再等待新的輸出，執行結束後送出結束事件。
+執行結束的輸出保留一段時間供晚連上的客戶端讀取，之後由 RunOutputRegistry 清除。
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class RunOutput:
+    """一次執行的輸出緩衝"""
+
+    def __init__(self, run_id, max_lines=1000):
+        self.run_id = run_id
+        self.lines = deque(maxlen=max_lines)  # (seq, stream, line)
+        self.partial = {'stdout': '', 'stderr': ''}
+        self.seq = itertools.count(1)
+        self.last_seq = 0
+        self.cond = threading.Condition()
+        self.done = False
+        self.finished_at = None
+        self.status = None
+
+    def append(self, stream, text):
+        """加入一段輸出，完整的行才進入緩衝，未換行的部分等下一段輸出"""
+        with self.cond:
+            data = self.partial.get(stream, '') + text
+            *complete, self.partial[stream] = data.split('\n')
+            for line in complete:
+                self._push(stream, line)
+            if complete:
+                self.cond.notify_all()
+
+    def _push(self, stream, line):
+        self.last_seq = next(self.seq)
+        self.lines.append((self.last_seq, stream, line.rstrip('\r')))
+
+    def finish(self, status):
+        with self.cond:
+            for stream, rest in self.partial.items():
+                if rest:
+                    self._push(stream, rest)
+            self.partial = {'stdout': '', 'stderr': ''}
+            self.done = True
+            self.status = status
+            self.finished_at = time.time()
+            self.cond.notify_all()
+
+    def read(self, after_seq, timeout=None):
+        """
+        讀取 seq 大於 after_seq 的行，沒有新輸出時最多等待 timeout 秒
+        回傳 (lines, skipped, done)，skipped 為已被環形緩衝丟棄、來不及讀取的行數
+        """
+        with self.cond:
+            if self.last_seq <= after_seq and not self.done:
+                self.cond.wait(timeout)
+            lines = [entry for entry in self.lines if entry[0] > after_seq]
+            first = lines[0][0] if lines else self.last_seq + 1
+            skipped = max(0, first - after_seq - 1)
+            return lines, skipped, self.done
+
+
+class RunOutputRegistry:
+    """以 run_id 管理 RunOutput，執行結束超過 retention 秒或數量超過上限時移除"""
+
+    def __init__(self, max_lines=1000, retention=300, max_runs=200):
+        self.max_lines = max_lines
+        self.retention = retention
+        self.max_runs = max_runs
+        self.runs = {}
+        self.cond = threading.Condition()
+
+    def start(self, run_id):
+        """建立 run_id 的輸出緩衝；同一 run_id 仍在執行中時拋出 ValueError，不覆蓋其輸出"""
+        with self.cond:
+            self._expire()
+            current = self.runs.get(run_id)
+            if current is not None and not current.done:
+                raise ValueError(f'run_id 已在執行中: {run_id}')
+            output = RunOutput(run_id, self.max_lines)
+            self.runs[run_id] = output
+            self.cond.notify_all()
+            return output
+
+    def get(self, run_id, wait=0):
+        """取得 RunOutput，尚未開始時最多等待 wait 秒（客戶端可能比執行請求先連上）"""
+        deadline = time.monotonic() + wait
+        with self.cond:
+            while run_id not in self.runs:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            return self.runs[run_id]
+
+    def _expire(self):
+        now = time.time()
+        finished = sorted(
+            (output.finished_at, run_id) for run_id, output in self.runs.items() if output.done
+        )
+        excess = len(self.runs) - self.max_runs + 1
+        for finished_at, run_id in finished:
+            if now - finished_at > self.retention or excess > 0:
+                del self.runs[run_id]
+                excess -= 1
@@ -0,0 +1,25 @@
+"""
+APScheduler 持久化任務的進入點
+
+存進 jobs.db 的任務以「模組:函數」的文字參照保存，必須是可匯入的模組層級函數，
+因此排程任務都指向這裡的 run_schedule，實際處理由 app.py 啟動時以 set_handler() 註冊。
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+_handler = None
+
+
+def set_handler(handler):
+    """註冊排程觸發時呼叫的函數，參數為 schedule_id"""
+    global _handler
+    _handler = handler
+
+
+def run_schedule(schedule_id):
+    """排程觸發時由 APScheduler 呼叫"""
+    if _handler is None:
+        logger.error(f"Schedule {schedule_id} fired before a handler was registered")
+        return
+    _handler(schedule_id)
@@ -0,0 +1,317 @@
+"""
+產生腳本的快取
+
+/api/generate-script 呼叫語言模型前先查詢 script_records 中已產生過的腳本：
+  - 完全相符：網址、需求（prompt）與模型正規化後的 cache_key 相同，直接回傳先前的腳本
+  - 語意相近：同一網址、同一模型（或未記錄模型的舊紀錄）的需求中，
+    以本機嵌入模型（Ollama /api/embed）計算的向量餘弦相似度最高且超過門檻者，提供給使用者選用
+
+需求的向量保存在磁碟上的 VectorIndex，新的紀錄寫入後在背景加入索引，
+啟動時在背景補上尚未建立索引的舊紀錄。嵌入模型無法使用時只略過語意比對，不影響腳本產生。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+import db
+import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_CACHE_ENABLED = os.getenv('SCRIPT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SCRIPT_CACHE_EMBED_MODEL = os.getenv('SCRIPT_CACHE_EMBED_MODEL', 'nomic-embed-text')
+SCRIPT_CACHE_EMBED_URL = os.getenv('SCRIPT_CACHE_EMBED_URL')  # 未設定時使用 OLLAMA_BASE_URL
+SCRIPT_CACHE_SIMILARITY = float(os.getenv('SCRIPT_CACHE_SIMILARITY', '0.9'))
+SCRIPT_CACHE_INDEX_PATH = os.getenv(
+    'SCRIPT_CACHE_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'script_index', 'prompts')
+)
+SCRIPT_CACHE_RETRY_AFTER = 300  # 秒，嵌入模型無法使用時暫停語意比對的時間
+# 秒，查詢時計算需求向量的等待上限，在請求中執行，逾時視為嵌入模型無法使用（背景建立索引不受此限）
+SCRIPT_CACHE_LOOKUP_TIMEOUT = float(os.getenv('SCRIPT_CACHE_LOOKUP_TIMEOUT', '2'))
+SCRIPT_CACHE_BATCH_SIZE = 32
+
+
+def normalize_url(url):
+    """標準化網址：小寫主機名稱、移除預設埠號、錨點與結尾的 /、排序查詢參數"""
+    url = (url or '').strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, port) in (('http', 80), ('https', 443)):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path.rstrip('/'), query, ''))
+
+
+def normalize_prompt(prompt):
+    """需求正規化：合併空白並忽略大小寫"""
+    return ' '.join((prompt or '').split()).casefold()
+
+
+def cache_key(url, prompt, model):
+    key = json.dumps([normalize_url(url), normalize_prompt(prompt), model], ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class VectorIndex:
+    """
+    保存在磁碟上的向量索引
+    <path>.json 記錄嵌入模型與維度，<path>.ids（int64）與 <path>.vec（float32，已正規化）依序附加寫入，
+    查詢時以矩陣乘法計算候選向量的餘弦相似度
+    """
+
+    def __init__(self, path, model):
+        self.path = path
+        self.model = model
+        self.lock = threading.Lock()
+        self.dim = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.rows = {}  # 紀錄 id -> 列
+        self._load()
+
+    def _load(self):
+        try:
+            with open(f'{self.path}.json', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        if meta.get('model') != self.model:
+            # 換了嵌入模型，舊的向量無法比較，重新建立索引
+            logger.info(f"Embedding model changed to {self.model}, rebuilding script index")
+            self._reset_files()
+            return
+        self.dim = meta['dim']
+        ids = np.fromfile(f'{self.path}.ids', dtype=np.int64) if os.path.exists(f'{self.path}.ids') else self.ids
+        vectors = np.fromfile(f'{self.path}.vec', dtype=np.float32) if os.path.exists(f'{self.path}.vec') else None
+        vectors = np.zeros((0, self.dim), dtype=np.float32) if vectors is None else vectors
+        # 寫入中斷時兩個檔案的筆數可能不同，只使用完整的部分
+        count = min(len(ids), len(vectors) // self.dim)
+        self.ids = ids[:count]
+        self.vectors = vectors[:count * self.dim].reshape(count, self.dim)
+        self.rows = {int(record_id): row for row, record_id in enumerate(self.ids)}
+
+    def _reset_files(self):
+        for suffix in ('.json', '.ids', '.vec'):
+            try:
+                os.remove(f'{self.path}{suffix}')
+            except FileNotFoundError:
+                pass
+        self.dim = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, record_id):
+        return record_id in self.rows
+
+    def add(self, record_ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(f'{self.path}.json', 'w', encoding='utf-8') as f:
+                    json.dump({'model': self.model, 'dim': self.dim}, f)
+                self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f'向量維度 {vectors.shape[1]} 與索引 {self.dim} 不同')
+            new = [i for i, record_id in enumerate(record_ids) if record_id not in self.rows]
+            if not new:
+                return
+            ids = np.asarray([record_ids[i] for i in new], dtype=np.int64)
+            vectors = vectors[new]
+            with open(f'{self.path}.ids', 'ab') as f:
+                ids.tofile(f)
+            with open(f'{self.path}.vec', 'ab') as f:
+                vectors.tofile(f)
+            start = len(self.ids)
+            self.ids = np.concatenate([self.ids, ids])
+            self.vectors = np.vstack([self.vectors, vectors])
+            for offset, record_id in enumerate(ids):
+                self.rows[int(record_id)] = start + offset
+
+    def search(self, vector, candidate_ids):
+        """在 candidate_ids 中找出與 vector 最相似的紀錄，回傳 (紀錄 id, 相似度)；沒有候選時回傳 None"""
+        with self.lock:
+            rows = [(record_id, self.rows[record_id]) for record_id in candidate_ids if record_id in self.rows]
+            if not rows:
+                return None
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+            similarities = self.vectors[[row for _, row in rows]] @ query
+        best = int(np.argmax(similarities))
+        return rows[best][0], float(similarities[best])
+
+    def clear(self):
+        with self.lock:
+            self._reset_files()
+
+
+class ScriptCache:
+    """script_records 的查詢層，見模組說明"""
+
+    def __init__(self, db_path='scripts.db', index_path=SCRIPT_CACHE_INDEX_PATH, embed_model=SCRIPT_CACHE_EMBED_MODEL,
+                 embed_url=SCRIPT_CACHE_EMBED_URL, threshold=SCRIPT_CACHE_SIMILARITY):
+        self.db_path = db_path
+        self.index_path = index_path
+        self.embed_model = embed_model
+        self.embed_url = embed_url
+        self.threshold = threshold
+        self.index = None
+        self.index_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='script-cache')
+        self.unavailable_until = 0
+        self.lock = threading.Lock()
+        self.stats = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0}
+
+    def _index(self):
+        with self.index_lock:
+            if self.index is None:
+                self.index = VectorIndex(self.index_path, self.embed_model)
+            return self.index
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _embed(self, texts, timeout=None):
+        """計算需求的向量，嵌入模型無法使用時回傳 None 並暫停一段時間"""
+        if time.time() < self.unavailable_until:
+            return None
+        try:
+            return llm_gateway.embed(texts, self.embed_model, base_url=self.embed_url, timeout=timeout,
+                                     max_retries=0)
+        except Exception as e:
+            logger.warning(f"Embedding model unavailable, semantic script cache paused: {e}")
+            self.unavailable_until = time.time() + SCRIPT_CACHE_RETRY_AFTER
+            return None
+
+    def _fetch(self, c, record_id):
+        c.execute('SELECT id, script, prompt, timestamp FROM script_records WHERE id = ?', (record_id,))
+        row = c.fetchone()
+        return row and {'record_id': row[0], 'script': row[1], 'prompt': row[2], 'timestamp': row[3]}
+
+    def lookup(self, url, prompt, model, allow_similar=True):
+        """
+        查詢快取，回傳 {'match': 'exact' | 'similar', 'record_id', 'script', 'prompt', 'timestamp', 'similarity'}，
+        沒有符合的紀錄時回傳 None
+        """
+        if not SCRIPT_CACHE_ENABLED:
+            return None
+        conn = None
+        try:
+            conn = db.connect(self.db_path)
+            c = conn.cursor()
+            c.execute('SELECT id FROM script_records WHERE cache_key = ? ORDER BY id DESC LIMIT 1',
+                      (cache_key(url, prompt, model),))
+            row = c.fetchone()
+            if row:
+                self._count('exact_hits')
+                return dict(self._fetch(c, row[0]), match='exact', similarity=1.0)
+
+            if allow_similar:
+                # 只比對同一網址、同一模型（或未記錄模型的舊紀錄）的需求
+                c.execute('''
+                    SELECT id FROM script_records
+                    WHERE url_key = ? AND (model = ? OR model IS NULL)
+                ''', (normalize_url(url), model))
+                candidates = [row[0] for row in c.fetchall()]
+                index = self._index()
+                candidates = [record_id for record_id in candidates if record_id in index]
+                embeddings = None
+                if candidates:
+                    embeddings = self._embed([normalize_prompt(prompt)], timeout=SCRIPT_CACHE_LOOKUP_TIMEOUT)
+                if embeddings:
+                    found = index.search(embeddings[0], candidates)
+                    if found and found[1] >= self.threshold:
+                        record = self._fetch(c, found[0])
+                        if record:
+                            self._count('similar_hits')
+                            return dict(record, match='similar', similarity=round(found[1], 4))
+            self._count('misses')
+            return None
+        except Exception as e:
+            logger.error(f"Script cache lookup failed: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def add(self, record_id, prompt):
+        """在背景把新紀錄的需求加入向量索引"""
+        if SCRIPT_CACHE_ENABLED:
+            self.executor.submit(self._index_records, [(record_id, prompt)])
+
+    def _index_records(self, records):
+        embeddings = self._embed([normalize_prompt(prompt) for _, prompt in records])
+        if embeddings is None:
+            return False
+        self._index().add([record_id for record_id, _ in records], embeddings)
+        return True
+
+    def backfill(self):
+        """在背景為尚未建立索引的紀錄計算向量，並補上舊紀錄的 url_key"""
+        if SCRIPT_CACHE_ENABLED:
+            self.executor.submit(self._backfill)
+
+    def _backfill(self):
+        conn = None
+        try:
+            conn = db.connect(self.db_path)
+            c = conn.cursor()
+            c.execute('SELECT id, url FROM script_records WHERE url_key IS NULL')
+            rows = c.fetchall()
+            if rows:
+                c.executemany('UPDATE script_records SET url_key = ? WHERE id = ?',
+                              [(normalize_url(url), record_id) for record_id, url in rows])
+                conn.commit()
+            c.execute('SELECT id, prompt FROM script_records ORDER BY id')
+            index = self._index()
+            pending = [(record_id, prompt) for record_id, prompt in c.fetchall() if record_id not in index]
+        except Exception as e:
+            logger.error(f"Script cache backfill failed: {e}")
+            return
+        finally:
+            if conn:
+                conn.close()
+
+        for start in range(0, len(pending), SCRIPT_CACHE_BATCH_SIZE):
+            if not self._index_records(pending[start:start + SCRIPT_CACHE_BATCH_SIZE]):
+                return
+        if pending:
+            logger.info(f"Indexed {len(pending)} script record prompt(s)")
+
+    def clear(self):
+        """清除所有紀錄時一併清除向量索引"""
+        self._index().clear()
+
+    def snapshot(self):
+        index = self._index()
+        with self.lock:
+            stats = dict(self.stats)
+        return dict(stats, indexed=len(index), embed_model=self.embed_model, threshold=self.threshold,
+                    embedding_available=time.time() >= self.unavailable_until)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+script_cache = ScriptCache()
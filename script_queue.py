@@ -0,0 +1,189 @@
+"""
+排程腳本執行佇列
+
+APScheduler 觸發排程時只把執行請求放入佇列，實際執行由固定數量的工作執行緒負責：
+  - 全域並行上限，同一分鐘觸發大量排程時依序執行而不是同時啟動大量子行程
+  - 每個排程的 max_instances，超過時留在佇列等待
+  - 同一排程尚未開始的執行會合併（coalesce），錯過的多次觸發只執行一次
+  - 依 priority 由高到低執行，相同優先順序依加入順序
+  - snapshot() 提供佇列深度與執行中項目
+"""
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class ScriptRun:
+    """佇列中的一次執行"""
+
+    def __init__(self, key, args, priority, max_instances, seq):
+        self.key = key
+        self.args = args
+        self.priority = priority
+        self.max_instances = max_instances
+        self.seq = seq
+        self.future = Future()
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.coalesced = 0
+
+    def __lt__(self, other):
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+    def info(self):
+        return {
+            'key': self.key,
+            'priority': self.priority,
+            'max_instances': self.max_instances,
+            'enqueued_at': self.enqueued_at,
+            'started_at': self.started_at,
+            'coalesced': self.coalesced,
+        }
+
+
+class ScriptRunQueue:
+    """
+    有界、依優先順序執行的佇列
+    runner(*args) 在工作執行緒中執行，結果或例外透過 submit() 回傳的 Future 取得
+    """
+
+    def __init__(self, runner, max_workers=4, max_pending=500):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.cond = threading.Condition()
+        self.heap = []
+        self.pending = {}   # key -> 尚未開始的 ScriptRun 列表
+        self.running = {}   # key -> 執行中的 ScriptRun 列表
+        self.seq = itertools.count()
+        self.workers = []
+        self.stopped = False
+        self.stats = {'submitted': 0, 'coalesced': 0, 'completed': 0, 'failed': 0}
+
+    def submit(self, key, args=(), priority=0, max_instances=1, coalesce=True):
+        """
+        加入一次執行，回傳 Future
+        coalesce 為 True 且同一 key 已有尚未開始的執行時直接合併，使用最新的 args 與較高的 priority
+        佇列已滿時拋出 queue.Full
+        """
+        with self.cond:
+            if self.stopped:
+                raise RuntimeError('執行佇列已關閉')
+            waiting = self.pending.get(key)
+            if coalesce and waiting:
+                run = waiting[-1]
+                run.args = args
+                if priority > run.priority:
+                    # 例如手動「立即執行」合併到等待中的排程執行時，不應繼續以低優先順序等待
+                    run.priority = priority
+                    heapq.heapify(self.heap)
+                run.coalesced += 1
+                self.stats['coalesced'] += 1
+                return run.future
+
+            if len(self.heap) >= self.max_pending:
+                raise queue.Full(f'執行佇列已滿（{self.max_pending}）')
+
+            run = ScriptRun(key, args, priority, max(1, max_instances), next(self.seq))
+            heapq.heappush(self.heap, run)
+            self.pending.setdefault(key, []).append(run)
+            self.stats['submitted'] += 1
+            self._ensure_workers()
+            self.cond.notify()
+            return run.future
+
+    def _ensure_workers(self):
+        # 工作執行緒在第一次提交時才建立
+        while len(self.workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f'script-run-{len(self.workers)}', daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def _next_runnable(self):
+        """取出優先順序最高且未超過 max_instances 的執行，沒有時回傳 None"""
+        skipped = []
+        found = None
+        while self.heap:
+            run = heapq.heappop(self.heap)
+            if len(self.running.get(run.key, ())) < run.max_instances:
+                found = run
+                break
+            skipped.append(run)
+        for run in skipped:
+            heapq.heappush(self.heap, run)
+        return found
+
+    def _work(self):
+        while True:
+            with self.cond:
+                run = None
+                while not self.stopped:
+                    run = self._next_runnable()
+                    if run is not None:
+                        break
+                    self.cond.wait()
+                if run is None:
+                    return
+                self.pending[run.key].remove(run)
+                if not self.pending[run.key]:
+                    del self.pending[run.key]
+                self.running.setdefault(run.key, []).append(run)
+                run.started_at = time.time()
+
+            if run.future.set_running_or_notify_cancel():
+                try:
+                    run.future.set_result(self.runner(*run.args))
+                    succeeded = True
+                except BaseException as e:
+                    run.future.set_exception(e)
+                    succeeded = False
+            else:
+                succeeded = True
+
+            with self.cond:
+                self.running[run.key].remove(run)
+                if not self.running[run.key]:
+                    del self.running[run.key]
+                self.stats['completed' if succeeded else 'failed'] += 1
+                # 同一 key 等待中的執行可能可以開始了
+                self.cond.notify_all()
+
+    def cancel_pending(self, key):
+        """取消同一 key 尚未開始的執行，回傳取消的數量"""
+        with self.cond:
+            waiting = self.pending.pop(key, [])
+            if waiting:
+                self.heap = [run for run in self.heap if run.key != key]
+                heapq.heapify(self.heap)
+        for run in waiting:
+            run.future.cancel()
+        return len(waiting)
+
+    def snapshot(self):
+        """佇列狀態：並行上限、佇列深度、等待中與執行中的項目"""
+        with self.cond:
+            waiting = sorted(self.heap)
+            running = [run for runs in self.running.values() for run in runs]
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'depth': len(waiting),
+                'running_count': len(running),
+                'pending': [run.info() for run in waiting],
+                'running': [run.info() for run in running],
+                'stats': dict(self.stats),
+            }
+
+    def shutdown(self, cancel_pending=True):
+        """停止接受新的執行，取消尚未開始的執行"""
+        with self.cond:
+            self.stopped = True
+            if cancel_pending:
+                for run in self.heap:
+                    run.future.cancel()
+                self.heap = []
+                self.pending = {}
+            self.cond.notify_all()
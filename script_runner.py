@@ -0,0 +1,675 @@
+"""
+腳本執行器
+
+原本每次執行腳本都啟動一個新的 `python` 行程，光是直譯器啟動與匯入 pandas、numpy、requests
+就要花掉大半秒到數秒。這裡改為維持一組預先啟動、已匯入常用套件的 worker（script_worker.py），
+每次執行由 worker fork 出子行程執行腳本：
+  - 子行程共用 worker 已匯入的模組，省下啟動與匯入時間
+  - 每次執行仍是獨立行程，腳本修改的全域狀態、環境變數、工作目錄不會影響下一次執行
+  - 子行程在獨立的行程群組中執行，逾時或停止時連同腳本產生的子行程一起終止
+  - worker 執行一定次數或記憶體超過上限後回收並補上新的 worker
+  - 執行中的腳本以 run_id 登記 PID（即行程群組 ID），停止時直接終止對應的行程群組
+不支援 fork 的平台（Windows）或 SCRIPT_WORKER_POOL=false 時退回原本的 subprocess 執行方式。
+"""
+import json
+import os
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from script_worker import Capture, apply_limits, read_proc_io
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'script_worker.py')
+
+SCRIPT_WORKER_POOL = os.getenv('SCRIPT_WORKER_POOL', 'true').lower() in ('1', 'true', 'yes')
+SCRIPT_WORKER_MAX_RUNS = int(os.getenv('SCRIPT_WORKER_MAX_RUNS', '200'))
+SCRIPT_WORKER_MAX_RSS_MB = int(os.getenv('SCRIPT_WORKER_MAX_RSS_MB', '1024'))
+# worker 本身超過腳本逾時時間仍未回應時，視為卡住並終止 worker
+SCRIPT_WORKER_GRACE = 10  # 秒
+# 執行結果中保留的 stdout / stderr 上限，超過時只保留最後的部分（即時輸出不受影響）
+SCRIPT_OUTPUT_MAX_BYTES = int(os.getenv('SCRIPT_OUTPUT_MAX_BYTES', str(1024 * 1024)))
+
+# 每次執行的資源限制（POSIX），設為 0 表示不限制
+SCRIPT_CPU_LIMIT = int(os.getenv('SCRIPT_CPU_LIMIT', '120'))  # CPU 秒數
+SCRIPT_MEMORY_LIMIT_MB = int(os.getenv('SCRIPT_MEMORY_LIMIT_MB', '4096'))  # 虛擬記憶體（RLIMIT_AS）
+SCRIPT_NOFILE_LIMIT = int(os.getenv('SCRIPT_NOFILE_LIMIT', '256'))  # 同時開啟的檔案數
+
+
+def default_limits():
+    return {
+        'RLIMIT_CPU': SCRIPT_CPU_LIMIT,
+        'RLIMIT_AS': SCRIPT_MEMORY_LIMIT_MB * 1024 * 1024,
+        'RLIMIT_NOFILE': SCRIPT_NOFILE_LIMIT,
+    }
+
+_HEADER = struct.Struct('>I')
+
+
+class ScriptResult:
+    """一次腳本執行的結果"""
+
+    def __init__(self, returncode, stdout, stderr, timed_out=False, duration=0.0, results=None, usage=None,
+                 cancelled=False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        # 執行期間被 cancel_run / cancel_runs 終止
+        self.cancelled = cancelled
+        self.duration = duration
+        # 腳本寫入結果管道（SCRIPT_RESULT_FD）的內容，未要求回傳結果時為 None
+        self.results = results
+        # cpu_time（秒）、peak_rss_kb、io_read_bytes、io_write_bytes，無法取得時為 None
+        self.usage = usage
+
+    def limit_error(self):
+        """因資源限制而失敗時回傳說明，否則回傳 None"""
+        if hasattr(signal, 'SIGXCPU') and self.returncode == -signal.SIGXCPU:
+            return f'超過 CPU 時間上限（{SCRIPT_CPU_LIMIT} 秒）'
+        if self.returncode and 'MemoryError' in (self.stderr or ''):
+            return f'記憶體不足，可能超過記憶體上限（{SCRIPT_MEMORY_LIMIT_MB} MB）'
+        return None
+
+    def result_table(self):
+        """解析 write_results() 寫入的結果，回傳 (columns, rows)；沒有結果時回傳 (None, [])"""
+        if not self.results:
+            return None, []
+        lines = iter(self.results.splitlines())
+        columns = json.loads(next(lines))
+        return columns, [json.loads(line) for line in lines if line]
+
+
+class WorkerPoolBusy(Exception):
+    """等待空閒 worker 超過 acquire_timeout"""
+
+
+class WorkerError(Exception):
+    """worker 行程異常結束或通訊中斷"""
+
+
+class RunCancelled(Exception):
+    """腳本執行被 cancel_run / cancel_runs 終止"""
+
+
+class Worker:
+    """一個 script_worker.py 行程"""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-X', 'utf8', WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(WORKER_SCRIPT)
+        )
+        self.runs = 0
+        self.rss_kb = 0
+        ready = self._read()
+        if ready.get('type') != 'ready':
+            self.kill()
+            raise WorkerError(f'worker 啟動失敗: {ready}')
+
+    def _write(self, message):
+        data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        try:
+            self.proc.stdin.write(_HEADER.pack(len(data)) + data)
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerError(f'worker 通訊失敗: {e}')
+
+    def _read(self):
+        header = self.proc.stdout.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise WorkerError(f'worker 已結束（exit code {self.proc.poll()}）')
+        (length,) = _HEADER.unpack(header)
+        data = self.proc.stdout.read(length)
+        if len(data) < length:
+            raise WorkerError('worker 回應不完整')
+        return json.loads(data.decode('utf-8'))
+
+    def run(self, path, cwd, timeout, env, limits=None, on_start=None, source=None, collect_results=False,
+            on_output=None):
+        """
+        執行腳本並等待結果，on_start(pid) 在子行程啟動後呼叫，
+        on_output(stream, text) 在執行期間收到 stdout / stderr 輸出時呼叫
+        worker 卡住被終止時回傳 timed_out 的結果
+        """
+        start = time.monotonic()
+        self._write({
+            'op': 'run',
+            'path': path,
+            'source': source,
+            'cwd': cwd,
+            'timeout': timeout,
+            'env': env or {},
+            'limits': limits or {},
+            'results': collect_results,
+            'stream': on_output is not None,
+            'max_output': SCRIPT_OUTPUT_MAX_BYTES,
+        })
+        # worker 自己會在逾時時終止子行程，這裡只防止 worker 本身卡住；
+        # 子行程在獨立的行程群組中（setsid），終止 worker 時需一併終止子行程的行程群組
+        child = {}
+
+        def expire():
+            child['expired'] = True
+            if child.get('pid'):
+                _kill_group(child['pid'])
+            self.kill()
+
+        watchdog = None
+        if timeout:
+            watchdog = threading.Timer(timeout + SCRIPT_WORKER_GRACE, expire)
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            while True:
+                try:
+                    message = self._read()
+                except WorkerError:
+                    if not child.get('expired'):
+                        raise
+                    # watchdog 已終止 worker 與腳本，與腳本逾時相同處理；等待 worker 結束，歸還時不會再被使用
+                    self.proc.wait()
+                    return ScriptResult(-signal.SIGKILL, '', '', timed_out=True,
+                                        duration=time.monotonic() - start)
+                if message.get('type') == 'output':
+                    on_output(message['stream'], message['data'])
+                elif message.get('type') == 'started':
+                    child['pid'] = message['pid']
+                    if on_start:
+                        on_start(message['pid'])
+                elif message.get('type') == 'result':
+                    break
+        finally:
+            if watchdog:
+                watchdog.cancel()
+        self.runs += 1
+        self.rss_kb = message.get('worker_rss_kb') or 0
+        return ScriptResult(
+            message['returncode'],
+            message['stdout'],
+            message['stderr'],
+            timed_out=message['timed_out'],
+            duration=message['duration'],
+            results=message.get('results'),
+            usage=message.get('usage')
+        )
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def close(self):
+        if not self.alive():
+            return
+        try:
+            self._write({'op': 'exit'})
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.kill()
+
+    def kill(self):
+        try:
+            self.proc.kill()
+        except Exception:
+            pass
+
+
+class WorkerPool:
+    """
+    worker 池：worker 在第一次使用或 prewarm() 時建立，
+    全部 worker 忙碌時等待（可設定等待上限），執行次數或記憶體超過上限的 worker 會被回收並在背景補上
+    worker 數量由 app.py 依排程佇列的並行上限以 resize() 設定
+    """
+
+    def __init__(self, size=2, max_runs=200, max_rss_mb=1024):
+        self.size = max(1, size)
+        self.max_runs = max_runs
+        self.max_rss_kb = max_rss_mb * 1024
+        self.cond = threading.Condition()
+        self.idle = []
+        self.total = 0
+        self.closed = False
+        self.stats = {'runs': 0, 'started': 0, 'recycled': 0, 'broken': 0}
+
+    def _spawn(self):
+        """在鎖外建立 worker，呼叫前已預留 total 名額"""
+        try:
+            worker = Worker()
+        except BaseException:
+            with self.cond:
+                self.total -= 1
+                self.cond.notify()
+            raise
+        with self.cond:
+            self.stats['started'] += 1
+        return worker
+
+    def acquire(self, timeout=None):
+        """取得空閒的 worker，timeout 秒內沒有空閒的 worker 時拋出 WorkerPoolBusy（None 表示一直等待）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise RuntimeError('worker 池已關閉')
+                if self.idle:
+                    return self.idle.pop()
+                if self.total < self.size:
+                    self.total += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise WorkerPoolBusy(f'所有 {self.size} 個腳本 worker 都在執行中，請稍後再試')
+                self.cond.wait(remaining)
+        return self._spawn()
+
+    def resize(self, size):
+        """調整 worker 數量上限，多出的 worker 在歸還時回收"""
+        with self.cond:
+            self.size = max(1, size)
+            self.cond.notify_all()
+
+    def release(self, worker, broken=False):
+        recycle = (
+            broken
+            or not worker.alive()
+            or worker.runs >= self.max_runs
+            or worker.rss_kb > self.max_rss_kb
+            or self.total > self.size
+        )
+        if not recycle:
+            with self.cond:
+                if not self.closed:
+                    self.idle.append(worker)
+                    self.cond.notify()
+                    return
+        if broken:
+            worker.kill()
+        else:
+            worker.close()
+        with self.cond:
+            self.total -= 1
+            self.stats['broken' if broken else 'recycled'] += 1
+            self.cond.notify()
+            closed = self.closed
+        if not closed:
+            # 在背景補上新的 worker，下一次執行不用等待啟動
+            threading.Thread(target=self.prewarm, name='script-worker-prewarm', daemon=True).start()
+
+    def prewarm(self):
+        """建立 worker 直到數量達到 size"""
+        while True:
+            with self.cond:
+                if self.closed or self.total >= self.size:
+                    return
+                self.total += 1
+            try:
+                worker = self._spawn()
+            except Exception as e:
+                print(f"Error starting script worker: {e}")
+                return
+            with self.cond:
+                if self.closed:
+                    self.total -= 1
+                else:
+                    self.idle.append(worker)
+                    self.cond.notify()
+                    continue
+            worker.close()
+            return
+
+    def run(self, path, cwd, timeout, env, acquire_timeout=None, **kwargs):
+        worker = self.acquire(acquire_timeout)
+        try:
+            result = worker.run(path, cwd, timeout, env, **kwargs)
+        except BaseException:
+            self.release(worker, broken=True)
+            raise
+        with self.cond:
+            self.stats['runs'] += 1
+        self.release(worker)
+        return result
+
+    def snapshot(self):
+        with self.cond:
+            return {
+                'size': self.size,
+                'workers': self.total,
+                'idle': len(self.idle),
+                'stats': dict(self.stats),
+            }
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.total -= len(idle)
+            self.cond.notify_all()
+        for worker in idle:
+            worker.close()
+
+
+pool = WorkerPool(max_runs=SCRIPT_WORKER_MAX_RUNS, max_rss_mb=SCRIPT_WORKER_MAX_RSS_MB)
+
+def pool_enabled():
+    return SCRIPT_WORKER_POOL and hasattr(os, 'fork') and sys.platform != 'darwin'
+
+
+def prewarm():
+    """在背景預先啟動 worker，應用啟動時呼叫"""
+    if pool_enabled():
+        threading.Thread(target=pool.prewarm, name='script-worker-prewarm', daemon=True).start()
+
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class RunHandle:
+    """執行中的一次腳本執行"""
+
+    def __init__(self, run_id, key=None):
+        self.run_id = run_id
+        self.key = key
+        self.pid = None  # 腳本行程的 PID，腳本在獨立的 session 中執行，也是行程群組 ID
+        self.kill = None
+        self.started_at = time.time()
+        self.cancelled = False
+
+    def info(self):
+        return {
+            'run_id': self.run_id,
+            'key': self.key,
+            'pid': self.pid,
+            'started_at': self.started_at,
+            'cancelled': self.cancelled,
+        }
+
+
+class RunRegistry:
+    """
+    執行中腳本的登記表：run_id -> RunHandle，並依 key（例如排程 ID）分組
+    取消時依 run_id 或 key 直接找到行程群組終止，不需要掃描整個行程表
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = {}
+        self.by_key = {}
+
+    def add(self, run_id, key=None):
+        with self.lock:
+            if run_id in self.runs:
+                raise ValueError(f'run_id 已在執行中: {run_id}')
+            handle = RunHandle(run_id, key)
+            self.runs[run_id] = handle
+            if key is not None:
+                self.by_key.setdefault(key, set()).add(run_id)
+            return handle
+
+    def __contains__(self, run_id):
+        with self.lock:
+            return run_id in self.runs
+
+    def attach(self, handle, pid, kill):
+        """腳本行程啟動後登記 PID 與終止函數；啟動前已被取消時立即終止"""
+        with self.lock:
+            handle.pid = pid
+            handle.kill = kill
+            cancelled = handle.cancelled
+        if cancelled:
+            kill()
+
+    def remove(self, handle):
+        with self.lock:
+            self.runs.pop(handle.run_id, None)
+            run_ids = self.by_key.get(handle.key)
+            if run_ids is not None:
+                run_ids.discard(handle.run_id)
+                if not run_ids:
+                    del self.by_key[handle.key]
+
+    def _cancel(self, handles):
+        kills = []
+        with self.lock:
+            for handle in handles:
+                handle.cancelled = True
+                if handle.kill is not None:
+                    kills.append(handle.kill)
+        for kill in kills:
+            kill()
+        return len(handles)
+
+    def cancel(self, run_id):
+        """終止指定的執行，找到時回傳 True"""
+        with self.lock:
+            handle = self.runs.get(run_id)
+        return bool(handle and self._cancel([handle]))
+
+    def cancel_key(self, key):
+        """終止同一 key 的所有執行，回傳終止的數量"""
+        with self.lock:
+            handles = [self.runs[run_id] for run_id in self.by_key.get(key, ())]
+        return self._cancel(handles)
+
+    def snapshot(self):
+        with self.lock:
+            return [handle.info() for handle in self.runs.values()]
+
+
+registry = RunRegistry()
+
+
+def cancel_run(run_id):
+    """終止指定 run_id 的腳本行程（含其子行程），找到時回傳 True"""
+    return registry.cancel(run_id)
+
+
+def cancel_runs(key):
+    """終止同一 key（例如排程 ID）所有執行中的腳本，回傳終止的數量"""
+    return registry.cancel_key(key)
+
+
+def active_runs():
+    """執行中的腳本：run_id、key、PID 與開始時間"""
+    return registry.snapshot()
+
+
+def open_result_channel():
+    """在腳本中開啟結果管道（由 run_script(collect_results=True) 提供）"""
+    fd = os.environ.get('SCRIPT_RESULT_FD')
+    if fd:
+        return os.fdopen(int(fd), 'w', encoding='utf-8')
+    return open(os.environ['SCRIPT_RESULT_PATH'], 'w', encoding='utf-8')
+
+
+def write_results(columns, rows):
+    """
+    在腳本中回傳表格結果，格式為 JSON lines：第一行是欄位名稱，之後每行一筆資料（依欄位順序的陣列）
+    """
+    with open_result_channel() as f:
+        f.write(json.dumps(list(columns), ensure_ascii=False))
+        f.write('\n')
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False))
+            f.write('\n')
+
+
+def _read_pipe(pipe, capture, on_output=None):
+    """讀取子行程的一條輸出管道直到 EOF"""
+    with pipe:
+        while True:
+            data = pipe.read1(65536) if hasattr(pipe, 'read1') else pipe.read(65536)
+            if data:
+                capture.add(data)
+            if on_output is not None:
+                text = capture.decoder.decode(data, final=not data)
+                if text:
+                    on_output(capture.name, text)
+            if not data:
+                return
+
+
+def _wait_with_usage(process, timeout):
+    """
+    等待子行程結束並以 wait4 取得資源用量，回傳 usage；逾時時拋出 subprocess.TimeoutExpired
+    Windows 沒有 wait4，只等待結束並回傳 None
+    """
+    if not hasattr(os, 'wait4'):
+        process.wait(timeout=timeout)
+        return None
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = 0.005
+    while True:
+        if hasattr(os, 'waitid'):
+            if os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None:
+                break
+        elif process.poll() is not None:
+            return None
+        if deadline is not None and time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+    io_read, io_write = read_proc_io(process.pid)
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if io_read is None:
+        io_read, io_write = rusage.ru_inblock * 512, rusage.ru_oublock * 512
+    return {
+        'cpu_time': rusage.ru_utime + rusage.ru_stime,
+        'peak_rss_kb': rusage.ru_maxrss if sys.platform != 'darwin' else rusage.ru_maxrss // 1024,
+        'io_read_bytes': io_read,
+        'io_write_bytes': io_write,
+    }
+
+
+def _run_subprocess(path, cwd, timeout, env, handle, source=None, collect_results=False, on_output=None,
+                    limits=None):
+    """
+    不使用 worker 池時的執行方式：每次啟動新的直譯器
+    source 經由 stdin 傳入（python -），結果在 POSIX 上經由繼承的管道回傳，
+    Windows 無法繼承檔案描述符，改用系統暫存目錄中的暫存檔；資源限制只在 POSIX 上套用
+    """
+    full_env = os.environ.copy()
+    full_env.update(env or {})
+    pass_fds = ()
+    result_path = None
+    if collect_results:
+        if os.name == 'nt':
+            fd, result_path = tempfile.mkstemp(suffix='.jsonl')
+            os.close(fd)
+            full_env['SCRIPT_RESULT_PATH'] = result_path
+        else:
+            result_r, result_w = os.pipe()
+            full_env['SCRIPT_RESULT_FD'] = str(result_w)
+            pass_fds = (result_w,)
+    start = time.time()
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'utf8', '-' if source is not None else path],
+        stdin=subprocess.PIPE if source is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=full_env,
+        cwd=cwd,
+        pass_fds=pass_fds,
+        start_new_session=os.name != 'nt',
+        preexec_fn=(lambda: apply_limits(limits)) if limits and os.name != 'nt' else None
+    )
+    if os.name == 'nt':
+        registry.attach(handle, process.pid, process.kill)
+    else:
+        registry.attach(handle, process.pid, lambda: _kill_group(process.pid))
+
+    stdout = Capture('stdout', SCRIPT_OUTPUT_MAX_BYTES)
+    stderr = Capture('stderr', SCRIPT_OUTPUT_MAX_BYTES)
+    readers = [
+        threading.Thread(target=_read_pipe, args=(process.stdout, stdout, on_output), daemon=True),
+        threading.Thread(target=_read_pipe, args=(process.stderr, stderr, on_output), daemon=True),
+    ]
+    results = None
+    if pass_fds:
+        os.close(result_w)
+        results = Capture('results')
+        readers.append(threading.Thread(
+            target=_read_pipe, args=(os.fdopen(result_r, 'rb'), results), daemon=True))
+    for reader in readers:
+        reader.start()
+
+    timed_out = False
+    usage = None
+    if source is not None:
+        try:
+            process.stdin.write(source.encode('utf-8'))
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+    try:
+        usage = _wait_with_usage(process, timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        if os.name == 'nt':
+            process.kill()
+        else:
+            _kill_group(process.pid)
+        usage = _wait_with_usage(process, None)
+    for reader in readers:
+        reader.join()
+
+    if results is not None:
+        results = results.text()
+    elif result_path is not None:
+        with open(result_path, encoding='utf-8', errors='replace') as f:
+            results = f.read()
+        os.remove(result_path)
+    return ScriptResult(
+        process.returncode, stdout.text(), stderr.text(),
+        timed_out=timed_out,
+        duration=time.time() - start,
+        results=results,
+        usage=usage
+    )
+
+
+def run_script(path, cwd=None, timeout=60, env=None, limits=None, source=None, collect_results=False,
+               on_output=None, run_id=None, key=None, acquire_timeout=None):
+    """
+    執行腳本並回傳 ScriptResult，逾時時終止腳本並設定 timed_out
+    env 為要加到目前環境變數上的項目
+    source 有值時直接執行這段程式碼，不需要寫成檔案，path 只用來識別這次執行（__file__）
+    collect_results 為 True 時，腳本可用 write_results() 回傳結果，由 ScriptResult.result_table() 取得
+    on_output(stream, text) 在執行期間收到 stdout / stderr 輸出時呼叫，stream 為 'stdout' 或 'stderr'
+    limits 未指定時套用 SCRIPT_CPU_LIMIT、SCRIPT_MEMORY_LIMIT_MB、SCRIPT_NOFILE_LIMIT
+    執行期間登記在 registry，可用 cancel_run(run_id) 或 cancel_runs(key) 終止，被終止時設定 cancelled
+    acquire_timeout 秒內沒有空閒的 worker 時拋出 WorkerPoolBusy（None 表示一直等待）
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(path))
+    if limits is None:
+        limits = default_limits()
+    handle = registry.add(run_id or uuid.uuid4().hex, key)
+    try:
+        if not pool_enabled():
+            result = _run_subprocess(path, cwd, timeout, env, handle, source=source,
+                                     collect_results=collect_results, on_output=on_output, limits=limits)
+        else:
+            # 等待 worker 期間被取消時，子行程啟動後由 registry.attach 立即終止
+            result = pool.run(
+                path, cwd, timeout, env,
+                acquire_timeout=acquire_timeout,
+                limits=limits,
+                on_start=lambda pid: registry.attach(handle, pid, lambda: _kill_group(pid)),
+                source=source,
+                collect_results=collect_results,
+                on_output=on_output
+            )
+    finally:
+        registry.remove(handle)
+    result.cancelled = handle.cancelled
+    return result
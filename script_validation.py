@@ -0,0 +1,146 @@
+"""
+使用者腳本的驗證
+
+/api/execute-script 執行前的語法與安全性檢查，以及 /api/validate_python 的語法檢查。
+同一份腳本常被重複執行，驗證結果以腳本內容的 sha256 快取在有界的 LRU 中；
+每份腳本只解析一次，語法檢查、編譯檢查與規則檢查共用同一棵 AST。
+"""
+import ast
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+SCRIPT_VALIDATION_CACHE_SIZE = int(os.getenv('SCRIPT_VALIDATION_CACHE_SIZE', '256'))
+
+# 腳本中不允許出現的字串（子字串比對）
+DANGEROUS_KEYWORDS = [
+    'exec', 'eval', 'os.system', 'subprocess.call',
+    'subprocess.run', 'subprocess.Popen', '__import__',
+    'open', 'file', 'execfile', 'compile', 'input',
+    'os.remove', 'os.unlink', 'shutil.rmtree', 'sys.exit',
+    'os.chmod', 'os.chown', 'os.rename', 'os.renames',
+    'socket', 'urllib'
+]
+# 一次掃描判斷是否含任一關鍵字
+_DANGEROUS_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in DANGEROUS_KEYWORDS))
+
+ALLOWED_MODULES = {
+    'requests', 'pandas', 'numpy', 'bs4', 'BeautifulSoup', 'csv', 'time', 'datetime', 'json', 're',
+    'webdriver', 'os', 'selenium', 'By', 'WebDriverWait', 'EC', 'ChromeDriverManager',
+    'TimeoutException', 'WebDriverException', 'Options', 'random', 'expected_conditions'
+}
+FORBIDDEN_CALLS = {'eval', 'exec', 'compile'}
+
+
+class ValidationResult:
+    """一份腳本的驗證結果"""
+
+    def __init__(self, is_valid, error_message='', parse_error=None):
+        self.is_valid = is_valid
+        self.error_message = error_message
+        # ast.parse 失敗時的錯誤訊息，供只做語法檢查的 /api/validate_python 使用
+        self.parse_error = parse_error
+
+
+class ValidationCache:
+    """以腳本 sha256 為鍵、有大小上限的 LRU 快取"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, script, compute):
+        key = hashlib.sha256(script.encode('utf-8', errors='surrogatepass')).hexdigest()
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        result = compute(script)
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+_cache = ValidationCache(SCRIPT_VALIDATION_CACHE_SIZE)
+
+
+def _syntax_message(e):
+    line_no = e.lineno if e.lineno is not None else '未知'
+    col_no = e.offset if e.offset is not None else '未知'
+    error_msg = str(e).split('\n')[0] if str(e) else '語法錯誤'
+    return f"Python 語法錯誤 (第 {line_no} 行，第 {col_no} 列): {error_msg}"
+
+
+def _check_policy(tree):
+    """檢查匯入的模組與呼叫的函數，回傳錯誤訊息，通過時回傳 None"""
+    for node in ast.walk(tree):
+        # 檢查是否使用了不允許的語句類型
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            module = node.names[0].name
+            if module.split('.')[0] not in ALLOWED_MODULES:
+                return f"不允許導入模組: {module}"
+
+        # 檢查是否使用了危險的函數調用
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name) and node.func.id in FORBIDDEN_CALLS:
+                return f"不允許使用函數: {node.func.id}"
+    return None
+
+
+def _analyze(script):
+    """實際的驗證，結果由 _cache 快取"""
+    # 語法分析只做一次，編譯檢查與規則檢查都使用這棵 AST
+    try:
+        tree = ast.parse(script, '<string>')
+    except SyntaxError as e:
+        return ValidationResult(False, _syntax_message(e), str(e))
+    except Exception as e:
+        return ValidationResult(False, f"Python 代碼錯誤: {str(e)}", str(e))
+
+    # 從 AST 編譯，檢查 return 位置錯誤等解析階段不會發現的語法錯誤
+    try:
+        compile(tree, '<string>', 'exec')
+    except SyntaxError as e:
+        return ValidationResult(False, _syntax_message(e))
+    except Exception as e:
+        return ValidationResult(False, f"Python 代碼錯誤: {str(e)}")
+
+    # 檢查是否包含危險的內容；有命中時依清單順序找出第一個關鍵字作為錯誤訊息
+    if _DANGEROUS_PATTERN.search(script):
+        for keyword in DANGEROUS_KEYWORDS:
+            if keyword in script:
+                return ValidationResult(False, f"腳本包含不允許的關鍵字: {keyword}")
+
+    error_message = _check_policy(tree)
+    if error_message:
+        return ValidationResult(False, error_message)
+    return ValidationResult(True)
+
+
+def validate_script(script):
+    """驗證要執行的腳本，回傳 (是否通過, 錯誤訊息)"""
+    if not script or not script.strip():
+        return False, "腳本內容不能為空"
+    result = _cache.get_or_compute(script, _analyze)
+    return result.is_valid, result.error_message
+
+
+def syntax_error(script):
+    """只做語法檢查，回傳 ast.parse 的錯誤訊息，沒有錯誤時回傳 None"""
+    return _cache.get_or_compute(script, _analyze).parse_error
@@ -0,0 +1,317 @@
+"""
+預先載入常用套件的腳本執行 worker
+
+由 script_runner.WorkerPool 以子行程啟動，啟動時先匯入 pandas、numpy、requests、bs4 等套件，
+之後從 stdin 讀取執行請求，每次執行都 fork 一個子行程（共用已匯入的模組），
+在獨立的 session / 行程群組中以 runpy 執行腳本，stdout 只用來回傳結果。
+
+通訊格式：每個訊息為 4 位元組大端序長度 + UTF-8 JSON
+  請求 {"op": "run", "path", "source", "cwd", "timeout", "env", "limits", "results", "stream", "max_output"}
+       source 有值時直接執行這段程式碼（path 只作為 __file__），不需要先寫成檔案；
+       results 為 True 時另開一條管道，子行程可寫入 SCRIPT_RESULT_FD 回傳結果；
+       stream 為 True 時執行期間即時送出 output 訊息；max_output 限制結果中保留的 stdout / stderr 位元組數
+  回應 {"type": "started", "pid"} 子行程已啟動
+       {"type": "output", "stream", "data"} 執行中的輸出
+       {"type": "result", "returncode", "stdout", "stderr", "results", "usage", "timed_out", "duration", "worker_rss_kb"}
+"""
+import codecs
+import json
+import os
+import selectors
+import signal
+import struct
+import sys
+import time
+import traceback
+from collections import deque
+
+_HEADER = struct.Struct('>I')
+
+# 預設預先匯入的模組，可用 SCRIPT_WORKER_PRELOAD（逗號分隔）覆寫
+DEFAULT_PRELOAD = 'pandas,numpy,requests,bs4,json,csv,re,datetime,page_fetcher'
+
+
+def write_frame(fp, message):
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    fp.write(_HEADER.pack(len(data)) + data)
+    fp.flush()
+
+
+def read_frame(fp):
+    """讀取一個訊息，EOF 時回傳 None"""
+    header = fp.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    (length,) = _HEADER.unpack(header)
+    data = fp.read(length)
+    if len(data) < length:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+def preload(modules):
+    for name in modules:
+        name = name.strip()
+        if not name:
+            continue
+        try:
+            __import__(name)
+        except Exception as e:
+            print(f"script_worker: failed to preload {name}: {e}", file=sys.stderr)
+
+
+# RLIMIT_CPU 的硬限制比軟限制多幾秒：超過軟限制時先收到 SIGXCPU，仍未結束才被 SIGKILL
+CPU_HARD_LIMIT_GRACE = 5  # 秒
+
+
+def apply_limits(limits):
+    """
+    在子行程中套用 setrlimit，limits 為 {'RLIMIT_AS': 位元組數, 'RLIMIT_CPU': 秒數, ...}
+    同時降低硬限制，腳本無法自行調回
+    """
+    if not limits:
+        return
+    import resource
+    for name, value in limits.items():
+        resource_id = getattr(resource, name, None)
+        if resource_id is None or not value:
+            continue
+        soft = int(value)
+        new_hard = soft + CPU_HARD_LIMIT_GRACE if name == 'RLIMIT_CPU' else soft
+        _, hard = resource.getrlimit(resource_id)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+            new_hard = min(new_hard, hard)
+        resource.setrlimit(resource_id, (soft, new_hard))
+
+
+def run_child(request, stdout_fd, stderr_fd, result_fd=None):
+    """fork 出的子行程：設定環境後執行腳本，永遠以 os._exit 結束"""
+    code = 1
+    try:
+        if result_fd is not None:
+            os.environ['SCRIPT_RESULT_FD'] = str(result_fd)
+        # 獨立的 session 與行程群組，逾時或停止時可一次終止腳本產生的所有子行程
+        os.setsid()
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        os.close(stdout_fd)
+        os.close(stderr_fd)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+        sys.stdin = open(0, 'r', encoding='utf-8', closefd=False)
+        sys.stdout = open(1, 'w', encoding='utf-8', errors='replace', buffering=1, closefd=False)
+        sys.stderr = open(2, 'w', encoding='utf-8', errors='replace', buffering=1, closefd=False)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        os.environ.update(request.get('env') or {})
+        path = request['path']
+        cwd = request.get('cwd') or os.path.dirname(path)
+        os.chdir(cwd)
+        # 與 `python path` 相同：腳本所在目錄與 PYTHONPATH 放在 sys.path 最前面
+        extra_paths = [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]
+        sys.path[:0] = [os.path.dirname(os.path.abspath(path))] + extra_paths
+        sys.argv = [path]
+        apply_limits(request.get('limits'))
+
+        source = request.get('source')
+        if source is not None:
+            import builtins
+            code_obj = compile(source, path, 'exec')
+            exec(code_obj, {'__name__': '__main__', '__file__': path, '__builtins__': builtins})
+        else:
+            import runpy
+            runpy.run_path(path, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        os._exit(code)
+
+
+class Capture:
+    """一條管道的輸出；max_bytes 有值時只保留最後 max_bytes 位元組"""
+
+    def __init__(self, name, max_bytes=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.chunks = deque()
+        self.size = 0
+        self.dropped = 0
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def add(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.max_bytes and self.size - len(self.chunks[0]) >= self.max_bytes:
+            self.size -= len(self.chunks[0])
+            self.dropped += len(self.chunks.popleft())
+
+    def text(self):
+        data = b''.join(self.chunks)
+        dropped = self.dropped
+        if self.max_bytes and len(data) > self.max_bytes:
+            dropped += len(data) - self.max_bytes
+            data = data[-self.max_bytes:]
+        text = data.decode('utf-8', errors='replace')
+        if dropped:
+            text = f'...（輸出過長，已省略前 {dropped} 位元組）\n' + text
+        return text
+
+
+def collect_output(pid, captures, timeout, out=None):
+    """
+    讀取子行程各管道的輸出直到結束或逾時，回傳 timed_out
+    out 有值時，stdout / stderr 的輸出即時以 output 訊息送出
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    timed_out = False
+    streamed = ('stdout', 'stderr') if out is not None else ()
+    with selectors.DefaultSelector() as selector:
+        for fd, capture in captures.items():
+            selector.register(fd, selectors.EVENT_READ, capture)
+        open_fds = len(captures)
+        while open_fds:
+            wait = None if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                timed_out = True
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                break
+            for key, _ in selector.select(wait):
+                capture = key.data
+                data = os.read(key.fd, 65536)
+                if data:
+                    capture.add(data)
+                else:
+                    selector.unregister(key.fd)
+                    open_fds -= 1
+                if capture.name in streamed:
+                    text = capture.decoder.decode(data, final=not data)
+                    if text:
+                        write_frame(out, {'type': 'output', 'stream': capture.name, 'data': text})
+    return timed_out
+
+
+def read_proc_io(pid):
+    """讀取 /proc/<pid>/io（Linux），回傳 (讀取位元組, 寫入位元組)，無法讀取時回傳 (None, None)"""
+    try:
+        with open(f'/proc/{pid}/io') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        # rchar / wchar 包含檔案、網路與管道的讀寫
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def reap(pid):
+    """
+    等待子行程結束並回傳 (returncode, usage)
+    usage 為 CPU 時間（秒）、最高 RSS（KB）與 I/O 位元組數，包含腳本已結束的子行程
+    """
+    io_read = io_write = None
+    if hasattr(os, 'waitid'):
+        # 先等待但不回收，殭屍行程的 /proc/<pid>/io 仍可讀取
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        io_read, io_write = read_proc_io(pid)
+    _, status, rusage = os.wait4(pid, 0)
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    if io_read is None:
+        # 沒有 /proc 時以區塊 I/O 次數估計（每塊 512 位元組）
+        io_read, io_write = rusage.ru_inblock * 512, rusage.ru_oublock * 512
+    return returncode, {
+        'cpu_time': rusage.ru_utime + rusage.ru_stime,
+        'peak_rss_kb': rusage.ru_maxrss if sys.platform != 'darwin' else rusage.ru_maxrss // 1024,
+        'io_read_bytes': io_read,
+        'io_write_bytes': io_write,
+    }
+
+
+def handle_run(request, out, inp):
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    max_output = request.get('max_output')
+    captures = {stdout_r: Capture('stdout', max_output), stderr_r: Capture('stderr', max_output)}
+    result_w = None
+    if request.get('results'):
+        result_r, result_w = os.pipe()
+        captures[result_r] = Capture('results')
+    start = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        for fd in captures:
+            os.close(fd)
+        # 腳本不能存取 worker 的通訊管道，避免偽造訊息或破壞訊息格式
+        os.close(out.fileno())
+        os.close(inp.fileno())
+        run_child(request, stdout_w, stderr_w, result_w)
+    os.close(stdout_w)
+    os.close(stderr_w)
+    if result_w is not None:
+        os.close(result_w)
+    write_frame(out, {'type': 'started', 'pid': pid})
+
+    try:
+        timed_out = collect_output(pid, captures, request.get('timeout'), out if request.get('stream') else None)
+    finally:
+        for fd in captures:
+            os.close(fd)
+    stdout, stderr = captures[stdout_r].text(), captures[stderr_r].text()
+    results = captures[result_r].text() if result_w is not None else None
+    returncode, usage = reap(pid)
+
+    import resource
+    write_frame(out, {
+        'type': 'result',
+        'returncode': returncode,
+        'stdout': stdout,
+        'stderr': stderr,
+        'results': results,
+        'usage': usage,
+        'timed_out': timed_out,
+        'duration': time.monotonic() - start,
+        'worker_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+
+
+def main():
+    # 保留原本的 stdout 作為通訊管道，之後 print 的內容改寫到 stderr，避免破壞訊息格式
+    out = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    inp = os.fdopen(os.dup(0), 'rb')
+
+    preload(os.getenv('SCRIPT_WORKER_PRELOAD', DEFAULT_PRELOAD).split(','))
+    write_frame(out, {'type': 'ready', 'pid': os.getpid()})
+
+    while True:
+        request = read_frame(inp)
+        if request is None or request.get('op') == 'exit':
+            return
+        if request.get('op') == 'run':
+            handle_run(request, out, inp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+相同請求合併執行（single-flight）
+
+同一個 key 同時只執行一次：第一個請求（leader）實際執行，
+執行期間到達的相同請求（follower）等待 leader 的結果並共用，包括失敗時的例外。
+執行結束後 key 即移除，之後的請求會重新執行（結果的重用交由快取處理）。
+"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.flights = {}  # key -> Future
+        self.stats = {'executed': 0, 'coalesced': 0}
+
+    def acquire(self, key):
+        """
+        加入 key 的執行，回傳 (future, leader)
+        leader 為 True 時呼叫端負責執行並以 release() 設定結果，否則等待 future.result()
+        """
+        with self.lock:
+            future = self.flights.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future, False
+            future = self.flights[key] = Future()
+            self.stats['executed'] += 1
+            return future, True
+
+    def release(self, key, future, result=None, error=None):
+        """leader 執行結束，通知所有 follower"""
+        with self.lock:
+            if self.flights.get(key) is future:
+                del self.flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """執行 fn() 或等待相同 key 執行中的結果，回傳 (結果, 是否共用他人的結果)"""
+        future, leader = self.acquire(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.release(key, future, error=e)
+            raise
+        self.release(key, future, result)
+        return result, False
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, name=self.name, in_flight=len(self.flights))
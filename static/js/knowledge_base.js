@@ -50,6 +50,8 @@ let scheduleCurrentPage = 1;
 let schedulePageSize = 10;
 let scheduleSearchKeyword = '';
 let totalSchedules = []; // 添加總數據存儲
+let scheduleListVersion = null; // 已載入的排程列表版本，之後只取得變更的排程
+const scheduleById = new Map();
 
 // 在文件開頭添加一個重置表單的函數
 function resetScheduleForm() {
@@ -554,17 +556,50 @@ async function saveSchedule() {
 
 
 
+// 同步排程列表：第一次載入完整列表，之後以 since=<版本> 只取得變更與刪除的排程
+// 回傳列表是否有變更
+async function syncScheduleList() {
+    if (scheduleListVersion === null) {
+        // no-cache 讓瀏覽器以 ETag 向伺服器確認，未變更時伺服器回傳 304
+        const response = await fetch('/api/schedules', { cache: 'no-cache' });
+        if (!response.ok) {
+            throw new Error('載入排程列表失敗');
+        }
+        const schedules = await response.json();
+        scheduleById.clear();
+        schedules.forEach(schedule => scheduleById.set(schedule.id, schedule));
+        scheduleListVersion = response.headers.get('X-Schedule-Version');
+        return true;
+    }
+
+    const response = await fetch(`/api/schedules?since=${encodeURIComponent(scheduleListVersion)}`, { cache: 'no-cache' });
+    if (!response.ok) {
+        throw new Error('載入排程列表失敗');
+    }
+    const changes = await response.json();
+    if (changes.reset) {
+        scheduleListVersion = null;
+        return syncScheduleList();
+    }
+    changes.schedules.forEach(schedule => scheduleById.set(schedule.id, schedule));
+    changes.deleted.forEach(id => scheduleById.delete(id));
+    scheduleListVersion = String(changes.version);
+    return changes.schedules.length > 0 || changes.deleted.length > 0;
+}
+
 // 載入排程列表
-async function loadScheduleList(forceUpdate = false) {
+// onlyIfChanged 為 true 時（定時更新、事件通知），列表沒有變更就不重新繪製
+async function loadScheduleList(forceUpdate = false, onlyIfChanged = false) {
     try {
         console.log('Loading schedule list' + (forceUpdate ? ' (forced)' : ''));
         
-        const timestamp = forceUpdate ? `?t=${Date.now()}` : '';
-        const response = await fetch('/api/schedules' + timestamp);
-        if (!response.ok) {
-            throw new Error('載入排程列表失敗');
+        const changed = await syncScheduleList();
+        if (onlyIfChanged && !changed) {
+            return;
         }
-        const schedules = await response.json();
+        const schedules = Array.from(scheduleById.values()).sort((a, b) =>
+            String(b.created_at || '').localeCompare(String(a.created_at || '')) || b.id - a.id
+        );
         
         // 保存完整的排程列表
         totalSchedules = schedules;
@@ -1142,6 +1177,25 @@ async function deleteSchedule(id) {
     }
 }
 
+// 訂閱排程與排程日誌的變更事件，收到事件後重新載入列表
+let scheduleEventSource = null;
+let scheduleReloadTimer = null;
+
+function subscribeScheduleEvents() {
+    if (scheduleEventSource || typeof EventSource === 'undefined') return;
+
+    // 短時間內的多個事件合併為一次重新載入
+    const scheduleReload = () => {
+        clearTimeout(scheduleReloadTimer);
+        scheduleReloadTimer = setTimeout(() => loadScheduleList(true, true), 300);
+    };
+
+    scheduleEventSource = new EventSource('/api/sse?topics=schedule,schedule_log');
+    scheduleEventSource.addEventListener('schedule', scheduleReload);
+    scheduleEventSource.addEventListener('schedule_log', scheduleReload);
+    scheduleEventSource.addEventListener('reload', scheduleReload);
+}
+
 // 修改定時更新函數
 function startAutoUpdate(seconds) {
     console.log(`Starting auto update with interval: ${seconds} seconds`);
@@ -1149,7 +1203,7 @@ function startAutoUpdate(seconds) {
     if (seconds >= 5) {
         autoUpdateInterval = setInterval(() => {
             console.log('Auto update triggered');
-            loadScheduleList(true); // 添加 true 參數強制更新
+            loadScheduleList(true, true); // 只在列表有變更時重新繪製
         }, seconds * 1000);
         console.log('Auto update interval set');
     }
@@ -1328,6 +1382,54 @@ async function runScheduleNow(scheduleId) {
     }
 }
 
+// 查看腳本執行輸出：執行中的日誌即時串流，已結束的日誌讀取保存的輸出
+async function viewLogOutput(scheduleId, logId, status) {
+    let source = null;
+    await Swal.fire({
+        title: '執行輸出',
+        html: '<pre id="log-output" class="text-start small bg-light p-2 mb-0" style="max-height: 400px; overflow-y: auto;"></pre>',
+        width: '60rem',
+        didOpen: async () => {
+            const output = document.getElementById('log-output');
+            const appendLine = (text, className) => {
+                const line = document.createElement('div');
+                line.textContent = text;
+                if (className) line.className = className;
+                output.appendChild(line);
+                output.scrollTop = output.scrollHeight;
+            };
+
+            if (status === 'active' && typeof EventSource !== 'undefined') {
+                source = new EventSource(`/api/script-runs/log-${logId}/output`);
+                source.addEventListener('output', event => {
+                    const data = JSON.parse(event.data);
+                    appendLine(data.line, data.stream === 'stderr' ? 'text-danger' : '');
+                });
+                source.addEventListener('gap', event => {
+                    appendLine(`...（略過 ${JSON.parse(event.data).skipped} 行）`, 'text-muted');
+                });
+                source.addEventListener('end', () => {
+                    source.close();
+                    appendLine('（執行結束）', 'text-muted');
+                });
+                return;
+            }
+
+            try {
+                const response = await fetch(`/api/schedules/${scheduleId}/logs/${logId}`);
+                if (!response.ok) throw new Error('獲取輸出失敗');
+                const log = await response.json();
+                output.textContent = log.output || '（沒有輸出）';
+            } catch (error) {
+                output.textContent = error.message;
+            }
+        },
+        willClose: () => {
+            if (source) source.close();
+        }
+    });
+}
+
 // 查看執行日誌
 async function viewLogs(scheduleId) {
     try {
@@ -1358,8 +1460,18 @@ async function viewLogs(scheduleId) {
                         </td>
                         <td>
                             <pre class="mb-0"><code>${escapeHtml(log.content)}</code></pre>
+                            ${log.status === 'active' || log.has_output ? `
+                                <button class="btn btn-sm btn-outline-secondary mt-1"
+                                        onclick="viewLogOutput(${scheduleId}, ${log.id}, '${log.status}')">
+                                    ${log.status === 'active' ? '即時輸出' : '查看輸出'}
+                                </button>` : ''}
+                        </td>
+                        <td>
+                            ${formatDuration(log.duration)}
+                            ${log.cpu_time != null ? `
+                                <div class="small text-muted">CPU ${log.cpu_time.toFixed(2)} 秒</div>
+                                <div class="small text-muted">記憶體 ${(log.peak_rss_kb / 1024).toFixed(1)} MB</div>` : ''}
                         </td>
-                        <td>${formatDuration(log.duration)}</td>
                         <td>${log.error_message ? `<pre class="text-danger mb-0"><code>${escapeHtml(log.error_message)}</code></pre>` : '-'}</td>
                     </tr>
                 `;
@@ -1634,7 +1746,7 @@ function startAutoUpdate(seconds) {
     if (seconds >= 5) {
         autoUpdateInterval = setInterval(() => {
             console.log('Auto update triggered');
-            loadScheduleList(true); // 添加 true 參數強制更新
+            loadScheduleList(true, true); // 只在列表有變更時重新繪製
         }, seconds * 1000);
         console.log('Auto update interval set');
     }
@@ -2244,6 +2356,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 移除原本的頁籤監聽，改為直接載入
     loadScheduleList();  // 直接載入排程列表
+    subscribeScheduleEvents();  // 排程變更時由伺服器推送通知
 
     // 檢查當前頁面是否在知識庫爬取頁面
     function isInCrawlerPage() {
@@ -331,32 +331,77 @@ document.addEventListener('DOMContentLoaded', function() {
                 // 記錄開始時間
                 const startTime = performance.now();
 
-                // 顯示載入中提示
-                const loadingAlert = Swal.fire({
-                    title: '處理中...',
-                    text: '正在生成腳本',
-                    allowOutsideClick: false,
-                    allowEscapeKey: false,
-                    showConfirmButton: false,
-                    didOpen: () => {
-                        Swal.showLoading();
-                    }
-                });
+                // 顯示載入中提示，模型產生的內容即時顯示在下方，並以串流方式接收產生中的腳本
+                const requestScript = async (useCache) => {
+                    Swal.fire({
+                        title: '處理中...',
+                        html: `
+                            <div>正在生成腳本</div>
+                            <pre id="script-stream-output" class="text-start mt-3" style="max-height: 50vh; overflow: auto; white-space: pre-wrap;"></pre>
+                        `,
+                        width: '80%',
+                        allowOutsideClick: false,
+                        allowEscapeKey: false,
+                        showConfirmButton: false,
+                        didOpen: () => {
+                            Swal.showLoading();
+                        }
+                    });
 
-                // 發送請求
-                const response = await fetch('/api/generate-script', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(formData)
-                });
+                    const response = await fetch('/api/generate-script', {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json'
+                        },
+                        body: JSON.stringify({ ...formData, stream: true, use_cache: useCache })
+                    });
 
-                const data = await response.json();
-                loadingAlert.close();
+                    let result = null;
+                    if (response.headers.get('Content-Type')?.startsWith('text/event-stream')) {
+                        const output = document.getElementById('script-stream-output');
+                        await readEventStream(response, (event, payload) => {
+                            if (event === 'token' && output) {
+                                output.textContent += payload.text;
+                                output.scrollTop = output.scrollHeight;
+                            } else if (event === 'done' || event === 'error') {
+                                result = payload;
+                            }
+                        });
+                    } else {
+                        result = await response.json();
+                    }
+                    Swal.close();
 
-                if (!data.success) {
-                    throw new Error(data.message || '生成腳本失敗');
+                    if (!result) {
+                        throw new Error('生成腳本失敗: 連線中斷');
+                    }
+                    if (!result.success) {
+                        throw new Error(result.message || '生成腳本失敗');
+                    }
+                    return result;
+                };
+
+                let data = await requestScript(true);
+
+                // 找到相似需求產生過的腳本時，讓使用者選擇使用或重新生成
+                if (data.cached === 'similar') {
+                    const choice = await Swal.fire({
+                        title: '找到相似的腳本',
+                        html: `
+                            <div class="text-start">
+                                <div><strong>先前的需求：</strong> ${escapeHtml(data.cached_prompt)}</div>
+                                <div><strong>相似度：</strong> ${(data.similarity * 100).toFixed(1)}%</div>
+                                <div><strong>生成時間：</strong> ${escapeHtml(data.cached_at)}</div>
+                            </div>
+                        `,
+                        icon: 'question',
+                        showCancelButton: true,
+                        confirmButtonText: '使用此腳本',
+                        cancelButtonText: '重新生成'
+                    });
+                    if (choice.dismiss === Swal.DismissReason.cancel) {
+                        data = await requestScript(false);
+                    }
                 }
 
                 // 計算實際執行時間
@@ -429,6 +474,53 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // 防止 XSS 攻擊的輔助函數
+    function escapeHtml(unsafe) {
+        return String(unsafe ?? '')
+            .replace(/&/g, "&amp;")
+            .replace(/</g, "&lt;")
+            .replace(/>/g, "&gt;")
+            .replace(/"/g, "&quot;")
+            .replace(/'/g, "&#039;");
+    }
+
+    // 讀取 Server-Sent Events 串流，逐一回呼每個事件
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+
+        const dispatch = block => {
+            let event = 'message';
+            const dataLines = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                dispatch(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+        }
+        if (buffer.trim()) {
+            dispatch(buffer);
+        }
+    }
+
     // 添加 copyToClipboard 函数
     async function copyToClipboard(text) {
         try {
@@ -60,7 +60,7 @@ $(function() {
             return;
         }
 
-        // 顯示載入中提示
+        // 顯示載入中提示，下方即時顯示腳本輸出
         const loadingSwal = Swal.fire({
             title: '執行中...',
             html: `
@@ -70,11 +70,16 @@ $(function() {
                     </div>
                     <div>正在執行腳本，請稍候...</div>
                 </div>
+                <pre id="script-live-output" class="text-start small bg-light p-2 mt-3 mb-0"
+                     style="max-height: 240px; overflow-y: auto; display: none;"></pre>
             `,
             allowOutsideClick: false,
             showConfirmButton: false
         });
 
+        const runId = createRunId();
+        const outputSource = streamScriptOutput(runId);
+
         // 發送 AJAX 請求
         $.ajax({
             url: '/api/execute-script',
@@ -82,8 +87,12 @@ $(function() {
             contentType: 'application/json',
             data: JSON.stringify({
                 script: script,
-                csv_name: csvName
+                csv_name: csvName,
+                run_id: runId
             }),
+            complete: function() {
+                if (outputSource) outputSource.close();
+            },
             success: function(data) {
                 loadingSwal.close();
                 $('#submit-button').prop('disabled', false);
@@ -143,6 +152,36 @@ $(function() {
         });
     }
 
+    function createRunId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID().replace(/-/g, '');
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    // 接收腳本執行中的 stdout / stderr，逐行附加到載入提示中
+    function streamScriptOutput(runId) {
+        if (typeof EventSource === 'undefined') return null;
+
+        const source = new EventSource(`/api/script-runs/${runId}/output`);
+        source.addEventListener('output', function(event) {
+            const output = document.getElementById('script-live-output');
+            if (!output) return;
+            const data = JSON.parse(event.data);
+            const line = document.createElement('div');
+            line.textContent = data.line;
+            if (data.stream === 'stderr') line.className = 'text-danger';
+            output.appendChild(line);
+            output.style.display = 'block';
+            output.scrollTop = output.scrollHeight;
+        });
+        // 斷線時 EventSource 會帶 Last-Event-ID 重連，從中斷處繼續；執行結束後關閉
+        source.addEventListener('end', function() {
+            source.close();
+        });
+        return source;
+    }
+
     function createDataTable(data, columns) {
         // 如果表格已存在，先銷毀它
         if (dataTable) {
@@ -60,12 +60,7 @@ function loadRecords() {
             tbody.innerHTML = '';
 
             data.records.forEach(record => {
-                const escapedScript = record.script
-                    .replace(/&/g, '&amp;')
-                    .replace(/</g, '&lt;')
-                    .replace(/>/g, '&gt;')
-                    .replace(/"/g, '&quot;')
-                    .replace(/'/g, '&#039;');
+                const prompt = escapeHTML(record.prompt_preview) + (record.prompt_truncated ? '…' : '');
 
                 tbody.innerHTML += `
                     <tr>
@@ -73,12 +68,12 @@ function loadRecords() {
                         <td class="text-truncate" style="max-width: 200px;">
                             <a href="${record.url}" target="_blank" title="${record.url}">${record.url}</a>
                         </td>
-                        <td class="text-truncate" style="max-width: 200px;" title="${record.prompt}">
-                            ${record.prompt}
+                        <td class="text-truncate" style="max-width: 200px;" title="${prompt}">
+                            ${prompt}
                         </td>
                         <td class="text-center">${Number(record.duration).toFixed(2)}秒</td>
                         <td class="text-center">
-                            <button class="btn btn-sm btn-primary view-script-btn" data-script="${escapedScript}">
+                            <button class="btn btn-sm btn-primary view-script-btn" data-id="${record.id}">
                                 <i class="fas fa-code me-1"></i>查看腳本
                             </button>
                         </td>
@@ -89,7 +84,7 @@ function loadRecords() {
             // 為所有查看腳本按鈕添加事件監聽器
             document.querySelectorAll('.view-script-btn').forEach(btn => {
                 btn.addEventListener('click', function() {
-                    viewScript(this.getAttribute('data-script'));
+                    viewScript(this.getAttribute('data-id'));
                 });
             });
         })
@@ -104,14 +99,28 @@ function loadRecords() {
         });
 }
 
-function viewScript(encodedScript) {
+function escapeHTML(text) {
+    return String(text ?? '')
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#039;');
+}
+
+// 列表只包含摘要，點擊時才載入完整腳本（伺服器以 ETag 回應，重複查看時不需重新傳輸）
+async function viewScript(recordId) {
     try {
-        const script = decodeHTMLEntities(encodedScript);
-        const row = event.target.closest('tr');
-        const timestamp = row.cells[0].textContent;
-        const url = row.cells[1].querySelector('a').href;
-        const prompt = row.cells[2].textContent;
-        const duration = row.cells[3].textContent;
+        const response = await fetch(`/api/script-records/${recordId}`);
+        if (!response.ok) {
+            throw new Error('載入腳本失敗');
+        }
+        const record = await response.json();
+        const script = escapeHTML(record.script);
+        const timestamp = formatDate(record.timestamp);
+        const url = record.url;
+        const prompt = escapeHTML(record.prompt);
+        const duration = `${Number(record.duration).toFixed(2)}秒`;
 
         const modalContent = `
             <div class="script-content">
@@ -240,12 +249,6 @@ function extractPythonCode(script) {
     return script.replace(/```python\n?|\n?```/g, '').trim();
 }
 
-function decodeHTMLEntities(text) {
-    const textarea = document.createElement('textarea');
-    textarea.innerHTML = text;
-    return textarea.value;
-}
-
 function formatDate(timestamp) {
     if (!timestamp) return '未提供';
     try {
@@ -426,8 +426,8 @@ document.addEventListener('DOMContentLoaded', function() {
 
             submitBtn.disabled = true;
 
-            // 发送请求
-            const response = await fetch('/api/scrape', {
+            // 以串流方式发送请求，资料一产生就显示
+            const response = await fetch('/api/scrape/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -444,78 +444,81 @@ document.addEventListener('DOMContentLoaded', function() {
                 })
             });
 
-            const result = await response.json();
-            
             if (!response.ok) {
-                // API 错误处理
-                let errorTitle = '錯誤';
-                let errorMessage = '發生錯誤，請稍後再試';
-                let errorIcon = 'error';
-                
-                if (result.error) {
-                    if (result.error.includes('API key not valid') || 
-                        result.error.includes('API_KEY_INVALID')) {
-                        errorTitle = 'API Key 錯誤';
-                        errorMessage = '您輸入的 API Key 無效，請檢查是否輸入正確';
-                        errorIcon = 'warning';
-                    } else if (result.error.includes('quota exceeded') || 
-                              result.error.includes('rate limit')) {
-                        errorTitle = 'API 配額超限';
-                        errorMessage = 'API 使用次數已達上限，請稍後再試';
-                        errorIcon = 'warning';
-                    } else {
-                        errorMessage = result.error;
+                const result = await response.json();
+                const errorMessage = await showScrapeError(result.error);
+                throw new Error(errorMessage);
+            }
+
+            const rows = [];
+            let doneEvent = null;
+            let errorEvent = null;
+            let renderPending = false;
+            const rowHasValue = row => Object.values(row).some(value => value);
+
+            // 合併同一畫面更新週期內收到的資料列，避免每筆都重繪表格
+            const scheduleRender = () => {
+                if (renderPending) return;
+                renderPending = true;
+                requestAnimationFrame(() => {
+                    renderPending = false;
+                    if (rows.some(rowHasValue)) {
+                        displayResults(rows);
+                        resultDiv.style.display = 'block';
                     }
-                }
-                
-                await Swal.fire({
-                    icon: errorIcon,
-                    title: errorTitle,
-                    text: errorMessage,
-                    confirmButtonText: '確定',
-                    confirmButtonColor: '#3085d6'
                 });
-                
+            };
+
+            await readEventStream(response, (event, payload) => {
+                if (event === 'progress') {
+                    const container = Swal.getHtmlContainer();
+                    if (container) {
+                        container.textContent = payload.message;
+                    }
+                } else if (event === 'row') {
+                    if (rows.length === 0) {
+                        // 第一笔资料到达时关闭处理中的提示
+                        Swal.close();
+                    }
+                    rows.push(payload);
+                    scheduleRender();
+                } else if (event === 'done') {
+                    doneEvent = payload;
+                } else if (event === 'error') {
+                    errorEvent = payload;
+                }
+            });
+
+            if (errorEvent || !doneEvent) {
+                const errorMessage = await showScrapeError(errorEvent ? errorEvent.error : '連線中斷，請稍後再試');
                 throw new Error(errorMessage);
             }
 
             // 关闭处理中的 SweetAlert2
             Swal.close();
             
-            if (result.success) {
-                // 检查是否有实际的资料内容
-                const hasData = Array.isArray(result.data) && result.data.length > 0 && 
-                              result.data.some(row => Object.values(row).some(value => value));
-                
-                if (hasData) {
-                    // 先显示成功消息
-                    await Swal.fire({
-                        icon: 'success',
-                        title: '爬取成功！',
-                        text: '資料已成功爬取完成',
-                        timer: 1500,
-                        showConfirmButton: false
-                    });
-                    
-                    // 等待消息显示完毕后再更新界面
-                    await new Promise(resolve => setTimeout(resolve, 1500));
-                    
-                    const downloadBtn = displayResults(result.data);
-                    downloadBtn.href = `static/downloads/${result.file_name}`;
-                    downloadBtn.style.display = 'inline-block';
-                    resultDiv.style.display = 'block';
-                } else {
-                    // 如果查无资料，使用 SweetAlert2 显示提示
-                    await Swal.fire({
-                        icon: 'info',
-                        title: '查無資料',
-                        text: '沒有找到符合條件的資料',
-                        confirmButtonText: '確定'
-                    });
-                    resultDiv.style.display = 'none';
-                }
+            if (rows.some(rowHasValue)) {
+                const downloadBtn = displayResults(rows);
+                downloadBtn.href = `static/downloads/${doneEvent.file_name}`;
+                downloadBtn.style.display = 'inline-block';
+                resultDiv.style.display = 'block';
+
+                Swal.fire({
+                    icon: 'success',
+                    title: '爬取成功！',
+                    text: `資料已成功爬取完成，共 ${rows.length} 筆`,
+                    timer: 1500,
+                    showConfirmButton: false
+                });
             } else {
-                showError(result.error || '爬取失敗，請稍後再試');
+                // 如果查无资料，使用 SweetAlert2 显示提示
+                await Swal.fire({
+                    icon: 'info',
+                    title: '查無資料',
+                    text: '沒有找到符合條件的資料',
+                    confirmButtonText: '確定'
+                });
+                resultDiv.style.display = 'none';
             }
         } catch (error) {
             console.error('Error:', error);
@@ -668,6 +671,76 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // 顯示爬取錯誤，回傳顯示的錯誤訊息
+    async function showScrapeError(error) {
+        let errorTitle = '錯誤';
+        let errorMessage = '發生錯誤，請稍後再試';
+        let errorIcon = 'error';
+        
+        if (error) {
+            if (error.includes('API key not valid') || 
+                error.includes('API_KEY_INVALID')) {
+                errorTitle = 'API Key 錯誤';
+                errorMessage = '您輸入的 API Key 無效，請檢查是否輸入正確';
+                errorIcon = 'warning';
+            } else if (error.includes('quota exceeded') || 
+                      error.includes('rate limit')) {
+                errorTitle = 'API 配額超限';
+                errorMessage = 'API 使用次數已達上限，請稍後再試';
+                errorIcon = 'warning';
+            } else {
+                errorMessage = error;
+            }
+        }
+        
+        await Swal.fire({
+            icon: errorIcon,
+            title: errorTitle,
+            text: errorMessage,
+            confirmButtonText: '確定',
+            confirmButtonColor: '#3085d6'
+        });
+        
+        return errorMessage;
+    }
+
+    // 讀取 Server-Sent Events 串流，逐一回呼每個事件
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+
+        const dispatch = block => {
+            let event = 'message';
+            const dataLines = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                dispatch(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+        }
+        if (buffer.trim()) {
+            dispatch(buffer);
+        }
+    }
+
     // 顯示錯誤訊息
     function showError(message) {
         Swal.fire({
@@ -1,10 +1,11 @@
 import requests
+import page_fetcher
 from bs4 import BeautifulSoup
 import json
 
 def crawl_blog_website(url):
     try:
-        response = requests.get(url)
+        response = page_fetcher.get(url)
         response.raise_for_status()  # Raise an exception for HTTP errors
     except requests.exceptions.RequestException as err:
         print("Error: ", err)
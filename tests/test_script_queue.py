@@ -0,0 +1,43 @@
+import threading
+import unittest
+
+from script_queue import ScriptRunQueue
+
+
+class ScriptRunQueueTest(unittest.TestCase):
+
+    def test_coalesced_submit_raises_priority(self):
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def runner(name):
+            if name == 'blocker':
+                started.set()
+                release.wait(5)
+            order.append(name)
+
+        run_queue = ScriptRunQueue(runner, max_workers=1)
+        try:
+            # 佔住唯一的工作執行緒，之後的執行都留在佇列中
+            run_queue.submit('blocker', ('blocker',))
+            self.assertTrue(started.wait(5))
+
+            other = run_queue.submit('other', ('other',), priority=10)
+            scheduled = run_queue.submit('schedule', ('scheduled',), priority=0)
+            manual = run_queue.submit('schedule', ('manual',), priority=100)
+            self.assertIs(scheduled, manual)
+
+            release.set()
+            manual.result(5)
+            other.result(5)
+        finally:
+            release.set()
+            run_queue.shutdown()
+
+        # 合併後以較高的優先順序與最新的 args 執行
+        self.assertEqual(order, ['blocker', 'manual', 'other'])
+
+
+if __name__ == '__main__':
+    unittest.main()